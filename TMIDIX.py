@@ -95,7 +95,7 @@ sys.stdout.buffer.write(my_midi)
 '''
     if len(opus) < 2:
         opus=[1000, [],]
-    tracks = copy.deepcopy(opus)
+    tracks = list(opus)
     ticks = int(tracks.pop(0))
     ntracks = len(tracks)
     if ntracks == 1:
@@ -136,7 +136,7 @@ my_opus = score2opus(my_score)
 '''
     if len(score) < 2:
         score=[1000, [],]
-    tracks = copy.deepcopy(score)
+    tracks = list(score)  # events are flat so only the re-timed ones are copied
     ticks = int(tracks.pop(0))
     opus_tracks = []
     for scoretrack in tracks:
@@ -157,9 +157,9 @@ my_opus = score2opus(my_score)
                    time2events[note_off_event[1]] = [note_off_event,]
                 continue
             if time2events.get(scoreevent[1]):
-               time2events[scoreevent[1]].append(scoreevent)
+               time2events[scoreevent[1]].append(list(scoreevent))
             else:
-               time2events[scoreevent[1]] = [scoreevent,]
+               time2events[scoreevent[1]] = [list(scoreevent),]
 
         sorted_times = []  # list of keys
         for k in time2events.keys():
@@ -237,7 +237,7 @@ see opus2midi() and score2opus().
     if len(opus) < 2:
         _clean_up_warnings()
         return [1000,[],]
-    tracks = copy.deepcopy(opus)  # couple of slices probably quicker...
+    tracks = list(opus)  # events are flat so only the re-timed ones are copied
     ticks = int(tracks.pop(0))
     score = [ticks,]
     for opus_track in tracks:
@@ -268,8 +268,9 @@ see opus2midi() and score2opus().
                 else:
                     chapitch2note_on_events[key] = [new_event,]
             else:
-                opus_event[1] = ticks_so_far
-                score_track.append(opus_event)
+                score_event = list(opus_event)
+                score_event[1] = ticks_so_far
+                score_track.append(score_event)
         # check for unterminated notes (Oisín) -- 5.2
         for chapitch in chapitch2note_on_events:
             note_on_events = chapitch2note_on_events[chapitch]
@@ -340,24 +341,36 @@ tick per millisecond
         if len(events_matrixes_channels) > 16:
           print('MIDI has', len(events_matrixes_channels), 'instruments!', len(events_matrixes_channels) - 16, 'instrument(s) will be removed!')
 
+      # First 15 instruments are mapped to channels 0-8 and 10-15 (9 is drums)
+      # Notes are remapped by their track-shifted channels and other channel events by their channels
+
+      notes_channels_map = {}
+      events_channels_map = {}
+
+      for i, c in enumerate(events_matrixes_channels[:15]):
+        notes_channels_map[c] = i if i < 9 else i+1
+        events_channels_map.setdefault(c % 16, i if i < 9 else i+1)
+
+      channels_events = ['patch_change', 'control_change', 'channel_after_touch', 'key_after_touch', 'pitch_wheel_change']
+
+      events_matrix2 = []
+
       for e in events_matrix1:
         if e[0] == 'note' and e[3] != 9:
-          if e[3] in events_matrixes_channels[:15]:
-            if events_matrixes_channels[:15].index(e[3]) < 9:
-              e[3] = events_matrixes_channels[:15].index(e[3])
-            else:
-              e[3] = events_matrixes_channels[:15].index(e[3])+1
+          if e[3] in notes_channels_map:
+            e[3] = notes_channels_map[e[3]]
           else:
-            events_matrix1.remove(e)
-        
-        if e[0] in ['patch_change', 'control_change', 'channel_after_touch', 'key_after_touch', 'pitch_wheel_change'] and e[2] != 9:
-          if e[2] in [e % 16 for e in events_matrixes_channels[:15]]:
-            if [e % 16 for e in events_matrixes_channels[:15]].index(e[2]) < 9:
-              e[2] = [e % 16 for e in events_matrixes_channels[:15]].index(e[2])
-            else:
-              e[2] = [e % 16 for e in events_matrixes_channels[:15]].index(e[2])+1
+            continue
+
+        elif e[0] in channels_events and e[2] != 9:
+          if e[2] in events_channels_map:
+            e[2] = events_channels_map[e[2]]
           else:
-            events_matrix1.remove(e)
+            continue
+
+        events_matrix2.append(e)
+
+      events_matrix1 = events_matrix2
     
     else:
       events_matrix1 = []
@@ -432,7 +445,7 @@ but it does make it easy to mix different scores together.
                 ms_per_old_tick = ticks2tempo[ticks_so_far] / (1000.0*old_tpq * desired_time_in_ms)
                 i_tempo_ticks += 1
                 event_delta_ticks -= delta_ticks
-            new_event = copy.deepcopy(old_event)  # now handle the new event
+            new_event = list(old_event)  # now handle the new event
             ms_so_far += (ms_per_old_tick * old_event[1] * desired_time_in_ms)
             new_event[1] = round(ms_so_far - previous_ms_so_far)
 
@@ -855,27 +868,37 @@ Bit eight (the high bit) is set on each byte except the last.
         integer >>= 7
     return ber
 
-def _unshift_ber_int(ba):
-    r'''Given a bytearray, returns a tuple of (the ber-integer at the
-start, and the remainder of the bytearray).
+def _read_ber_int(data, pos=0):
+    r'''Given a bytes-like object and an offset, returns a tuple of
+(the ber-integer at that offset, and the offset just past it).
+Unlike _unshift_ber_int() it never copies the rest of the data,
+so walking a whole track with it is linear in the track length.
 '''
-    if not len(ba):  # 6.7
+    end = len(data)
+    if pos >= end:
         _warn('_unshift_ber_int: no integer found')
-        return ((0, b""))
-    byte = ba[0]
-    ba = ba[1:]
+        return ((0, end))
     integer = 0
     while True:
+        byte = data[pos]
+        pos += 1
         integer += (byte & 0x7F)
         if not (byte & 0x80):
-            return ((integer, ba))
-        if not len(ba):
+            return ((integer, pos))
+        if pos >= end:
             _warn('_unshift_ber_int: no end-of-integer found')
-            return ((0, ba))
-        byte = ba[0]
-        ba = ba[1:]
+            return ((0, pos))
         integer <<= 7
 
+def _unshift_ber_int(ba):
+    r'''Given a bytearray, returns a tuple of (the ber-integer at the
+start, and the remainder of the bytearray).
+'''
+    if not len(ba):  # 6.7
+        _warn('_unshift_ber_int: no integer found')
+        return ((0, b""))
+    [integer, pos] = _read_ber_int(ba)
+    return ((integer, ba[pos:]))
 
 def _clean_up_warnings():  # 5.4
     # Call this before returning from any publicly callable function
@@ -951,7 +974,8 @@ The options:
   'event_callback' is a coderef
   'exclusive_event_callback' is a coderef
 '''
-    trackdata = bytearray(trackdata)
+    trackdata = memoryview(bytes(trackdata))
+    end = len(trackdata)
     if exclude == None:
         exclude = []
     if include == None:
@@ -961,12 +985,12 @@ The options:
     include = set(include)
     exclude = set(exclude)
 
-    # Pointer = 0;  not used here; we eat through the bytearray instead.
+    pos = 0  # Pointer; we walk a memoryview rather than eat through a bytearray.
     event_code = -1;  # used for running status
     event_count = 0;
     events = []
 
-    while (len(trackdata)):
+    while (pos < end):
         # loop while there's anything to analyze ...
         eot = False  # When True, the event registrar aborts this loop
         event_count += 1
@@ -975,17 +999,17 @@ The options:
         # E for events - we'll feed it to the event registrar at the end.
 
         # Slice off the delta time code, and analyze it
-        [time, trackdata] = _unshift_ber_int(trackdata)
+        [time, pos] = _read_ber_int(trackdata, pos)
 
         # Now let's see what we can make of the command
-        first_byte = trackdata[0] & 0xFF
-        trackdata = trackdata[1:]
+        first_byte = trackdata[pos] & 0xFF
+        pos += 1
         if (first_byte < 0xF0):  # It's a MIDI event
             if (first_byte & 0x80):
                 event_code = first_byte
             else:
                 # It wants running status; use last event_code value
-                trackdata.insert(0, first_byte)
+                pos -= 1
                 if (event_code == -1):
                     _warn("Running status not set; Aborting track.")
                     return []
@@ -996,11 +1020,11 @@ The options:
             if (command == 0xF6):  # 0-byte argument
                 pass
             elif (command == 0xC0 or command == 0xD0):  # 1-byte argument
-                parameter = trackdata[0]  # could be B
-                trackdata = trackdata[1:]
+                parameter = trackdata[pos]  # could be B
+                pos += 1
             else:  # 2-byte argument could be BB or 14-bit
-                parameter = (trackdata[0], trackdata[1])
-                trackdata = trackdata[2:]
+                parameter = (trackdata[pos], trackdata[pos + 1])
+                pos += 2
 
             #################################################################
             # MIDI events
@@ -1042,12 +1066,12 @@ The options:
             #    unpack("xCwa*", substr(trackdata, $Pointer, 6));
             # Pointer += 6 - len(remainder);
             #    # Move past JUST the length-encoded.
-            command = trackdata[0] & 0xFF
-            trackdata = trackdata[1:]
-            [length, trackdata] = _unshift_ber_int(trackdata)
+            command = trackdata[pos] & 0xFF
+            pos += 1
+            [length, pos] = _read_ber_int(trackdata, pos)
             if (command == 0x00):
                 if (length == 2):
-                    E = ['set_sequence_number', time, _twobytes2int(trackdata)]
+                    E = ['set_sequence_number', time, _twobytes2int(trackdata[pos:pos + 2])]
                 else:
                     _warn('set_sequence_number: length must be 2, not ' + str(length))
                     E = ['set_sequence_number', time, 0]
@@ -1057,7 +1081,7 @@ The options:
                 # text_str = trackdata[0:length].decode('ascii','ignore')
                 # text_str = trackdata[0:length].decode('ISO-8859-1')
                 # 6.4 take it in bytes; let the user get the right encoding.
-                text_data = bytes(trackdata[0:length])  # 6.4
+                text_data = bytes(trackdata[pos:pos + length])  # 6.4
                 # Defined text events
                 if (command == 0x01):
                     E = ['text_event', time, text_data]
@@ -1100,30 +1124,30 @@ The options:
                 if length != 3:
                     _warn('set_tempo event, but length=' + str(length))
                 E = ['set_tempo', time,
-                     struct.unpack(">I", b'\x00' + trackdata[0:3])[0]]
+                     struct.unpack(">I", b'\x00' + bytes(trackdata[pos:pos + 3]))[0]]
             elif (command == 0x54):
                 if length != 5:  # DTime, HR, MN, SE, FR, FF
                     _warn('smpte_offset event, but length=' + str(length))
-                E = ['smpte_offset', time] + list(struct.unpack(">BBBBB", trackdata[0:5]))
+                E = ['smpte_offset', time] + list(struct.unpack(">BBBBB", trackdata[pos:pos + 5]))
             elif (command == 0x58):
                 if length != 4:  # DTime, NN, DD, CC, BB
                     _warn('time_signature event, but length=' + str(length))
-                E = ['time_signature', time] + list(trackdata[0:4])
+                E = ['time_signature', time] + list(trackdata[pos:pos + 4])
             elif (command == 0x59):
                 if length != 2:  # DTime, SF(signed), MI
                     _warn('key_signature event, but length=' + str(length))
-                E = ['key_signature', time] + list(struct.unpack(">bB", trackdata[0:2]))
+                E = ['key_signature', time] + list(struct.unpack(">bB", trackdata[pos:pos + 2]))
             elif (command == 0x7F):  # 6.4
-                E = ['sequencer_specific', time, bytes(trackdata[0:length])]
+                E = ['sequencer_specific', time, bytes(trackdata[pos:pos + length])]
             else:
                 E = ['raw_meta_event', time, command,
-                     bytes(trackdata[0:length])]  # 6.0
+                     bytes(trackdata[pos:pos + length])]  # 6.0
                 # "[uninterpretable meta-event command of length length]"
                 # DTime, Command, Binary Data
                 # It's uninterpretable; record it as raw_data.
 
             # Pointer += length; #  Now move Pointer
-            trackdata = trackdata[length:]
+            pos += length
 
         ######################################################################
         elif (first_byte == 0xF0 or first_byte == 0xF7):
@@ -1138,14 +1162,14 @@ The options:
             # but the F7 (if there) is counted in the message's declared
             # length, so we don't have to think about it anyway.)
             # command = trackdata.pop(0)
-            [length, trackdata] = _unshift_ber_int(trackdata)
+            [length, pos] = _read_ber_int(trackdata, pos)
             if first_byte == 0xF0:
                 # 20091008 added ISO-8859-1 to get an 8-bit str
                 # 6.4 return bytes instead
-                E = ['sysex_f0', time, bytes(trackdata[0:length])]
+                E = ['sysex_f0', time, bytes(trackdata[pos:pos + length])]
             else:
-                E = ['sysex_f7', time, bytes(trackdata[0:length])]
-            trackdata = trackdata[length:]
+                E = ['sysex_f7', time, bytes(trackdata[pos:pos + length])]
+            pos += length
 
         ######################################################################
         # Now, the MIDI file spec says:
@@ -1164,13 +1188,13 @@ The options:
 
         elif (first_byte == 0xF2):  # DTime, Beats
             #  <song position msg> ::=     F2 <data pair>
-            E = ['song_position', time, _read_14_bit(trackdata[:2])]
-            trackdata = trackdata[2:]
+            E = ['song_position', time, _read_14_bit(trackdata[pos:pos + 2])]
+            pos += 2
 
         elif (first_byte == 0xF3):  # <song select msg> ::= F3 <data singlet>
             # E = ['song_select', time, struct.unpack('>B',trackdata.pop(0))[0]]
-            E = ['song_select', time, trackdata[0]]
-            trackdata = trackdata[1:]
+            E = ['song_select', time, trackdata[pos]]
+            pos += 1
             # DTime, Thing (what?! song number?  whatever ...)
 
         elif (first_byte == 0xF6):  # DTime
@@ -1201,8 +1225,8 @@ The options:
         elif first_byte > 0xF0:  # Some unknown F-series event
             # Here we only produce a one-byte piece of raw data.
             # E = ['raw_data', time, bytest(trackdata[0])]   # 6.4
-            E = ['raw_data', time, trackdata[0]]  # 6.4 6.7
-            trackdata = trackdata[1:]
+            E = ['raw_data', time, trackdata[pos]]  # 6.4 6.7
+            pos += 1
         else:  # Fallthru.
             _warn("Aborting track.  Command-byte first_byte=" + hex(first_byte))
             break
@@ -1252,7 +1276,7 @@ def _encode(events_lol, unknown_callback=None, never_add_eot=False,
     data = [] # what I'll store the chunks of byte-data in
 
     # This is so my end_track magic won't corrupt the original
-    events = copy.deepcopy(events_lol)
+    events = [list(event) for event in events_lol]
 
     if not never_add_eot:
         # One way or another, tack on an 'end_track'
@@ -1278,7 +1302,7 @@ def _encode(events_lol, unknown_callback=None, never_add_eot=False,
     last_status = -1
 
     for event_r in (events):
-        E = copy.deepcopy(event_r)
+        E = list(event_r)
         # otherwise the shifting'd corrupt the original
         if not E:
             continue
@@ -4190,13 +4214,13 @@ def advanced_score_processor(raw_score,
           return ['Check score for errors and compatibility!']
 
         else:
-          basic_single_track_score = copy.deepcopy(raw_score)
+          basic_single_track_score = [list(event) for event in raw_score]
       
       else:
         num_ticks = raw_score[0]
         while num_tracks < len(raw_score):
             for event in raw_score[num_tracks]:
-              ev = copy.deepcopy(event)
+              ev = list(event)
               basic_single_track_score.append(ev)
             num_tracks += 1
 
@@ -4648,6 +4672,17 @@ def ascii_text_words_counter(ascii_text):
 
 def check_and_fix_tones_chord(tones_chord, use_full_chords=True):
 
+  tones_chord_mask = tones_chord_to_mask(tones_chord)
+
+  # Sorted tones chords are fixed with a lookup table
+  if tones_chord and tones_chord == mask_to_tones_chord(tones_chord_mask):
+
+    if use_full_chords:
+      return mask_to_tones_chord(FIXED_TONES_CHORDS_MASKS_FULL[tones_chord_mask])
+
+    else:
+      return mask_to_tones_chord(FIXED_TONES_CHORDS_MASKS_SORTED[tones_chord_mask])
+
   tones_chord_combs = [list(comb) for i in range(len(tones_chord), 0, -1) for comb in combinations(tones_chord, i)]
 
   if use_full_chords:
@@ -8966,6 +9001,89 @@ ALL_CHORDS_FULL = [[0], [0, 3], [0, 3, 5], [0, 3, 5, 8], [0, 3, 5, 9], [0, 3, 5,
 
 ###################################################################################
 
+# Pitch-classes masks chords lookup tables
+# Bit t of a tones chord mask is set when tone t is in the chord
+
+def tones_chord_to_mask(tones_chord):
+
+  mask = 0
+
+  for t in tones_chord:
+    mask |= 1 << (t % 12)
+
+  return mask
+
+def mask_to_tones_chord(mask):
+  return [t for t in range(12) if (mask >> t) & 1]
+
+def rotate_tones_chord_mask(mask, shift):
+
+  shift %= 12
+
+  return ((mask << shift) | (mask >> (12 - shift))) & 0xFFF
+
+def fix_tones_chords_masks(chords):
+
+  # Mask -> mask of the chord which check_and_fix_tones_chord returns for it
+
+  chords_masks = set([tones_chord_to_mask(c) for c in chords])
+
+  fixed_masks = [0]
+
+  for mask in range(1, 4096):
+
+    tones_chord = mask_to_tones_chord(mask)
+
+    fixed_mask = -1
+
+    for i in range(len(tones_chord), 0, -1):
+      for comb in combinations(tones_chord, i):
+        if tones_chord_to_mask(comb) in chords_masks:
+          fixed_mask = tones_chord_to_mask(comb)
+          break
+
+      if fixed_mask != -1:
+        break
+
+    fixed_masks.append(fixed_mask)
+
+  return fixed_masks
+
+def chords_masks_idxs(chords, fixed_masks):
+
+  # Mask -> index of its fixed chord in chords
+
+  masks_idxs = {}
+
+  for i, c in enumerate(chords):
+    masks_idxs.setdefault(tones_chord_to_mask(c), i)
+
+  return [masks_idxs.get(m, -1) for m in fixed_masks]
+
+FIXED_TONES_CHORDS_MASKS_SORTED = fix_tones_chords_masks(ALL_CHORDS_SORTED)
+FIXED_TONES_CHORDS_MASKS_FULL = fix_tones_chords_masks(ALL_CHORDS_FULL)
+
+ALL_CHORDS_SORTED_MASKS_IDXS = chords_masks_idxs(ALL_CHORDS_SORTED, FIXED_TONES_CHORDS_MASKS_SORTED)
+ALL_CHORDS_FULL_MASKS_IDXS = chords_masks_idxs(ALL_CHORDS_FULL, FIXED_TONES_CHORDS_MASKS_FULL)
+
+# Mask -> ALL_CHORDS_SORTED chord token (-1 for the empty mask)
+# Chords which are not in ALL_CHORDS_SORTED are fixed with ALL_CHORDS_FULL
+# just like ALL_CHORDS_SORTED.index(check_and_fix_tones_chord(tones_chord)) + 128
+
+TONES_CHORDS_MASKS_TOKENS = [-1]
+
+for mask in range(1, 4096):
+
+  if FIXED_TONES_CHORDS_MASKS_SORTED[mask] == mask:
+    fixed_mask = mask
+
+  else:
+    fixed_mask = FIXED_TONES_CHORDS_MASKS_FULL[mask]
+
+  TONES_CHORDS_MASKS_TOKENS.append(ALL_CHORDS_SORTED_MASKS_IDXS[fixed_mask] + 128)
+
+###################################################################################
+
 def escore_notes_to_parsons_code(escore_notes,
                                  times_index=1,
                                  pitches_index=4,
@@ -12279,9 +12397,13 @@ def escore_notes_pitches_chords_signature(escore_notes,
     
     if use_full_chords:
         CHORDS = ALL_CHORDS_FULL
+        FIXED_CHORDS_MASKS = FIXED_TONES_CHORDS_MASKS_FULL
+        CHORDS_MASKS_IDXS = ALL_CHORDS_FULL_MASKS_IDXS
         
     else:
         CHORDS = ALL_CHORDS_SORTED
+        FIXED_CHORDS_MASKS = FIXED_TONES_CHORDS_MASKS_SORTED
+        CHORDS_MASKS_IDXS = ALL_CHORDS_SORTED_MASKS_IDXS
     
     max_patch = max(0, min(128, max_patch))
 
@@ -12308,13 +12430,11 @@ def escore_notes_pitches_chords_signature(escore_notes,
         
             if pitches:
               if len(pitches) > 1:
-                tones_chord = sorted(set([p % 12 for p in pitches]))
-                     
-                try:
-                    sig_token = CHORDS.index(tones_chord) + 128
-                except:
-                    checked_tones_chord = check_and_fix_tones_chord(tones_chord, use_full_chords=use_full_chords)
-                    sig_token = CHORDS.index(checked_tones_chord) + 128
+                tones_chord_mask = tones_chord_to_mask(pitches)
+
+                sig_token = CHORDS_MASKS_IDXS[tones_chord_mask] + 128
+
+                if FIXED_CHORDS_MASKS[tones_chord_mask] != tones_chord_mask:
                     bad_chords_counter += 1
                     
               elif len(pitches) == 1:
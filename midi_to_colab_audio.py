@@ -238,7 +238,7 @@ sys.stdout.buffer.write(my_midi)
 '''
     if len(opus) < 2:
         opus=[1000, [],]
-    tracks = copy.deepcopy(opus)
+    tracks = list(opus)
     ticks = int(tracks.pop(0))
     ntracks = len(tracks)
     if ntracks == 1:
@@ -279,7 +279,7 @@ my_opus = score2opus(my_score)
 '''
     if len(score) < 2:
         score=[1000, [],]
-    tracks = copy.deepcopy(score)
+    tracks = list(score)  # events are flat so only the re-timed ones are copied
     ticks = int(tracks.pop(0))
     opus_tracks = []
     for scoretrack in tracks:
@@ -300,9 +300,9 @@ my_opus = score2opus(my_score)
                    time2events[note_off_event[1]] = [note_off_event,]
                 continue
             if time2events.get(scoreevent[1]):
-               time2events[scoreevent[1]].append(scoreevent)
+               time2events[scoreevent[1]].append(list(scoreevent))
             else:
-               time2events[scoreevent[1]] = [scoreevent,]
+               time2events[scoreevent[1]] = [list(scoreevent),]
 
         sorted_times = []  # list of keys
         for k in time2events.keys():
@@ -378,7 +378,7 @@ see opus2midi() and score2opus().
     if len(opus) < 2:
         _clean_up_warnings()
         return [1000,[],]
-    tracks = copy.deepcopy(opus)  # couple of slices probably quicker...
+    tracks = list(opus)  # events are flat so only the re-timed ones are copied
     ticks = int(tracks.pop(0))
     score = [ticks,]
     for opus_track in tracks:
@@ -409,8 +409,9 @@ see opus2midi() and score2opus().
                 else:
                     chapitch2note_on_events[key] = [new_event,]
             else:
-                opus_event[1] = ticks_so_far
-                score_track.append(opus_event)
+                score_event = list(opus_event)
+                score_event[1] = ticks_so_far
+                score_track.append(score_event)
         # check for unterminated notes (Oisín) -- 5.2
         for chapitch in chapitch2note_on_events:
             note_on_events = chapitch2note_on_events[chapitch]
@@ -491,7 +492,7 @@ but it does make it easy to mix different scores together.
                 ms_per_old_tick = ticks2tempo[ticks_so_far] / (1000.0*old_tpq)
                 i_tempo_ticks += 1
                 event_delta_ticks -= delta_ticks
-            new_event = copy.deepcopy(old_event)  # now handle the new event
+            new_event = list(old_event)  # now handle the new event
             ms_so_far += (ms_per_old_tick * old_event[1])
             new_event[1] = round(ms_so_far - previous_ms_so_far)
             if old_event[0] != 'set_tempo':
@@ -1183,25 +1184,39 @@ Bit eight (the high bit) is set on each byte except the last.
         integer >>= 7
     return ber
 
-def _unshift_ber_int(ba):
-    r'''Given a bytearray, returns a tuple of (the ber-integer at the
-start, and the remainder of the bytearray).
+def _read_ber_int(data, pos=0):
+    r'''Given a bytes-like object and an offset, returns a tuple of
+(the ber-integer at that offset, and the offset just past it).
+Unlike _unshift_ber_int() it never copies the rest of the data,
+so walking a whole track with it is linear in the track length.
 '''
-    if not len(ba):   # 6.7
+    end = len(data)
+    if pos >= end:
         _warn('_unshift_ber_int: no integer found')
-        return ((0, b""))
-    byte = ba.pop(0)
+        return ((0, end))
     integer = 0
     while True:
+        byte = data[pos]
+        pos += 1
         integer += (byte & 0x7F)
         if not (byte & 0x80):
-            return ((integer, ba))
-        if not len(ba):
+            return ((integer, pos))
+        if pos >= end:
             _warn('_unshift_ber_int: no end-of-integer found')
-            return ((0, ba))
-        byte = ba.pop(0)
+            return ((0, pos))
         integer <<= 7
 
+def _unshift_ber_int(ba):
+    r'''Given a bytearray, returns a tuple of (the ber-integer at the
+start, and the remainder of the bytearray).
+'''
+    if not len(ba):   # 6.7
+        _warn('_unshift_ber_int: no integer found')
+        return ((0, b""))
+    [integer, pos] = _read_ber_int(ba)
+    del ba[:pos]
+    return ((integer, ba))
+
 def _clean_up_warnings():  # 5.4
     # Call this before returning from any publicly callable function
     # whenever there's a possibility that a warning might have been printed
@@ -1270,7 +1285,8 @@ The options:
   'event_callback' is a coderef
   'exclusive_event_callback' is a coderef
 '''
-    trackdata = bytearray(trackdata)
+    trackdata = memoryview(bytes(trackdata))
+    end = len(trackdata)
     if exclude == None:
         exclude = []
     if include == None:
@@ -1280,12 +1296,12 @@ The options:
     include = set(include)
     exclude = set(exclude)
 
-    # Pointer = 0;  not used here; we eat through the bytearray instead.
+    pos = 0  # Pointer; we walk a memoryview rather than eat through a bytearray.
     event_code = -1; # used for running status
     event_count = 0;
     events = []
 
-    while(len(trackdata)):
+    while (pos < end):
         # loop while there's anything to analyze ...
         eot = False   # When True, the event registrar aborts this loop
         event_count += 1
@@ -1294,17 +1310,18 @@ The options:
         # E for events - we'll feed it to the event registrar at the end.
 
         # Slice off the delta time code, and analyze it
-        [time, remainder] = _unshift_ber_int(trackdata)
+        [time, pos] = _read_ber_int(trackdata, pos)
 
         # Now let's see what we can make of the command
-        first_byte = trackdata.pop(0) & 0xFF
+        first_byte = trackdata[pos] & 0xFF
+        pos += 1
 
         if (first_byte < 0xF0):  # It's a MIDI event
             if (first_byte & 0x80):
                 event_code = first_byte
             else:
                 # It wants running status; use last event_code value
-                trackdata.insert(0, first_byte)
+                pos -= 1
                 if (event_code == -1):
                     _warn("Running status not set; Aborting track.")
                     return []
@@ -1315,9 +1332,11 @@ The options:
             if (command == 0xF6):  #  0-byte argument
                 pass
             elif (command == 0xC0 or command == 0xD0):  #  1-byte argument
-                parameter = trackdata.pop(0)  # could be B
+                parameter = trackdata[pos]  # could be B
+                pos += 1
             else: # 2-byte argument could be BB or 14-bit
-                parameter = (trackdata.pop(0), trackdata.pop(0))
+                parameter = (trackdata[pos], trackdata[pos + 1])
+                pos += 2
 
             #################################################################
             # MIDI events
@@ -1359,11 +1378,12 @@ The options:
             #    unpack("xCwa*", substr(trackdata, $Pointer, 6));
             #Pointer += 6 - len(remainder);
             #    # Move past JUST the length-encoded.
-            command = trackdata.pop(0) & 0xFF
-            [length, trackdata] = _unshift_ber_int(trackdata)
+            command = trackdata[pos] & 0xFF
+            pos += 1
+            [length, pos] = _read_ber_int(trackdata, pos)
             if (command      == 0x00):
                  if (length == 2):
-                     E = ['set_sequence_number',time,_twobytes2int(trackdata)]
+                     E = ['set_sequence_number',time,_twobytes2int(trackdata[pos:pos + 2])]
                  else:
                      _warn('set_sequence_number: length must be 2, not '+str(length))
                      E = ['set_sequence_number', time, 0]
@@ -1373,7 +1393,7 @@ The options:
                 # text_str = trackdata[0:length].decode('ascii','ignore')
                 # text_str = trackdata[0:length].decode('ISO-8859-1')
                 # 6.4 take it in bytes; let the user get the right encoding.
-                text_data = bytes(trackdata[0:length])   # 6.4
+                text_data = bytes(trackdata[pos:pos + length])   # 6.4
                 # Defined text events
                 if (command == 0x01):
                      E = ['text_event', time, text_data]
@@ -1416,30 +1436,30 @@ The options:
                  if length != 3:
                      _warn('set_tempo event, but length='+str(length))
                  E = ['set_tempo', time,
-                      struct.unpack(">I", b'\x00'+trackdata[0:3])[0]]
+                      struct.unpack(">I", b'\x00' + bytes(trackdata[pos:pos + 3]))[0]]
             elif (command == 0x54):
                  if length != 5:   # DTime, HR, MN, SE, FR, FF
                      _warn('smpte_offset event, but length='+str(length))
-                 E = ['smpte_offset',time] + list(struct.unpack(">BBBBB",trackdata[0:5]))
+                 E = ['smpte_offset',time] + list(struct.unpack(">BBBBB",trackdata[pos:pos + 5]))
             elif (command == 0x58):
                  if length != 4:   # DTime, NN, DD, CC, BB
                      _warn('time_signature event, but length='+str(length))
-                 E = ['time_signature', time]+list(trackdata[0:4])
+                 E = ['time_signature', time]+list(trackdata[pos:pos + 4])
             elif (command == 0x59):
                  if length != 2:   # DTime, SF(signed), MI
                      _warn('key_signature event, but length='+str(length))
-                 E = ['key_signature',time] + list(struct.unpack(">bB",trackdata[0:2]))
+                 E = ['key_signature',time] + list(struct.unpack(">bB",trackdata[pos:pos + 2]))
             elif (command == 0x7F):   # 6.4
-                 E = ['sequencer_specific',time, bytes(trackdata[0:length])]
+                 E = ['sequencer_specific',time, bytes(trackdata[pos:pos + length])]
             else:
                  E = ['raw_meta_event', time, command,
-                   bytes(trackdata[0:length])]   # 6.0
+                   bytes(trackdata[pos:pos + length])]   # 6.0
                  #"[uninterpretable meta-event command of length length]"
                  # DTime, Command, Binary Data
                  # It's uninterpretable; record it as raw_data.
 
             # Pointer += length; #  Now move Pointer
-            trackdata = trackdata[length:]
+            pos += length
 
         ######################################################################
         elif (first_byte == 0xF0 or first_byte == 0xF7):
@@ -1454,14 +1474,14 @@ The options:
             # but the F7 (if there) is counted in the message's declared
             # length, so we don't have to think about it anyway.)
             #command = trackdata.pop(0)
-            [length, trackdata] = _unshift_ber_int(trackdata)
+            [length, pos] = _read_ber_int(trackdata, pos)
             if first_byte == 0xF0:
                 # 20091008 added ISO-8859-1 to get an 8-bit str
                 # 6.4 return bytes instead
-                E = ['sysex_f0', time, bytes(trackdata[0:length])]
+                E = ['sysex_f0', time, bytes(trackdata[pos:pos + length])]
             else:
-                E = ['sysex_f7', time, bytes(trackdata[0:length])]
-            trackdata = trackdata[length:]
+                E = ['sysex_f7', time, bytes(trackdata[pos:pos + length])]
+            pos += length
 
         ######################################################################
         # Now, the MIDI file spec says:
@@ -1480,13 +1500,13 @@ The options:
         
         elif (first_byte == 0xF2):   # DTime, Beats
             #  <song position msg> ::=     F2 <data pair>
-            E = ['song_position', time, _read_14_bit(trackdata[:2])]
-            trackdata = trackdata[2:]
+            E = ['song_position', time, _read_14_bit(trackdata[pos:pos + 2])]
+            pos += 2
 
         elif (first_byte == 0xF3):   # <song select msg> ::= F3 <data singlet>
             # E = ['song_select', time, struct.unpack('>B',trackdata.pop(0))[0]]
-            E = ['song_select', time, trackdata[0]]
-            trackdata = trackdata[1:]
+            E = ['song_select', time, trackdata[pos]]
+            pos += 1
             # DTime, Thing (what?! song number?  whatever ...)
 
         elif (first_byte == 0xF6):   # DTime
@@ -1517,8 +1537,8 @@ The options:
         elif first_byte > 0xF0:  # Some unknown F-series event
             # Here we only produce a one-byte piece of raw data.
             # E = ['raw_data', time, bytest(trackdata[0])]   # 6.4
-            E = ['raw_data', time, trackdata[0]]   # 6.4 6.7
-            trackdata = trackdata[1:]
+            E = ['raw_data', time, trackdata[pos]]   # 6.4 6.7
+            pos += 1
         else:  # Fallthru.
             _warn("Aborting track.  Command-byte first_byte="+hex(first_byte))
             break
@@ -1569,7 +1589,7 @@ def _encode(events_lol, unknown_callback=None, never_add_eot=False,
     data = [] # what I'll store the chunks of byte-data in
 
     # This is so my end_track magic won't corrupt the original
-    events = copy.deepcopy(events_lol)
+    events = [list(event) for event in events_lol]
 
     if not never_add_eot:
         # One way or another, tack on an 'end_track'
@@ -1595,7 +1615,7 @@ def _encode(events_lol, unknown_callback=None, never_add_eot=False,
     last_status = -1
 
     for event_r in (events):
-        E = copy.deepcopy(event_r)
+        E = list(event_r)
         # otherwise the shifting'd corrupt the original
         if not E:
             continue
@@ -122,27 +122,37 @@ print('=' * 70)
 
 #@title Create Monster MIDI Dataset files list
 print('=' * 70)
-print('Creating dataset files list...')
 dataset_addr = "/content/Main-MIDI-Dataset/MIDIs"
+files_index_addr = "/content/Main-MIDI-Dataset/MIDIs_FILES_INDEX.pickle"
 
-# os.chdir(dataset_addr)
-filez = list()
-for (dirpath, dirnames, filenames) in os.walk(dataset_addr):
-    filez += [os.path.join(dirpath, file) for file in filenames]
+# MIDI file name (md5 hash) -> MIDI file path
+# Delete MIDIs_FILES_INDEX.pickle after updating the dataset MIDIs
 
-if filez == []:
-    print('Could not find any MIDI files. Please check Dataset dir...')
-    print('=' * 70)
+if os.path.exists(files_index_addr):
+  print('Loading dataset files index...')
+  LAMD_files_index = pickle.load(open(files_index_addr, 'rb'))
 
-print('=' * 70)
-print('Randomizing file list...')
-random.shuffle(filez)
-print('=' * 70)
+else:
+  print('Creating dataset files index...')
+
+  # os.chdir(dataset_addr)
+  filez = list()
+  for (dirpath, dirnames, filenames) in os.walk(dataset_addr):
+      filez += [os.path.join(dirpath, file) for file in filenames]
+
+  if filez == []:
+      print('Could not find any MIDI files. Please check Dataset dir...')
+      print('=' * 70)
+
+  LAMD_files_index = {}
 
-LAMD_files_list = []
+  for f in tqdm(filez):
+    LAMD_files_index[f.split('/')[-1].split('.mid')[0]] = f
 
-for f in tqdm(filez):
-  LAMD_files_list.append([f.split('/')[-1].split('.mid')[0], f])
+  if LAMD_files_index:
+    pickle.dump(LAMD_files_index, open(files_index_addr, 'wb'))
+
+print('=' * 70)
 print('Done!')
 print('=' * 70)
 
@@ -298,13 +308,7 @@ if filez:
 
               if pitches:
                 if len(pitches) > 1:
-                  tones_chord = sorted(set([p % 12 for p in pitches]))
-
-                  try:
-                      sig_token = TMIDIX.ALL_CHORDS_SORTED.index(tones_chord) + 128
-                  except:
-                      checked_tones_chord = TMIDIX.check_and_fix_tones_chord(tones_chord)
-                      sig_token = TMIDIX.ALL_CHORDS_SORTED.index(checked_tones_chord) + 128
+                  sig_token = TMIDIX.TONES_CHORDS_MASKS_TOKENS[TMIDIX.tones_chord_to_mask(pitches)]
 
                 elif len(pitches) == 1:
                   sig_token = pitches[0]
@@ -445,9 +449,7 @@ if filez:
             max_ratio_index = fr[1]
 
             ffn = signatures_file_names[fr[1]]
-            ffn_idx = [y[0] for y in LAMD_files_list].index(ffn)
-
-            ff = LAMD_files_list[ffn_idx][1]
+            ff = LAMD_files_index[ffn]
 
             #=======================================================
 
@@ -652,13 +654,7 @@ if filez:
 
               if pitches:
                 if len(pitches) > 1:
-                  tones_chord = sorted(set([p % 12 for p in pitches]))
-
-                  try:
-                      chord_token = TMIDIX.ALL_CHORDS_SORTED.index(tones_chord) + 128
-                  except:
-                      checked_tones_chord = TMIDIX.check_and_fix_tones_chord(tones_chord)
-                      chord_token = TMIDIX.ALL_CHORDS_SORTED.index(checked_tones_chord) + 128
+                  chord_token = TMIDIX.TONES_CHORDS_MASKS_TOKENS[TMIDIX.tones_chord_to_mask(pitches)]
 
                 elif len(pitches) == 1:
                   chord_token = pitches[0]
@@ -764,9 +760,7 @@ if filez:
             max_ratio_index = fr[1]
 
             ffn = kilo_chords_file_names[fr[1]]
-            ffn_idx = [y[0] for y in LAMD_files_list].index(ffn)
-
-            ff = LAMD_files_list[ffn_idx][1]
+            ff = LAMD_files_index[ffn]
 
             #=======================================================
 
@@ -71,6 +71,50 @@ r'''############################################################################
 #
 #   monster_search_and_filter.search_and_filter(sigs_dicts, X, global_union)
 #
+#   Low memory (CPU) use example
+#
+#   sX, global_union = monster_search_and_filter.precompute_sparse_signatures(sigs_dicts)
+#
+#   monster_search_and_filter.search_and_filter(sigs_dicts, sX, global_union)
+#
+#   Memory-mapped signatures store use example
+#
+#   monster_search_and_filter.convert_signatures_pickle(sigs_data_path)
+#
+#   sigs_store = monster_search_and_filter.load_signatures_store()
+#   sX, global_union = monster_search_and_filter.precompute_store_signatures(sigs_store)
+#
+#   monster_search_and_filter.search_and_filter(sigs_store, sX, global_union)
+#
+#   Streaming (laptop) use example
+#
+#   monster_search_and_filter.search_and_filter_streaming(sigs_store)
+#
+#   Signatures data (re)build from the command line
+#
+#   python monster_search_and_filter.py build_signatures ./Monster-MIDI-Dataset/MIDIs/
+#
+#   Inverted index use example
+#
+#   inv_index = monster_search_and_filter.precompute_inverted_index(sX, global_union)
+#
+#   monster_search_and_filter.search_and_filter(sigs_store, None, global_union, inverted_index=inv_index)
+#
+#   Approximate (IVF) search use example
+#
+#   ivf_index = monster_search_and_filter.precompute_ivf_index(X)
+#
+#   monster_search_and_filter.search_and_filter(sigs_dicts, X, global_union, ivf_index=ivf_index, nprobe=8)
+#
+#   Appendable signatures index use example
+#
+#   sigs_index = monster_search_and_filter.create_signatures_index(sigs_dicts, index_dir='./SIGNATURES_INDEX/')
+#
+#   monster_search_and_filter.append_signatures_index(sigs_index, new_sigs_dicts)
+#   monster_search_and_filter.delete_signatures_index(sigs_index, ['file_name_to_remove'])
+#
+#   monster_search_and_filter.search_and_filter(sigs_index, sigs_index, None)
+#
 ###################################################################################
 '''
 
@@ -119,7 +163,7 @@ my_opus = score2opus(my_score)
 '''
     if len(score) < 2:
         score=[1000, [],]
-    tracks = copy.deepcopy(score)
+    tracks = list(score)  # events are flat so only the re-timed ones are copied
     ticks = int(tracks.pop(0))
     opus_tracks = []
     for scoretrack in tracks:
@@ -140,9 +184,9 @@ my_opus = score2opus(my_score)
                    time2events[note_off_event[1]] = [note_off_event,]
                 continue
             if time2events.get(scoreevent[1]):
-               time2events[scoreevent[1]].append(scoreevent)
+               time2events[scoreevent[1]].append(list(scoreevent))
             else:
-               time2events[scoreevent[1]] = [scoreevent,]
+               time2events[scoreevent[1]] = [list(scoreevent),]
 
         sorted_times = []  # list of keys
         for k in time2events.keys():
@@ -214,7 +258,7 @@ see opus2midi() and score2opus().
     if len(opus) < 2:
         _clean_up_warnings()
         return [1000,[],]
-    tracks = copy.deepcopy(opus)  # couple of slices probably quicker...
+    tracks = list(opus)  # events are flat so only the re-timed ones are copied
     ticks = int(tracks.pop(0))
     score = [ticks,]
     for opus_track in tracks:
@@ -245,8 +289,9 @@ see opus2midi() and score2opus().
                 else:
                     chapitch2note_on_events[key] = [new_event,]
             else:
-                opus_event[1] = ticks_so_far
-                score_track.append(opus_event)
+                score_event = list(opus_event)
+                score_event[1] = ticks_so_far
+                score_track.append(score_event)
         # check for unterminated notes (Oisín) -- 5.2
         for chapitch in chapitch2note_on_events:
             note_on_events = chapitch2note_on_events[chapitch]
@@ -317,24 +362,36 @@ tick per millisecond
         if len(events_matrixes_channels) > 16:
           print('MIDI has', len(events_matrixes_channels), 'instruments!', len(events_matrixes_channels) - 16, 'instrument(s) will be removed!')
 
+      # First 15 instruments are mapped to channels 0-8 and 10-15 (9 is drums)
+      # Notes are remapped by their track-shifted channels and other channel events by their channels
+
+      notes_channels_map = {}
+      events_channels_map = {}
+
+      for i, c in enumerate(events_matrixes_channels[:15]):
+        notes_channels_map[c] = i if i < 9 else i+1
+        events_channels_map.setdefault(c % 16, i if i < 9 else i+1)
+
+      channels_events = ['patch_change', 'control_change', 'channel_after_touch', 'key_after_touch', 'pitch_wheel_change']
+
+      events_matrix2 = []
+
       for e in events_matrix1:
         if e[0] == 'note' and e[3] != 9:
-          if e[3] in events_matrixes_channels[:15]:
-            if events_matrixes_channels[:15].index(e[3]) < 9:
-              e[3] = events_matrixes_channels[:15].index(e[3])
-            else:
-              e[3] = events_matrixes_channels[:15].index(e[3])+1
+          if e[3] in notes_channels_map:
+            e[3] = notes_channels_map[e[3]]
           else:
-            events_matrix1.remove(e)
-        
-        if e[0] in ['patch_change', 'control_change', 'channel_after_touch', 'key_after_touch', 'pitch_wheel_change'] and e[2] != 9:
-          if e[2] in [e % 16 for e in events_matrixes_channels[:15]]:
-            if [e % 16 for e in events_matrixes_channels[:15]].index(e[2]) < 9:
-              e[2] = [e % 16 for e in events_matrixes_channels[:15]].index(e[2])
-            else:
-              e[2] = [e % 16 for e in events_matrixes_channels[:15]].index(e[2])+1
+            continue
+
+        elif e[0] in channels_events and e[2] != 9:
+          if e[2] in events_channels_map:
+            e[2] = events_channels_map[e[2]]
           else:
-            events_matrix1.remove(e)
+            continue
+
+        events_matrix2.append(e)
+
+      events_matrix1 = events_matrix2
     
     else:
       events_matrix1 = []
@@ -409,7 +466,7 @@ but it does make it easy to mix different scores together.
                 ms_per_old_tick = ticks2tempo[ticks_so_far] / (1000.0*old_tpq * desired_time_in_ms)
                 i_tempo_ticks += 1
                 event_delta_ticks -= delta_ticks
-            new_event = copy.deepcopy(old_event)  # now handle the new event
+            new_event = list(old_event)  # now handle the new event
             ms_so_far += (ms_per_old_tick * old_event[1] * desired_time_in_ms)
             new_event[1] = round(ms_so_far - previous_ms_so_far)
 
@@ -681,27 +738,37 @@ Bit eight (the high bit) is set on each byte except the last.
         integer >>= 7
     return ber
 
-def _unshift_ber_int(ba):
-    r'''Given a bytearray, returns a tuple of (the ber-integer at the
-start, and the remainder of the bytearray).
+def _read_ber_int(data, pos=0):
+    r'''Given a bytes-like object and an offset, returns a tuple of
+(the ber-integer at that offset, and the offset just past it).
+Unlike _unshift_ber_int() it never copies the rest of the data,
+so walking a whole track with it is linear in the track length.
 '''
-    if not len(ba):  # 6.7
+    end = len(data)
+    if pos >= end:
         _warn('_unshift_ber_int: no integer found')
-        return ((0, b""))
-    byte = ba[0]
-    ba = ba[1:]
+        return ((0, end))
     integer = 0
     while True:
+        byte = data[pos]
+        pos += 1
         integer += (byte & 0x7F)
         if not (byte & 0x80):
-            return ((integer, ba))
-        if not len(ba):
+            return ((integer, pos))
+        if pos >= end:
             _warn('_unshift_ber_int: no end-of-integer found')
-            return ((0, ba))
-        byte = ba[0]
-        ba = ba[1:]
+            return ((0, pos))
         integer <<= 7
 
+def _unshift_ber_int(ba):
+    r'''Given a bytearray, returns a tuple of (the ber-integer at the
+start, and the remainder of the bytearray).
+'''
+    if not len(ba):  # 6.7
+        _warn('_unshift_ber_int: no integer found')
+        return ((0, b""))
+    [integer, pos] = _read_ber_int(ba)
+    return ((integer, ba[pos:]))
 
 def _clean_up_warnings():  # 5.4
     # Call this before returning from any publicly callable function
@@ -777,7 +844,8 @@ The options:
   'event_callback' is a coderef
   'exclusive_event_callback' is a coderef
 '''
-    trackdata = bytearray(trackdata)
+    trackdata = memoryview(bytes(trackdata))
+    end = len(trackdata)
     if exclude == None:
         exclude = []
     if include == None:
@@ -787,12 +855,12 @@ The options:
     include = set(include)
     exclude = set(exclude)
 
-    # Pointer = 0;  not used here; we eat through the bytearray instead.
+    pos = 0  # Pointer; we walk a memoryview rather than eat through a bytearray.
     event_code = -1;  # used for running status
     event_count = 0;
     events = []
 
-    while (len(trackdata)):
+    while (pos < end):
         # loop while there's anything to analyze ...
         eot = False  # When True, the event registrar aborts this loop
         event_count += 1
@@ -801,17 +869,17 @@ The options:
         # E for events - we'll feed it to the event registrar at the end.
 
         # Slice off the delta time code, and analyze it
-        [time, trackdata] = _unshift_ber_int(trackdata)
+        [time, pos] = _read_ber_int(trackdata, pos)
 
         # Now let's see what we can make of the command
-        first_byte = trackdata[0] & 0xFF
-        trackdata = trackdata[1:]
+        first_byte = trackdata[pos] & 0xFF
+        pos += 1
         if (first_byte < 0xF0):  # It's a MIDI event
             if (first_byte & 0x80):
                 event_code = first_byte
             else:
                 # It wants running status; use last event_code value
-                trackdata.insert(0, first_byte)
+                pos -= 1
                 if (event_code == -1):
                     _warn("Running status not set; Aborting track.")
                     return []
@@ -822,11 +890,11 @@ The options:
             if (command == 0xF6):  # 0-byte argument
                 pass
             elif (command == 0xC0 or command == 0xD0):  # 1-byte argument
-                parameter = trackdata[0]  # could be B
-                trackdata = trackdata[1:]
+                parameter = trackdata[pos]  # could be B
+                pos += 1
             else:  # 2-byte argument could be BB or 14-bit
-                parameter = (trackdata[0], trackdata[1])
-                trackdata = trackdata[2:]
+                parameter = (trackdata[pos], trackdata[pos + 1])
+                pos += 2
 
             #################################################################
             # MIDI events
@@ -868,12 +936,12 @@ The options:
             #    unpack("xCwa*", substr(trackdata, $Pointer, 6));
             # Pointer += 6 - len(remainder);
             #    # Move past JUST the length-encoded.
-            command = trackdata[0] & 0xFF
-            trackdata = trackdata[1:]
-            [length, trackdata] = _unshift_ber_int(trackdata)
+            command = trackdata[pos] & 0xFF
+            pos += 1
+            [length, pos] = _read_ber_int(trackdata, pos)
             if (command == 0x00):
                 if (length == 2):
-                    E = ['set_sequence_number', time, _twobytes2int(trackdata)]
+                    E = ['set_sequence_number', time, _twobytes2int(trackdata[pos:pos + 2])]
                 else:
                     _warn('set_sequence_number: length must be 2, not ' + str(length))
                     E = ['set_sequence_number', time, 0]
@@ -883,7 +951,7 @@ The options:
                 # text_str = trackdata[0:length].decode('ascii','ignore')
                 # text_str = trackdata[0:length].decode('ISO-8859-1')
                 # 6.4 take it in bytes; let the user get the right encoding.
-                text_data = bytes(trackdata[0:length])  # 6.4
+                text_data = bytes(trackdata[pos:pos + length])  # 6.4
                 # Defined text events
                 if (command == 0x01):
                     E = ['text_event', time, text_data]
@@ -926,30 +994,30 @@ The options:
                 if length != 3:
                     _warn('set_tempo event, but length=' + str(length))
                 E = ['set_tempo', time,
-                     struct.unpack(">I", b'\x00' + trackdata[0:3])[0]]
+                     struct.unpack(">I", b'\x00' + bytes(trackdata[pos:pos + 3]))[0]]
             elif (command == 0x54):
                 if length != 5:  # DTime, HR, MN, SE, FR, FF
                     _warn('smpte_offset event, but length=' + str(length))
-                E = ['smpte_offset', time] + list(struct.unpack(">BBBBB", trackdata[0:5]))
+                E = ['smpte_offset', time] + list(struct.unpack(">BBBBB", trackdata[pos:pos + 5]))
             elif (command == 0x58):
                 if length != 4:  # DTime, NN, DD, CC, BB
                     _warn('time_signature event, but length=' + str(length))
-                E = ['time_signature', time] + list(trackdata[0:4])
+                E = ['time_signature', time] + list(trackdata[pos:pos + 4])
             elif (command == 0x59):
                 if length != 2:  # DTime, SF(signed), MI
                     _warn('key_signature event, but length=' + str(length))
-                E = ['key_signature', time] + list(struct.unpack(">bB", trackdata[0:2]))
+                E = ['key_signature', time] + list(struct.unpack(">bB", trackdata[pos:pos + 2]))
             elif (command == 0x7F):  # 6.4
-                E = ['sequencer_specific', time, bytes(trackdata[0:length])]
+                E = ['sequencer_specific', time, bytes(trackdata[pos:pos + length])]
             else:
                 E = ['raw_meta_event', time, command,
-                     bytes(trackdata[0:length])]  # 6.0
+                     bytes(trackdata[pos:pos + length])]  # 6.0
                 # "[uninterpretable meta-event command of length length]"
                 # DTime, Command, Binary Data
                 # It's uninterpretable; record it as raw_data.
 
             # Pointer += length; #  Now move Pointer
-            trackdata = trackdata[length:]
+            pos += length
 
         ######################################################################
         elif (first_byte == 0xF0 or first_byte == 0xF7):
@@ -964,14 +1032,14 @@ The options:
             # but the F7 (if there) is counted in the message's declared
             # length, so we don't have to think about it anyway.)
             # command = trackdata.pop(0)
-            [length, trackdata] = _unshift_ber_int(trackdata)
+            [length, pos] = _read_ber_int(trackdata, pos)
             if first_byte == 0xF0:
                 # 20091008 added ISO-8859-1 to get an 8-bit str
                 # 6.4 return bytes instead
-                E = ['sysex_f0', time, bytes(trackdata[0:length])]
+                E = ['sysex_f0', time, bytes(trackdata[pos:pos + length])]
             else:
-                E = ['sysex_f7', time, bytes(trackdata[0:length])]
-            trackdata = trackdata[length:]
+                E = ['sysex_f7', time, bytes(trackdata[pos:pos + length])]
+            pos += length
 
         ######################################################################
         # Now, the MIDI file spec says:
@@ -990,13 +1058,13 @@ The options:
 
         elif (first_byte == 0xF2):  # DTime, Beats
             #  <song position msg> ::=     F2 <data pair>
-            E = ['song_position', time, _read_14_bit(trackdata[:2])]
-            trackdata = trackdata[2:]
+            E = ['song_position', time, _read_14_bit(trackdata[pos:pos + 2])]
+            pos += 2
 
         elif (first_byte == 0xF3):  # <song select msg> ::= F3 <data singlet>
             # E = ['song_select', time, struct.unpack('>B',trackdata.pop(0))[0]]
-            E = ['song_select', time, trackdata[0]]
-            trackdata = trackdata[1:]
+            E = ['song_select', time, trackdata[pos]]
+            pos += 1
             # DTime, Thing (what?! song number?  whatever ...)
 
         elif (first_byte == 0xF6):  # DTime
@@ -1027,8 +1095,8 @@ The options:
         elif first_byte > 0xF0:  # Some unknown F-series event
             # Here we only produce a one-byte piece of raw data.
             # E = ['raw_data', time, bytest(trackdata[0])]   # 6.4
-            E = ['raw_data', time, trackdata[0]]  # 6.4 6.7
-            trackdata = trackdata[1:]
+            E = ['raw_data', time, trackdata[pos]]  # 6.4 6.7
+            pos += 1
         else:  # Fallthru.
             _warn("Aborting track.  Command-byte first_byte=" + hex(first_byte))
             break
@@ -1080,6 +1148,10 @@ import tqdm
 
 import multiprocessing
 
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
 from collections import Counter
 
 from itertools import combinations
@@ -1091,6 +1163,8 @@ import math
 
 from collections import defaultdict
 
+from collections import OrderedDict
+
 try:
     import cupy as np
     print('CuPy is found!')
@@ -1100,9 +1174,33 @@ except:
     import numpy as np
     print('Could not load CuPy!')
     print('Will use NumPy and CPU for processing!')
+
+import numpy
     
 import shutil
 
+import hashlib
+
+import time
+
+import tracemalloc
+
+import json
+
+import queue
+
+import threading
+
+from multiprocessing import shared_memory
+
+import urllib.parse
+
+import socket
+
+import socketserver
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 print('=' * 70)
 
 ###################################################################################
@@ -1242,8 +1340,171 @@ def create_files_list(datasets_paths=['./'],
 
 ###################################################################################
 
+def get_files_index_file(monster_dir):
+    return os.path.join(os.path.dirname(os.path.normpath(monster_dir)), 'MIDIs_FILES_INDEX.pickle')
+
+###################################################################################
+
+def get_files_index_path(files_index, monster_dir, fn):
+
+    # Path of the MIDI file name fn or None if there is no such MIDI
+    # MIDIs missing from the files index are looked up in the Monster MIDI
+    # dataset layout (monster_dir/fn[0]/fn.mid) and added to the index
+
+    if fn not in files_index:
+        rel_path = os.path.join(fn[0], fn+'.mid')
+
+        if not os.path.exists(os.path.join(monster_dir, rel_path)):
+            return None
+
+        files_index[fn] = rel_path
+
+    return os.path.join(monster_dir, files_index[fn])
+
+###################################################################################
+
+def create_files_index(monster_dir='./Monster-MIDI-Dataset/MIDIs/',
+                       files_index_file=None,
+                       rebuild_files_index=False,
+                       verbose=True
+                      ):
+
+    # Monster MIDI file name (MD5 hash) -> MIDI file path relative to monster_dir
+    # The index is saved next to the MIDIs dir and is re-used on the next runs
+    # MIDIs added later are found by get_files_index_path()
+
+    if files_index_file is None:
+        files_index_file = get_files_index_file(monster_dir)
+
+    if os.path.exists(files_index_file) and not rebuild_files_index:
+        return load_pickle(files_index_file, verbose=verbose)
+
+    filez = create_files_list([monster_dir], randomize_files_list=False, verbose=verbose)
+
+    files_index = {}
+
+    for f in filez:
+        files_index[os.path.splitext(os.path.basename(f))[0]] = os.path.relpath(f, monster_dir)
+
+    if files_index:
+        save_pickle(files_index, files_index_file, verbose=verbose)
+
+    return files_index
+
+###################################################################################
+
+def benchmark_midi_parsing(midi_files, number_of_runs=3):
+
+    # Seconds per stage of the MIDI parsing to ms score (midi2ms_score)
+    # over all midi_files (paths or bytes), best of number_of_runs runs
+
+    print('=' * 70)
+    print('Benchmarking MIDI parsing on', len(midi_files), 'MIDI files...')
+
+    midis_data = [open(f, 'rb').read() if type(f) == str else f for f in midi_files]
+
+    stages = ['midi2opus', 'to_millisecs', 'opus2score']
+
+    results = dict.fromkeys(stages, float('inf'))
+
+    for _ in range(number_of_runs):
+
+        times = dict.fromkeys(stages, 0.0)
+        number_of_events = 0
+
+        for midi_data in midis_data:
+
+            start_time = time.time()
+            opus = midi2opus(midi_data)
+            times['midi2opus'] += time.time() - start_time
+
+            start_time = time.time()
+            ms_opus = to_millisecs(opus)
+            times['to_millisecs'] += time.time() - start_time
+
+            start_time = time.time()
+            ms_score = opus2score(ms_opus)
+            times['opus2score'] += time.time() - start_time
+
+            number_of_events += sum(len(track) for track in ms_score[1:])
+
+        for stage in stages:
+            results[stage] = min(results[stage], times[stage])
+
+    results['total'] = sum(results[stage] for stage in stages)
+
+    for stage in stages:
+        print(stage, '|', round(results[stage], 3), 'sec')
+
+    print('Total:', round(results['total'], 3), 'sec |',
+          round(len(midis_data) / results['total'], 2), 'files per second |',
+          round(number_of_events / results['total']), 'score events per second')
+    print('=' * 70)
+
+    return results
+
+###################################################################################
+
+def benchmark_single_track_ms_score(midi_files, number_of_runs=3):
+
+    # Seconds of midi2single_track_ms_score per MIDI file (paths or bytes)
+    # without and with the channels recalculation, best of number_of_runs runs
+    # Large multi-track MIDIs show the cost of the channels recalculation
+
+    print('=' * 70)
+    print('Benchmarking single track ms score on', len(midi_files), 'MIDI files...')
+
+    results = []
+
+    for f in midi_files:
+
+        midi_data = open(f, 'rb').read() if type(f) == str else f
+
+        score = midi2score(midi_data)
+
+        number_of_tracks = len(score)-1
+        number_of_events = sum(len(track) for track in score[1:])
+
+        times = {}
+
+        for recalculate_channels in [False, True]:
+
+            times[recalculate_channels] = float('inf')
+
+            for _ in range(number_of_runs):
+                start_time = time.time()
+                midi2single_track_ms_score(midi_data, recalculate_channels=recalculate_channels)
+                times[recalculate_channels] = min(times[recalculate_channels], time.time() - start_time)
+
+        results.append({'tracks': number_of_tracks,
+                        'events': number_of_events,
+                        'time': times[False],
+                        'recalculate_channels_time': times[True]
+                        })
+
+        print('Tracks:', number_of_tracks, '| events:', number_of_events, '|',
+              round(times[False], 3), 'sec |',
+              round(times[True], 3), 'sec with recalculate_channels')
+
+    print('=' * 70)
+
+    return results
+
+###################################################################################
+
 def check_and_fix_tones_chord(tones_chord, use_full_chords=True):
 
+  tones_chord_mask = tones_chord_to_mask(tones_chord)
+
+  # Sorted tones chords are fixed with a lookup table
+  if tones_chord and tones_chord == mask_to_tones_chord(tones_chord_mask):
+
+    if use_full_chords:
+      return mask_to_tones_chord(FIXED_TONES_CHORDS_MASKS_FULL[tones_chord_mask])
+
+    else:
+      return mask_to_tones_chord(FIXED_TONES_CHORDS_MASKS_SORTED[tones_chord_mask])
+
   tones_chord_combs = [list(comb) for i in range(len(tones_chord), 0, -1) for comb in combinations(tones_chord, i)]
 
   if use_full_chords:
@@ -1261,6 +1522,99 @@ def check_and_fix_tones_chord(tones_chord, use_full_chords=True):
 
 ###################################################################################
 
+# Pitch-classes masks chords lookup tables
+# Bit t of a tones chord mask is set when tone t is in the chord
+
+def tones_chord_to_mask(tones_chord):
+
+  mask = 0
+
+  for t in tones_chord:
+    mask |= 1 << (t % 12)
+
+  return mask
+
+###################################################################################
+
+def mask_to_tones_chord(mask):
+  return [t for t in range(12) if (mask >> t) & 1]
+
+###################################################################################
+
+def rotate_tones_chord_mask(mask, shift):
+
+  shift %= 12
+
+  return ((mask << shift) | (mask >> (12 - shift))) & 0xFFF
+
+###################################################################################
+
+def fix_tones_chords_masks(chords):
+
+  # Mask -> mask of the chord which check_and_fix_tones_chord returns for it
+
+  chords_masks = set([tones_chord_to_mask(c) for c in chords])
+
+  fixed_masks = [0]
+
+  for mask in range(1, 4096):
+
+    tones_chord = mask_to_tones_chord(mask)
+
+    fixed_mask = -1
+
+    for i in range(len(tones_chord), 0, -1):
+      for comb in combinations(tones_chord, i):
+        if tones_chord_to_mask(comb) in chords_masks:
+          fixed_mask = tones_chord_to_mask(comb)
+          break
+
+      if fixed_mask != -1:
+        break
+
+    fixed_masks.append(fixed_mask)
+
+  return fixed_masks
+
+###################################################################################
+
+def chords_masks_idxs(chords, fixed_masks):
+
+  # Mask -> index of its fixed chord in chords
+
+  masks_idxs = {}
+
+  for i, c in enumerate(chords):
+    masks_idxs.setdefault(tones_chord_to_mask(c), i)
+
+  return [masks_idxs.get(m, -1) for m in fixed_masks]
+
+###################################################################################
+
+FIXED_TONES_CHORDS_MASKS_SORTED = fix_tones_chords_masks(ALL_CHORDS_SORTED)
+FIXED_TONES_CHORDS_MASKS_FULL = fix_tones_chords_masks(ALL_CHORDS_FULL)
+
+ALL_CHORDS_SORTED_MASKS_IDXS = chords_masks_idxs(ALL_CHORDS_SORTED, FIXED_TONES_CHORDS_MASKS_SORTED)
+ALL_CHORDS_FULL_MASKS_IDXS = chords_masks_idxs(ALL_CHORDS_FULL, FIXED_TONES_CHORDS_MASKS_FULL)
+
+# Mask -> ALL_CHORDS_SORTED chord token (-1 for the empty mask)
+# Chords which are not in ALL_CHORDS_SORTED are fixed with ALL_CHORDS_FULL
+# just like ALL_CHORDS_SORTED.index(check_and_fix_tones_chord(tones_chord)) + 128
+
+TONES_CHORDS_MASKS_TOKENS = [-1]
+
+for mask in range(1, 4096):
+
+  if FIXED_TONES_CHORDS_MASKS_SORTED[mask] == mask:
+    fixed_mask = mask
+
+  else:
+    fixed_mask = FIXED_TONES_CHORDS_MASKS_FULL[mask]
+
+  TONES_CHORDS_MASKS_TOKENS.append(ALL_CHORDS_SORTED_MASKS_IDXS[fixed_mask] + 128)
+
+###################################################################################
+
 def chordify_score(score,
                   return_choridfied_score=True,
                   return_detected_score_information=False
@@ -1487,13 +1841,13 @@ def advanced_score_processor(raw_score,
           return ['Check score for errors and compatibility!']
 
         else:
-          basic_single_track_score = copy.deepcopy(raw_score)
+          basic_single_track_score = [list(event) for event in raw_score]
       
       else:
         num_ticks = raw_score[0]
         while num_tracks < len(raw_score):
             for event in raw_score[num_tracks]:
-              ev = copy.deepcopy(event)
+              ev = list(event)
               basic_single_track_score.append(ev)
             num_tracks += 1
 
@@ -1700,6 +2054,196 @@ def advanced_score_processor(raw_score,
 
 ###################################################################################
 
+# Array-native versions of advanced_score_processor(), augment_enhanced_score_notes()
+# and chordify_score() for the enhanced score notes
+# ['note', time, dur, chan, pitch, vel, patch] as structured int32 arrays
+
+ENHANCED_SCORE_NOTES_DTYPE = numpy.dtype([('time', numpy.int32),
+                                          ('dur', numpy.int32),
+                                          ('chan', numpy.int32),
+                                          ('pitch', numpy.int32),
+                                          ('vel', numpy.int32),
+                                          ('patch', numpy.int32)
+                                          ])
+
+###################################################################################
+
+def enhanced_score_notes_to_array(enhanced_score_notes):
+    return numpy.array([tuple(e[1:7]) for e in enhanced_score_notes], dtype=ENHANCED_SCORE_NOTES_DTYPE)
+
+###################################################################################
+
+def array_to_enhanced_score_notes(notes_array):
+    return [['note'] + list(e) for e in notes_array.tolist()]
+
+###################################################################################
+
+def advanced_score_processor_array(raw_score, patches_to_analyze=list(range(129))):
+
+    # Same as advanced_score_processor(raw_score, return_enhanced_score_notes=True)[0]
+    # but returns a (possibly empty) ENHANCED_SCORE_NOTES_DTYPE array
+
+    if not raw_score or type(raw_score) != list:
+        return numpy.zeros(0, dtype=ENHANCED_SCORE_NOTES_DTYPE)
+
+    if type(raw_score[0]) != int:
+        if len(raw_score[0]) < 5 and type(raw_score[0][0]) != str:
+            return numpy.zeros(0, dtype=ENHANCED_SCORE_NOTES_DTYPE)
+
+        events = raw_score
+
+    else:
+        events = [event for track in raw_score[1:] for event in track]
+
+    # Columns: event kind (0 - note, 1 - patch change, 2 - other), time, dur, chan, pitch, vel
+    # and event[3:5] values which are compared for duplicate notes (-1 if not comparable)
+
+    rows = []
+
+    for e in events:
+        if e[0] == 'note':
+            rows.append((0, e[1], e[2], e[3], e[4], e[5], e[3], e[4]))
+
+        elif e[0] == 'patch_change':
+            rows.append((1, e[1], 0, e[2], e[3], 0, -1, -1))
+
+        elif len(e) > 4 and type(e[3]) == int and type(e[4]) == int:
+            rows.append((2, e[1], 0, -1, -1, 0, e[3], e[4]))
+
+        else:
+            rows.append((2, e[1], 0, -1, -1, 0, -1, -1))
+
+    arr = numpy.array(rows, dtype=numpy.int64).reshape(-1, 8)
+
+    kinds, times = arr[:, 0], arr[:, 1]
+
+    # Sorting by start-time and reverse pitch (other events first)
+    pitch_keys = numpy.where(kinds == 0, arr[:, 4], 128)
+
+    arr = arr[numpy.lexsort((-pitch_keys, times))]
+
+    kinds, times, chans, pitches = arr[:, 0], arr[:, 1], arr[:, 3], arr[:, 4]
+
+    # Notes get the last preceding patch change on their channel
+    patches = numpy.zeros(arr.shape[0], dtype=numpy.int64)
+
+    positions = numpy.arange(arr.shape[0])
+
+    for chan in range(16):
+        pc_positions = positions[(kinds == 1) & (chans == chan)]
+        notes_positions = positions[(kinds == 0) & (chans == chan)]
+
+        if pc_positions.shape[0] == 0:
+            continue
+
+        pc_idxs = numpy.searchsorted(pc_positions, notes_positions) - 1
+
+        patches[notes_positions] = numpy.where(pc_idxs >= 0, pitches[pc_positions[pc_idxs]], 0)
+
+    patches[(kinds == 0) & (chans == 9)] = 128
+
+    # Notes repeating the previous event time and [chan, pitch] are dropped
+    dups = numpy.zeros(arr.shape[0], dtype=bool)
+
+    dups[1:] = (kinds[1:] == 0) & (times[1:] == times[:-1]) & (arr[1:, 6] == arr[:-1, 6]) & (arr[1:, 7] == arr[:-1, 7])
+
+    keep = numpy.nonzero(~dups)[0]
+
+    # Sorting by patch, reverse pitch and start-time
+    patch_keys = numpy.where(kinds == 0, patches, -1)[keep]
+    pitch_keys = numpy.where(kinds == 0, pitches, 128)[keep]
+
+    keep = keep[numpy.lexsort((patch_keys, -pitch_keys, times[keep]))]
+
+    keep = keep[(kinds[keep] == 0) & numpy.isin(patches[keep], patches_to_analyze)]
+
+    notes_array = numpy.zeros(keep.shape[0], dtype=ENHANCED_SCORE_NOTES_DTYPE)
+
+    notes_array['time'] = times[keep]
+    notes_array['dur'] = arr[keep, 2]
+    notes_array['chan'] = chans[keep]
+    notes_array['pitch'] = pitches[keep]
+    notes_array['vel'] = arr[keep, 5]
+    notes_array['patch'] = patches[keep]
+
+    return notes_array
+
+###################################################################################
+
+def augment_enhanced_score_notes_array(notes_array,
+                                        timings_divider=16,
+                                        full_sorting=True,
+                                        timings_shift=0,
+                                        pitch_shift=0,
+                                        ceil_timings=False,
+                                        round_timings=False,
+                                        legacy_timings=True,
+                                        sort_drums_last=False
+                                      ):
+
+    esn = notes_array.copy()
+
+    if esn.shape[0] == 0:
+        return esn
+
+    if round_timings:
+        round_func = numpy.round
+
+    elif ceil_timings:
+        round_func = numpy.ceil
+
+    else:
+        round_func = numpy.trunc
+
+    times = notes_array['time'] / timings_divider
+
+    if legacy_timings:
+        abs_times = numpy.trunc(times).astype(numpy.int64) + timings_shift
+
+    else:
+        dtimes = numpy.zeros(times.shape[0], dtype=numpy.int64)
+        dtimes[1:] = round_func(times[1:] - times[:-1])
+
+        abs_times = max(0, int(times[0])) + numpy.cumsum(dtimes)
+
+    esn['time'] = numpy.maximum(0, abs_times + timings_shift)
+
+    esn['dur'] = numpy.maximum(1, round_func(notes_array['dur'] / timings_divider)).astype(numpy.int64) + timings_shift
+
+    esn['pitch'] = numpy.clip(notes_array['pitch'] + pitch_shift, 1, 127)
+
+    if full_sorting:
+
+        # Sorting by patch, reverse pitch and start-time
+        esn = esn[numpy.lexsort((esn['patch'], -esn['pitch'], esn['time']))]
+
+    if sort_drums_last:
+        drums = esn['patch'] == 128
+
+        esn = esn[numpy.lexsort((numpy.where(drums, -esn['pitch'], esn['patch']),
+                                 numpy.where(drums, 128, -esn['pitch']),
+                                 esn['time']
+                                 ))]
+
+    return esn
+
+###################################################################################
+
+def chordify_score_array(notes_array):
+
+    # List of notes_array chords (notes with the same start-time) sorted by start-time
+
+    notes_array = notes_array[numpy.argsort(notes_array['time'], kind='stable')]
+
+    starts = numpy.unique(notes_array['time'], return_index=True)[1]
+
+    if notes_array.shape[0] == 0:
+        return []
+
+    return numpy.split(notes_array, starts[1:])
+
+###################################################################################
+
 def load_signatures(signatures_data, convert_counts_to_ratios=True, omit_drums=True):
 
     sigs_dicts = []
@@ -1756,35 +2300,95 @@ def get_distance_np(sig_dict1, sig_dict2, mismatch_penalty=10, p=3):
     freq2 = np.array([sig_dict2.get(k, 0) for k in keys], dtype=float)
     
     mask = (freq1 > 0) & (freq2 > 0)
+
+    # Ratios of the missing keys are never used
+    safe_min = np.where(mask, np.minimum(freq1, freq2), 1.0)
     
     diff = np.where(mask,
-                    (np.maximum(freq1, freq2) / np.minimum(freq1, freq2)) - 1.0,
+                    (np.maximum(freq1, freq2) / safe_min) - 1.0,
                     mismatch_penalty)
+
+    union_mask = (freq1 > 0) | (freq2 > 0)
     
-    sum_term = np.sum((diff ** p) * union_mask, axis=1)
+    sum_term = np.sum((diff ** p) * union_mask)
     
     return np.cbrt(sum_term) if p == 3 else np.power(sum_term, 1.0 / p)
 
 ###################################################################################
 
-def counter_to_vector(counter, union_keys):
+# Signatures precision modes
+#
+# float64 and float32 are plain values, float16 halves the memory of float32
+# uint16 are counts ratios quantized to 1/65535 steps (ratios signatures only)
+# The distances only use values ratios so quantized values need no rescaling
+
+SIGNATURES_DTYPES = ['float64', 'float32', 'float16', 'uint16']
+
+SIGNATURES_UINT16_SCALE = 65535
+
+###################################################################################
+
+def quantize_signature_values(values):
+
+    if values.shape[0] and float(values.max()) > 1:
+        raise ValueError('uint16 signatures precision needs counts ratios signatures (convert_counts_to_ratios=True)')
+
+    xp = get_array_module(values)
+
+    # Non-zero ratios never quantize to zero (absent key)
+    return xp.clip(xp.rint(values * SIGNATURES_UINT16_SCALE), 1, SIGNATURES_UINT16_SCALE)
+
+###################################################################################
+
+def signatures_compute_dtype(dtype):
+
+    # float16 and uint16 signatures are computed in float32 (diff ** p overflows float16)
+    return numpy.float64 if numpy.dtype(dtype) == numpy.float64 else numpy.float32
+
+###################################################################################
+
+def counter_to_vector(counter, union_keys, dtype=float):
+
+    xp = get_array_module(union_keys)
+
+    vec = xp.zeros(union_keys.shape, dtype=dtype)
 
-    vec = np.zeros(union_keys.shape, dtype=float)
-    keys   = np.array(list(counter.keys()))
-    values = np.array(list(counter.values()), dtype=float)
-    indices = np.searchsorted(union_keys, keys)
+    if not counter:
+        return vec
+
+    keys   = xp.array(list(counter.keys()))
+    values = xp.array(list(counter.values()), dtype=float)
+
+    if xp.dtype(dtype) == xp.uint16:
+        values = quantize_signature_values(values)
+
+    indices = xp.searchsorted(union_keys, keys)
     vec[indices] = values
     
     return vec
 
 ###################################################################################
 
-def precompute_signatures(signatures_dictionaries):
+def counters_to_matrix(counters, union_keys, dtype='float32'):
+
+    # Rows are written in place so there is no float64 copy of the matrix
+    X = np.zeros((len(counters), union_keys.shape[0]), dtype=dtype)
+
+    for i, counter in enumerate(counters):
+        X[i] = counter_to_vector(counter, union_keys, dtype=dtype)
+
+    return X
+
+###################################################################################
+
+def precompute_signatures(signatures_dictionaries, dtype='float32'):
+
+    # dtype is one of SIGNATURES_DTYPES
 
     all_counters = [sig[1] for sig in signatures_dictionaries]
     global_union = np.array(sorted({key for counter in all_counters for key in counter.keys()}))
-    
-    X = np.stack([counter_to_vector(sig[1], global_union) for sig in signatures_dictionaries])
+
+    X = counters_to_matrix(all_counters, global_union, dtype=dtype)
 
     return X, global_union
 
@@ -1794,234 +2398,3338 @@ def get_distances_np(trg_signature_dictionary,
                     X,
                     global_union,
                     mismatch_penalty=10,
-                    p=3
+                    p=3,
+                    X_counts=None,
+                    tile_size=16384
                     ):
 
-    target_vec = counter_to_vector(trg_signature_dictionary, global_union)
-    
-    mask_both = (X > 0) & (target_vec > 0)
-    
-    diff = np.where(mask_both,
-                    (np.maximum(X, target_vec) / np.minimum(X, target_vec)) - 1.0,
-                    mismatch_penalty)
-    
-    union_mask = (X > 0) | (target_vec > 0)
-    
-    sum_term = np.sum((diff ** p) * union_mask, axis=1)
+    # X is scanned in tiles of tile_size rows with the fused tile kernel
+    # so no N x K temporaries are created
+
+    compute_dtype = signatures_compute_dtype(X.dtype)
+
+    trg_signature_dictionary, unknown_keys = drop_unknown_signature_keys(trg_signature_dictionary, global_union)
+
+    target_vec = counter_to_vector(trg_signature_dictionary, global_union, dtype=X.dtype).astype(compute_dtype)
+
+    cols = np.nonzero(target_vec > 0)[0]
+    trg_values = target_vec[cols]
+
+    penalty = float(mismatch_penalty) ** p
+
+    # Target keys which are in no X row are mismatches for all rows
+    sum_term = np.full(X.shape[0], unknown_keys * penalty)
+
+    for sidx in range(0, X.shape[0], tile_size):
+
+        eidx = min(sidx+tile_size, X.shape[0])
+
+        if X_counts is None:
+            tile_counts = precompute_signatures_counts(X[sidx:eidx])
+
+        else:
+            tile_counts = X_counts[sidx:eidx]
+
+        sum_term[sidx:eidx] += get_tile_sum_terms(X[sidx:eidx], cols, trg_values, tile_counts, penalty, p)
     
     return np.cbrt(sum_term) if p == 3 else np.power(sum_term, 1.0 / p)
 
 ###################################################################################
 
-def get_MIDI_signature(path_to_MIDI_file,
-                       transpose_factor=0,
-                       convert_counts_to_ratios=True,
-                       omit_drums=True
-                      ):
+def precompute_signatures_counts(X):
+    return get_array_module(X).count_nonzero(X > 0, axis=1)
 
-    try:
-    
-        raw_score = midi2single_track_ms_score(path_to_MIDI_file)
-        
-        escore = advanced_score_processor(raw_score, return_enhanced_score_notes=True)[0]
-        
-        escore = augment_enhanced_score_notes(escore)
-        
-        drums_offset = len(ALL_CHORDS_SORTED) + 128
-    
-        transpose_factor = max(0, min(6, transpose_factor))
-    
-        if transpose_factor > 0:
-            
-            sidx = -transpose_factor
-            eidx = transpose_factor
-    
-        else:
-            sidx = 0
-            eidx = 1
-    
-        src_sigs = []
-        
-        for i in range(sidx, eidx):
-        
-            escore_copy = copy.deepcopy(escore)
-            
-            for e in escore_copy:
-                e[4] += i
-            
-            cscore = chordify_score([1000, escore_copy])
-            
-            sig = []
-            dsig = []
-            
-            for c in cscore:
-                
-              all_pitches = [e[4] if e[3] != 9 else e[4]+128 for e in c]
-              chord = sorted(set(all_pitches))
-            
-              pitches = sorted([p for p in chord if p < 128], reverse=True)
-              drums = [(d+drums_offset)-128 for d in chord if d > 127]
-            
-              if pitches:
-                if len(pitches) > 1:
-                    
-                  tones_chord = sorted(set([p % 12 for p in pitches]))
-            
-                  if tones_chord not in ALL_CHORDS_SORTED:
-                      tones_chord = check_and_fix_tones_chord(tones_chord)
-                      
-                  sig_token = ALL_CHORDS_SORTED.index(tones_chord) + 128
-            
-                elif len(pitches) == 1:
-                  sig_token = pitches[0]
-            
-                sig.append(sig_token)
-            
-              if drums:
-                  dsig.extend(drums)
-    
-    
-            if omit_drums:
-                sig_p = dict.fromkeys(sig, 0)
-                
-                for item in sig:
-                    sig_p[item] += 1
-    
-            else:
-                sig_p = dict.fromkeys(sig+dsig, 0)
-            
-                for item in sig+dsig:
-                    sig_p[item] += 1
+###################################################################################
 
-            if convert_counts_to_ratios:
-                tcount = sum([s[1] for s in sig_p.items()])
-                sig_p = dict([[s[0], s[1] / tcount] for s in sig_p.items()])
-            
-            src_sigs.append(sig_p)
-            
-        return src_sigs
-        
-    except:
-        return []   
+def get_array_module(array):
+
+    # numpy for host arrays (i.e. memory-mapped or shared memory data) and np otherwise
+
+    return numpy if isinstance(array, numpy.ndarray) else np
 
 ###################################################################################
 
-def load_pickle(input_file_name, ext='.pickle', verbose=True):
+def get_top_k_candidates(dists, k):
 
-    if input_file_name:
+    # Indices of all dists up to the k-th smallest one (ties included)
 
-        if verbose:
-            print('Tegridy Pickle File Loader')
-            print('Loading the pickle file. Please wait...')
-        
-        if os.path.basename(input_file_name).endswith(ext):
-            fname = input_file_name
-        
-        else:
-            fname = input_file_name + ext
-        
-        with open(fname, 'rb') as pickle_file:
-            content = pickle.load(pickle_file)
-        
-        if verbose:
-            print('Done!')
-        
-        return content
+    xp = get_array_module(dists)
 
-    else:
-        return None
+    if k < dists.shape[0]:
+        kth = xp.partition(dists, k-1)[k-1]
+
+        return xp.nonzero(dists <= kth)[0]
+
+    return xp.arange(dists.shape[0])
 
 ###################################################################################
 
-def search_and_filter(sigs_dicts,
-                      X,
-                      global_union,
-                      monster_dir = './Monster-MIDI-Dataset/MIDIs/',
-                      master_dir = './Master-MIDI-Dataset/',
-                      output_dir = './Output-MIDI-Dataset/',
-                      number_of_top_matches_to_copy = 30,
-                      transpose_factor=6,
-                      convert_counts_to_ratios=True,
-                      omit_drums=True,
-                      mismatch_penalty=10,
-                      p=3
-                     ):
+def get_top_k_indices(dists, k):
 
-    transpose_factor = max(0, min(6, transpose_factor))
-    
-    if transpose_factor > 0:
-        
-        tsidx = -transpose_factor
-        teidx = transpose_factor
-    
-    else:
-        tsidx = 0
-        teidx = 1
+    # Indices of the k smallest dists sorted by distance
+    # Equal dists are ordered by index so all search modes break ties the same way
 
-    master_midis = create_files_list([master_dir])
+    xp = get_array_module(dists)
 
-    os.makedirs(master_dir, exist_ok=True)
-    os.makedirs(output_dir, exist_ok=True)
-    
-    for midi in master_midis:
-    
-        inp_fn = os.path.basename(midi)
-    
-        print('=' * 70)
-        print('Processing MIDI file:', inp_fn)
-        print('=' * 70)
-    
-        trg_sigs = get_MIDI_signature(midi,
-                                      transpose_factor=transpose_factor,
-                                      convert_counts_to_ratios=convert_counts_to_ratios,
-                                      omit_drums=omit_drums
-                                      )
-    
-        tv = list(range(tsidx, teidx))
-        
-        seen = []
-        rseen = []
-    
-        for i in tqdm.tqdm(range(len(trg_sigs))):
-            
-            dists = get_distances_np(trg_sigs[i],
-                                     X,
-                                     global_union,
-                                     mismatch_penalty=mismatch_penalty,
-                                     p=p
-                                     )
-        
-            sorted_indices = np.argsort(dists).tolist()
-    
-            out_dir = os.path.splitext(inp_fn)[0]
-    
-            os.makedirs(output_dir+'/'+out_dir, exist_ok=True)
-        
-            for _, idx in enumerate(sorted_indices[:number_of_top_matches_to_copy]):          
-                
-                fn = sigs_dicts[idx][0]
-                dist = dists[idx]
-        
-                new_fn = output_dir+out_dir+'/'+str(dist)+'_'+str(tv[i])+'_'+fn+'.mid'
-        
-                if fn not in seen and dist not in rseen:
-                    
-                    src_fn = monster_dir+fn[0]+'/'+fn+'.mid'
-                    
-                    if os.path.exists(src_fn):
-                        shutil.copy2(src_fn, new_fn)
-                        seen.append(fn)
-                        rseen.append(dist)
+    k = max(0, min(k, dists.shape[0]))
 
-    print('=' * 70)
-    print('Done!')
-    print('=' * 70)
+    if k == 0:
+        return xp.zeros(0, dtype=xp.int64)
+
+    idxs = get_top_k_candidates(dists, k)
+
+    return idxs[xp.argsort(dists[idxs], kind='stable')][:k]
 
 ###################################################################################
 
-print('Module is loaded!')
-print('Enjoy! :)')
-print('=' * 70)
+def merge_top_k(dists_list, idxs_list, k):
+
+    # Merges (partial) top-k results, i.e. of X tiles, shards or streamed rows blocks
+    # Equal dists are ordered by idxs like in get_top_k_indices()
+
+    xp = get_array_module(dists_list[0])
+
+    dists = xp.concatenate(dists_list)
+    idxs = xp.concatenate(idxs_list)
+
+    k = max(0, min(k, dists.shape[0]))
+
+    if k == 0:
+        return dists[:0], idxs[:0]
+
+    cands = get_top_k_candidates(dists, k)
+
+    top_idxs = cands[xp.lexsort(xp.stack([idxs[cands], dists[cands]]))][:k]
+
+    return dists[top_idxs], idxs[top_idxs]
+
+###################################################################################
+
+def to_numpy(array):
+    return array.get() if hasattr(array, 'get') else array
+
+###################################################################################
+
+def get_tile_sum_terms(X_tile, cols, trg_values, tile_counts, penalty, p):
+
+    # Fused distances kernel for the X_tile rows (sum terms before the p-th root)
+    # Only the target keys columns are compared and all other row keys are
+    # mismatches counted with tile_counts, so the tile temporaries are
+    # just two tile x target keys buffers updated in place
+
+    xp = get_array_module(X_tile)
+
+    hi = X_tile[:, cols].astype(trg_values.dtype, copy=False)
+    lo = xp.minimum(hi, trg_values)
+
+    xp.maximum(hi, trg_values, out=hi)
+
+    # Target values are > 0 so lo == 0 are the row missing keys
+    # which get a (max / max - 1) == 0 diff
+    missing = lo == 0
+    xp.copyto(lo, hi, where=missing)
+
+    xp.divide(hi, lo, out=hi)
+    xp.subtract(hi, 1.0, out=hi)
+    xp.power(hi, p, out=hi)
+
+    shared = cols.shape[0] - xp.count_nonzero(missing, axis=1)
+
+    mismatches = cols.shape[0] + tile_counts - 2 * shared
+
+    return xp.sum(hi, axis=1) + mismatches * penalty
+
+###################################################################################
+
+def drop_unknown_signature_keys(trg_signature_dictionary, global_union):
+
+    # Target keys which are not in global_union are in none of the X rows
+    # so they are dropped and returned as a number of mismatches for every row
+
+    keys = list(trg_signature_dictionary.keys())
+
+    if not keys or global_union.shape[0] == 0:
+        return {}, len(keys)
+
+    xp = get_array_module(global_union)
+
+    keys_array = xp.array(keys)
+
+    idxs = xp.minimum(xp.searchsorted(global_union, keys_array), global_union.shape[0]-1)
+
+    known = to_numpy(global_union[idxs] == keys_array).tolist()
+
+    known_trg = {key: trg_signature_dictionary[key] for key, kn in zip(keys, known) if kn}
+
+    return known_trg, len(keys) - len(known_trg)
+
+###################################################################################
+
+def get_batched_distances_np(trg_signatures_dictionaries,
+                             X,
+                             global_union,
+                             X_counts=None,
+                             mismatch_penalty=10,
+                             p=3,
+                             tile_size=8192,
+                             top_k=0
+                             ):
+
+    # Returns Q x N distances for Q target signatures at once
+    # X is scanned in tiles of tile_size rows to keep temporaries small
+
+    # With top_k > 0 only the top_k best matches of each tile are kept and merged
+    # and Q x top_k distances and Q x top_k X rows indices are returned instead
+
+    # Host X (i.e. the sharded search shared memory X) is searched with numpy
+    xp = get_array_module(X)
+
+    if X_counts is None:
+        X_counts = precompute_signatures_counts(X)
+
+    if not trg_signatures_dictionaries:
+        if top_k > 0:
+            return xp.zeros((0, 0)), xp.zeros((0, 0), dtype=xp.int64)
+
+        return xp.zeros((0, X.shape[0]))
+
+    compute_dtype = signatures_compute_dtype(X.dtype)
+
+    known_trgs = [drop_unknown_signature_keys(t, global_union) for t in trg_signatures_dictionaries]
+
+    trg_vecs = xp.stack([counter_to_vector(t, global_union, dtype=X.dtype) for t, _ in known_trgs]).astype(compute_dtype)
+
+    # Only the target keys have to be compared, all other keys of a row
+    # are mismatches which are counted with X_counts (number of X > 0 keys)
+    trg_cols = [xp.nonzero(tv > 0)[0] for tv in trg_vecs]
+
+    penalty = float(mismatch_penalty) ** p
+
+    unknown_penalties = [n * penalty for _, n in known_trgs]
+
+    if top_k > 0:
+        top_sum_terms = [xp.zeros(0)] * trg_vecs.shape[0]
+        top_idxs = [xp.zeros(0, dtype=xp.int64)] * trg_vecs.shape[0]
+
+    else:
+        sum_terms = xp.zeros((trg_vecs.shape[0], X.shape[0]))
+
+    for sidx in range(0, X.shape[0], tile_size):
+
+        eidx = min(sidx+tile_size, X.shape[0])
+
+        X_tile = X[sidx:eidx]
+
+        for i, cols in enumerate(trg_cols):
+
+            tile_sum_terms = get_tile_sum_terms(X_tile, cols, trg_vecs[i][cols], X_counts[sidx:eidx], penalty, p)
+
+            if unknown_penalties[i]:
+                tile_sum_terms += unknown_penalties[i]
+
+            if top_k > 0:
+                top_sum_terms[i], top_idxs[i] = merge_top_k([top_sum_terms[i], tile_sum_terms],
+                                                            [top_idxs[i], xp.arange(sidx, eidx)],
+                                                            top_k
+                                                            )
+
+            else:
+                sum_terms[i, sidx:eidx] = tile_sum_terms
+
+    if top_k > 0:
+        sum_terms = xp.stack(top_sum_terms)
+
+        return (xp.cbrt(sum_terms) if p == 3 else xp.power(sum_terms, 1.0 / p)), xp.stack(top_idxs)
+
+    return xp.cbrt(sum_terms) if p == 3 else xp.power(sum_terms, 1.0 / p)
+
+###################################################################################
+
+def compare_signatures_precisions(signatures_dictionaries,
+                                  dtypes=['float32', 'float16', 'uint16'],
+                                  number_of_queries=100,
+                                  k=30,
+                                  mismatch_penalty=10,
+                                  p=3,
+                                  seed=42
+                                  ):
+
+    # Recall@k of the top-k matches of random sample signatures
+    # for every dtype against the float64 signatures top-k matches
+
+    print('=' * 70)
+    print('Comparing signatures precisions...')
+
+    rng = random.Random(seed)
+
+    queries = [sig[1] for sig in rng.sample(signatures_dictionaries, min(number_of_queries, len(signatures_dictionaries)))]
+
+    X, global_union = precompute_signatures(signatures_dictionaries, dtype='float64')
+
+    ref_idxs = to_numpy(get_batched_distances_np(queries, X, global_union, mismatch_penalty=mismatch_penalty, p=p, top_k=k)[1])
+
+    ref_nbytes = X.nbytes
+
+    del X
+
+    results = {}
+
+    for dtype in dtypes:
+
+        X, global_union = precompute_signatures(signatures_dictionaries, dtype=dtype)
+
+        idxs = to_numpy(get_batched_distances_np(queries, X, global_union, mismatch_penalty=mismatch_penalty, p=p, top_k=k)[1])
+
+        recall = numpy.mean([len(set(a.tolist()) & set(b.tolist())) / max(1, len(a)) for a, b in zip(ref_idxs, idxs)])
+
+        results[dtype] = recall
+
+        print(dtype, '| recall@' + str(k), '=', round(float(recall), 4), '| memory', str(round(X.nbytes / ref_nbytes, 3)) + 'x')
+
+        del X
+
+    print('=' * 70)
+
+    return results
+
+###################################################################################
+
+def get_unfused_distances_np(trg_signature_dictionary,
+                             X,
+                             global_union,
+                             mismatch_penalty=10,
+                             p=3
+                             ):
+
+    # Whole X distances kernel with N x K temporaries
+    # which get_distances_np() replaced (kept for compare_distances_kernels)
+
+    compute_dtype = signatures_compute_dtype(X.dtype)
+
+    trg_signature_dictionary, unknown_keys = drop_unknown_signature_keys(trg_signature_dictionary, global_union)
+
+    target_vec = counter_to_vector(trg_signature_dictionary, global_union, dtype=X.dtype).astype(compute_dtype)
+
+    X = X.astype(compute_dtype, copy=False)
+
+    mask_both = (X > 0) & (target_vec > 0)
+
+    # Zero values divisions are masked out by mask_both
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        diff = np.where(mask_both,
+                        (np.maximum(X, target_vec) / np.minimum(X, target_vec)) - 1.0,
+                        mismatch_penalty)
+
+    union_mask = (X > 0) | (target_vec > 0)
+
+    sum_term = np.sum((diff ** p) * union_mask, axis=1) + unknown_keys * float(mismatch_penalty) ** p
+
+    return np.cbrt(sum_term) if p == 3 else np.power(sum_term, 1.0 / p)
+
+###################################################################################
+
+def get_peak_memory_usage(func, *args, **kwargs):
+
+    # func result and peak memory (in bytes) allocated while running func
+    # CuPy memory pool bytes on GPU and traced host memory with NumPy
+
+    if np.__name__ == 'cupy':
+        memory_pool = np.get_default_memory_pool()
+        memory_pool.free_all_blocks()
+
+        start_bytes = memory_pool.total_bytes()
+
+        result = func(*args, **kwargs)
+
+        np.cuda.Stream.null.synchronize()
+
+        # Freed blocks are kept in the pool so its size is the peak
+        return result, memory_pool.total_bytes() - start_bytes
+
+    tracemalloc.start()
+
+    try:
+        result = func(*args, **kwargs)
+
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+    return result, peak_bytes
+
+###################################################################################
+
+def compare_distances_kernels(X,
+                              global_union,
+                              trg_signatures_dictionaries,
+                              mismatch_penalty=10,
+                              p=3,
+                              tile_size=16384
+                              ):
+
+    # Time per query and peak temporaries memory of the unfused (N x K temporaries)
+    # and the fused tiled distances kernels and their max distances difference
+
+    print('=' * 70)
+    print('Comparing distances kernels on', X.shape[0], 'x', X.shape[1], X.dtype, 'signatures...')
+
+    X_counts = precompute_signatures_counts(X)
+
+    kernels = {'unfused': functools.partial(get_unfused_distances_np,
+                                            X=X,
+                                            global_union=global_union,
+                                            mismatch_penalty=mismatch_penalty,
+                                            p=p
+                                            ),
+
+               'fused': functools.partial(get_distances_np,
+                                          X=X,
+                                          global_union=global_union,
+                                          mismatch_penalty=mismatch_penalty,
+                                          p=p,
+                                          X_counts=X_counts,
+                                          tile_size=tile_size
+                                          )
+               }
+
+    results = {}
+
+    for name, kernel in kernels.items():
+
+        # Warm-up run
+        kernel(trg_signatures_dictionaries[0])
+
+        start_time = time.time()
+
+        for trg_sig in trg_signatures_dictionaries:
+            kernel(trg_sig)
+
+        elapsed_time = time.time() - start_time
+
+        peak_bytes = get_peak_memory_usage(kernel, trg_signatures_dictionaries[0])[1]
+
+        results[name] = {'time': elapsed_time / len(trg_signatures_dictionaries), 'peak_memory': peak_bytes}
+
+        print(name, '|', round(results[name]['time'] * 1000, 2), 'ms per query |',
+              'peak temporaries', round(peak_bytes / 1048576, 2), 'MB')
+
+    max_diff = max(float(np.max(np.abs(kernels['unfused'](trg_sig) - kernels['fused'](trg_sig))))
+                   for trg_sig in trg_signatures_dictionaries)
+
+    results['max_distances_difference'] = max_diff
+
+    print('Fused kernel speed-up:', round(results['unfused']['time'] / results['fused']['time'], 2),
+          '| peak temporaries reduction:', round(results['unfused']['peak_memory'] / max(1, results['fused']['peak_memory']), 2))
+    print('Max distances difference:', max_diff)
+    print('=' * 70)
+
+    return results
+
+###################################################################################
+
+def get_pairwise_distances_np(sig_dicts1,
+                              sig_dicts2=None,
+                              mismatch_penalty=10,
+                              p=3,
+                              dtype='float32',
+                              tile_size=8192
+                              ):
+
+    # All-pairs len(sig_dicts1) x len(sig_dicts2) distances matrix
+    # sig_dicts2=None compares sig_dicts1 with itself
+
+    if sig_dicts2 is None:
+        sig_dicts2 = sig_dicts1
+
+    # Keys of both sets so every key has its own column
+    global_union = np.array(sorted({key for sig_dict in sig_dicts1 + sig_dicts2 for key in sig_dict.keys()}))
+
+    X = counters_to_matrix(sig_dicts2, global_union, dtype=dtype)
+
+    return get_batched_distances_np(sig_dicts1,
+                                    X,
+                                    global_union,
+                                    mismatch_penalty=mismatch_penalty,
+                                    p=p,
+                                    tile_size=tile_size
+                                    )
+
+###################################################################################
+
+def find_near_duplicate_signatures(signatures_dictionaries,
+                                   max_distance=20,
+                                   block_size=4096,
+                                   mismatch_penalty=10,
+                                   p=3,
+                                   dtype='float32',
+                                   verbose=True
+                                   ):
+
+    # Returns sorted [i, j, distance] pairs (i < j) of signatures_dictionaries
+    # rows which are within max_distance of each other
+    # Rows are compared in block_size x block_size blocks pairs
+    # so memory is bounded by the block size and not by the dataset size
+
+    X, global_union = precompute_signatures(signatures_dictionaries, dtype=dtype)
+    X_counts = precompute_signatures_counts(X)
+
+    num_rows = X.shape[0]
+
+    near_duplicates = []
+
+    blocks_starts = range(0, num_rows, block_size)
+
+    for bi in tqdm.tqdm(blocks_starts, disable=not verbose):
+
+        trg_sigs = [sig[1] for sig in signatures_dictionaries[bi:bi+block_size]]
+
+        for bj in range(bi, num_rows, block_size):
+
+            ej = min(bj+block_size, num_rows)
+
+            dists = get_batched_distances_np(trg_sigs,
+                                             X[bj:ej],
+                                             global_union,
+                                             X_counts=X_counts[bj:ej],
+                                             mismatch_penalty=mismatch_penalty,
+                                             p=p,
+                                             tile_size=block_size
+                                             )
+
+            rows, cols = np.nonzero(dists <= max_distance)
+
+            rows = rows + bi
+            cols = cols + bj
+
+            # Every pair once and no self pairs
+            upper = rows < cols
+
+            for i, j, d in zip(to_numpy(rows[upper]).tolist(),
+                               to_numpy(cols[upper]).tolist(),
+                               to_numpy(dists[rows[upper]-bi, cols[upper]-bj]).tolist()
+                               ):
+
+                near_duplicates.append([i, j, d])
+
+    near_duplicates.sort(key=lambda x: (x[2], x[0], x[1]))
+
+    return near_duplicates
+
+###################################################################################
+
+# Query results LRU cache
+#
+# Top-k results are cached by target signature hash, mismatch_penalty and p
+# so repeated queries (and overlapping transpositions) skip the scan
+# Please use one cache per signatures matrix
+
+def create_query_cache(max_size=4096):
+
+    return {'entries': OrderedDict(),
+            'max_size': max_size,
+            'hits': 0,
+            'misses': 0,
+            'lock': threading.Lock()
+            }
+
+###################################################################################
+
+def signature_hash(sig_dict):
+
+    # Canonical (keys order independent) hash of a signature dict
+    canonical = repr(sorted((int(k), float(v)) for k, v in sig_dict.items()))
+
+    return hashlib.md5(canonical.encode()).hexdigest()
+
+###################################################################################
+
+def query_cache_get(query_cache, key, k):
+
+    # Cached top-k of at least k matches or None
+
+    with query_cache['lock']:
+        entry = query_cache['entries'].get(key)
+
+        if entry is not None and entry[0] >= k:
+            query_cache['entries'].move_to_end(key)
+            query_cache['hits'] += 1
+
+            return entry[1][:k], entry[2][:k]
+
+        query_cache['misses'] += 1
+
+    return None
+
+###################################################################################
+
+def query_cache_put(query_cache, key, k, dists, idxs):
+
+    with query_cache['lock']:
+        query_cache['entries'][key] = (k, dists, idxs)
+        query_cache['entries'].move_to_end(key)
+
+        while len(query_cache['entries']) > query_cache['max_size']:
+            query_cache['entries'].popitem(last=False)
+
+###################################################################################
+
+def get_cached_top_k(trg_signatures_dictionaries,
+                     X,
+                     global_union,
+                     k,
+                     query_cache,
+                     X_counts=None,
+                     mismatch_penalty=10,
+                     p=3,
+                     search_engine=None
+                     ):
+
+    # Lists of top-k distances and X rows indices of the targets
+    # Only the cache misses are scanned (in one batched sweep)
+    # or sent to the sharded search_engine
+
+    keys = [(signature_hash(trg), mismatch_penalty, p) for trg in trg_signatures_dictionaries]
+
+    results = [query_cache_get(query_cache, key, k) for key in keys]
+
+    misses = [i for i, r in enumerate(results) if r is None]
+
+    if misses:
+        if search_engine is not None:
+            top_dists, top_idxs = sharded_search_top_k(search_engine,
+                                                       [trg_signatures_dictionaries[i] for i in misses],
+                                                       k,
+                                                       mismatch_penalty=mismatch_penalty,
+                                                       p=p
+                                                       )
+
+        else:
+            top_dists, top_idxs = get_batched_distances_np([trg_signatures_dictionaries[i] for i in misses],
+                                                           X,
+                                                           global_union,
+                                                           X_counts=X_counts,
+                                                           mismatch_penalty=mismatch_penalty,
+                                                           p=p,
+                                                           top_k=k
+                                                           )
+
+        for j, i in enumerate(misses):
+            results[i] = (top_dists[j], top_idxs[j])
+
+            query_cache_put(query_cache, keys[i], k, top_dists[j], top_idxs[j])
+
+    return [r[0] for r in results], [r[1] for r in results]
+
+###################################################################################
+
+def precompute_sparse_signatures(signatures_dictionaries):
+
+    # CSR-style store: row i is values[indptr[i]:indptr[i+1]]
+    # at global_union columns indices[indptr[i]:indptr[i+1]]
+
+    all_counters = [sig[1] for sig in signatures_dictionaries]
+    global_union = numpy.array(sorted({key for counter in all_counters for key in counter.keys()}))
+
+    counts = numpy.fromiter((len(counter) for counter in all_counters), dtype=numpy.int64, count=len(all_counters))
+    nnz = int(counts.sum())
+
+    keys = numpy.fromiter((key for counter in all_counters for key in counter.keys()), dtype=numpy.int64, count=nnz)
+    values = numpy.fromiter((value for counter in all_counters for value in counter.values()), dtype=numpy.float32, count=nnz)
+
+    indices = numpy.searchsorted(global_union, keys).astype(numpy.int32)
+
+    # Zero-valued keys are absent keys for the distance metric
+    nz_mask = values > 0
+
+    if not nz_mask.all():
+        rows = numpy.repeat(numpy.arange(len(all_counters)), counts)
+        counts = numpy.bincount(rows[nz_mask], minlength=len(all_counters))
+        indices = indices[nz_mask]
+        values = values[nz_mask]
+
+    indptr = numpy.zeros(len(all_counters)+1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=indptr[1:])
+
+    sX = (np.asarray(indptr), np.asarray(indices), np.asarray(values))
+
+    return sX, np.asarray(global_union)
+
+###################################################################################
+
+def precompute_sparse_columns(sX, num_cols, rows_block_size=8192):
+
+    # Column-major (CSC) copy of the sparse signatures
+    # Rows with key (column) j are rows[col_indptr[j]:col_indptr[j+1]]
+    # with the key values at values[col_indptr[j]:col_indptr[j+1]]
+    # Entries are placed rows block by rows block so temporaries stay block sized
+
+    indptr, indices, values = sX
+
+    num_rows = indptr.shape[0]-1
+
+    col_counts = np.zeros(num_cols, dtype=np.int64)
+
+    for sidx in range(0, indices.shape[0], rows_block_size * 64):
+        col_counts += np.bincount(indices[sidx:sidx+rows_block_size*64], minlength=num_cols)
+
+    col_indptr = np.zeros(num_cols+1, dtype=np.int64)
+    col_indptr[1:] = np.cumsum(col_counts)
+
+    col_rows = np.empty(indices.shape[0], dtype=np.int32 if num_rows < 2**31 else np.int64)
+    col_values = np.empty(values.shape[0], dtype=values.dtype)
+
+    # Next free position of every column
+    col_next = col_indptr[:-1].copy()
+
+    for sidx in range(0, num_rows, rows_block_size):
+
+        eidx = min(sidx+rows_block_size, num_rows)
+
+        start = int(indptr[sidx])
+        end = int(indptr[eidx])
+
+        block_rows = np.repeat(np.arange(sidx, eidx, dtype=col_rows.dtype), np.diff(indptr[sidx:eidx+1]))
+
+        order = np.argsort(indices[start:end], kind='stable')
+
+        block_cols = indices[start:end][order]
+        block_counts = np.bincount(block_cols, minlength=num_cols)
+
+        # Entries ranks within their columns in the block
+        ranks = np.arange(end-start) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+
+        dest = col_next[block_cols] + ranks
+
+        col_rows[dest] = block_rows[order]
+        col_values[dest] = np.asarray(values[start:end])[order]
+
+        col_next += block_counts
+
+    return col_indptr, col_rows, col_values
+
+###################################################################################
+
+def get_target_postings(target_vec, trg_cols, col_indptr, col_rows, col_values):
+
+    # Concatenated posting lists of the target keys columns as
+    # rows, rows values and target values (only target keys entries are touched)
+
+    # Target columns past the posting lists have no rows
+    trg_cols = trg_cols[trg_cols < col_indptr.shape[0]-1]
+
+    starts = col_indptr[trg_cols]
+    lengths = col_indptr[trg_cols+1] - starts
+
+    total = int(lengths.sum())
+
+    ranges_starts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    positions = ranges_starts + np.arange(total)
+
+    return col_rows[positions], col_values[positions], np.repeat(target_vec[trg_cols], lengths)
+
+###################################################################################
+
+def get_sparse_distances_np(trg_signature_dictionary,
+                            sX,
+                            global_union,
+                            mismatch_penalty=10,
+                            p=3,
+                            sX_columns=None
+                            ):
+
+    # sX_columns are precompute_sparse_columns(sX, global_union.shape[0])
+    # Without them all sX entries are scanned for the target keys
+
+    indptr, indices, values = sX
+
+    num_rows = indptr.shape[0]-1
+
+    compute_dtype = signatures_compute_dtype(values.dtype)
+
+    trg_signature_dictionary, unknown_keys = drop_unknown_signature_keys(trg_signature_dictionary, global_union)
+
+    target_vec = counter_to_vector(trg_signature_dictionary, global_union, dtype=values.dtype).astype(compute_dtype)
+
+    if sX_columns is not None:
+        rows, sig_values, trg_values = get_target_postings(target_vec,
+                                                           np.nonzero(target_vec > 0)[0],
+                                                           *sX_columns
+                                                           )
+
+        sig_values = sig_values.astype(compute_dtype)
+
+    else:
+        # Only the entries of the target keys get their rows
+        positions = np.nonzero((target_vec > 0)[indices])[0]
+
+        rows = np.searchsorted(indptr, positions, side='right') - 1
+
+        sig_values = values[positions].astype(compute_dtype)
+        trg_values = target_vec[indices[positions]]
+
+    diff = (np.maximum(sig_values, trg_values) / np.minimum(sig_values, trg_values)) - 1.0
+
+    both_sums = np.bincount(rows, weights=diff ** p, minlength=num_rows)
+    both_counts = np.bincount(rows, minlength=num_rows)
+
+    # Every key present in only one of the signatures costs mismatch_penalty ** p
+    mismatches = np.count_nonzero(target_vec > 0) + unknown_keys + np.diff(indptr) - 2 * both_counts
+
+    sum_term = both_sums + mismatches * (float(mismatch_penalty) ** p)
+
+    return np.cbrt(sum_term) if p == 3 else np.power(sum_term, 1.0 / p)
+
+###################################################################################
+
+def precompute_inverted_index(X, global_union):
+
+    # Posting lists: rows with key (column) j are rows[indptr[j]:indptr[j+1]]
+    # with the key values at values[indptr[j]:indptr[j+1]]
+    # Works with both dense X and sparse sX signatures
+    # There is a posting list for every global_union key (column)
+    # The index does not need X so X can be dropped after building it
+
+    if type(X) == tuple:
+        indptr, rows, values = precompute_sparse_columns(X, global_union.shape[0])
+
+        row_counts = np.diff(X[0]).astype(np.int32)
+
+    else:
+        num_rows, num_cols = X.shape
+
+        cols, rows = np.nonzero(X.T > 0)
+
+        values = X[rows, cols]
+
+        row_counts = precompute_signatures_counts(X).astype(np.int32)
+
+        indptr = np.zeros(num_cols+1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(cols, minlength=num_cols))
+
+        rows = rows.astype(np.int32 if num_rows < 2**31 else np.int64)
+
+    # Rows sharing no keys with a target are ranked by their keys counts alone
+    rows_by_count = np.argsort(row_counts, kind='stable').astype(rows.dtype)
+
+    return indptr, rows, values, row_counts, rows_by_count
+
+###################################################################################
+
+def get_inverted_index_top_k(trg_signature_dictionary,
+                             inv_index,
+                             global_union,
+                             k,
+                             mismatch_penalty=10,
+                             p=3,
+                             min_shared_keys=1
+                             ):
+
+    # Only rows sharing at least min_shared_keys keys with the target are scored
+    # Rows sharing no keys are max distance rows which only depend on their keys counts
+    # so with min_shared_keys=1 the top-k is the same as with the full scan
+
+    indptr, posting_rows, posting_values, row_counts, rows_by_count = inv_index
+
+    compute_dtype = signatures_compute_dtype(posting_values.dtype)
+
+    trg_signature_dictionary, unknown_keys = drop_unknown_signature_keys(trg_signature_dictionary, global_union)
+
+    target_vec = counter_to_vector(trg_signature_dictionary, global_union, dtype=posting_values.dtype).astype(compute_dtype)
+
+    trg_cols = np.nonzero(target_vec > 0)[0]
+
+    # Target keys without posting lists are mismatches for all rows
+    trg_count = trg_cols.shape[0] + unknown_keys
+
+    pen = float(mismatch_penalty) ** p
+
+    rows, sig_values, trg_values = get_target_postings(target_vec, trg_cols, indptr, posting_rows, posting_values)
+
+    sig_values = sig_values.astype(compute_dtype)
+
+    diff = (np.maximum(sig_values, trg_values) / np.minimum(sig_values, trg_values)) - 1.0
+
+    touched_rows, inverse = np.unique(rows, return_inverse=True)
+    inverse = inverse.ravel()
+
+    both_sums = np.bincount(inverse, weights=diff ** p, minlength=touched_rows.shape[0])
+    both_counts = np.bincount(inverse, minlength=touched_rows.shape[0])
+
+    cand_mask = both_counts >= max(1, min_shared_keys)
+
+    cand_rows = touched_rows[cand_mask]
+
+    mismatches = trg_count + row_counts[cand_rows] - 2 * both_counts[cand_mask]
+
+    sum_term = both_sums[cand_mask] + mismatches * pen
+
+    cand_dists = np.cbrt(sum_term) if p == 3 else np.power(sum_term, 1.0 / p)
+
+    # Best k rows sharing no keys with the target
+    first_rows = rows_by_count[:k+touched_rows.shape[0]]
+    first_rows = first_rows[~np.isin(first_rows, touched_rows)][:k]
+
+    sum_term = (trg_count + row_counts[first_rows]) * pen
+
+    first_dists = np.cbrt(sum_term) if p == 3 else np.power(sum_term, 1.0 / p)
+
+    return merge_top_k([cand_dists, first_dists], [cand_rows, first_rows], k)
+
+###################################################################################
+
+# IVF (inverted file) approximate search index
+#
+# Rows are partitioned with (spherical) k-means over the unit keys presence vectors.
+# Their dot products are shared keys / sqrt(keys counts product), so rows with
+# few mismatched keys, which dominate the signatures distances, share partitions.
+# Only the rows of the nprobe partitions nearest to the target are scored
+# with the exact distances.
+
+def get_presence_vectors(X):
+
+    P = (X > 0).astype(np.float32)
+
+    return P / np.maximum(np.sqrt(np.sum(P, axis=1, keepdims=True)), 1)
+
+###################################################################################
+
+def get_nearest_centroids(P, centroids, n=1):
+
+    # n nearest (highest cosine similarity) centroids of the P rows
+
+    dists = -(P @ centroids.T)
+
+    if n == 1:
+        return np.argmin(dists, axis=1)[:, None]
+
+    n = min(n, centroids.shape[0])
+
+    nearest = np.argpartition(dists, n-1, axis=1)[:, :n]
+
+    order = np.argsort(np.take_along_axis(dists, nearest, axis=1), axis=1)
+
+    return np.take_along_axis(nearest, order, axis=1)
+
+###################################################################################
+
+def precompute_ivf_index(X,
+                         number_of_partitions=None,
+                         number_of_iterations=10,
+                         sample_size=200000,
+                         rows_block_size=65536,
+                         seed=42,
+                         verbose=True
+                         ):
+
+    # Returns (centroids, list_offsets, list_rows) IVF index of dense X
+    # Partition j rows are list_rows[list_offsets[j]:list_offsets[j+1]]
+    # number_of_partitions=None is sqrt(number of rows)
+
+    num_rows = X.shape[0]
+
+    if number_of_partitions is None:
+        number_of_partitions = int(math.sqrt(num_rows))
+
+    number_of_partitions = max(1, min(number_of_partitions, num_rows))
+
+    rng = numpy.random.default_rng(seed)
+
+    # Centroids are trained on a rows sample
+    sample_rows = numpy.sort(rng.choice(num_rows, min(sample_size, num_rows), replace=False))
+    P = get_presence_vectors(X[np.asarray(sample_rows)])
+
+    centroids = P[np.asarray(rng.choice(P.shape[0], number_of_partitions, replace=False))]
+
+    if verbose:
+        print('=' * 70)
+        print('Training', number_of_partitions, 'partitions on', P.shape[0], 'rows...')
+
+    for it in tqdm.tqdm(range(number_of_iterations), disable=not verbose):
+
+        labels = np.concatenate([get_nearest_centroids(P[i:i+rows_block_size], centroids)[:, 0]
+                                 for i in range(0, P.shape[0], rows_block_size)])
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, P)
+
+        sizes = np.bincount(labels, minlength=number_of_partitions)
+
+        # Empty partitions are re-seeded with random sample rows
+        empty = np.nonzero(sizes == 0)[0]
+
+        centroids = sums / np.maximum(np.sqrt(np.sum(sums * sums, axis=1, keepdims=True)), 1e-12)
+
+        if empty.shape[0]:
+            centroids[empty] = P[np.asarray(rng.choice(P.shape[0], empty.shape[0], replace=False))]
+
+    if verbose:
+        print('Assigning', num_rows, 'rows...')
+
+    labels = np.concatenate([get_nearest_centroids(get_presence_vectors(X[i:i+rows_block_size]), centroids)[:, 0]
+                             for i in tqdm.tqdm(range(0, num_rows, rows_block_size), disable=not verbose)])
+
+    list_rows = np.argsort(labels, kind='stable')
+
+    list_offsets = np.zeros(number_of_partitions+1, dtype=np.int64)
+    list_offsets[1:] = np.cumsum(np.bincount(labels, minlength=number_of_partitions))
+
+    if verbose:
+        print('Done!')
+        print('=' * 70)
+
+    return centroids, list_offsets, list_rows
+
+###################################################################################
+
+def save_ivf_index(ivf_index, output_file_name='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_IVF_INDEX.pickle'):
+    save_pickle([to_numpy(a) for a in ivf_index], output_file_name)
+
+###################################################################################
+
+def load_ivf_index(input_file_name='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_IVF_INDEX.pickle'):
+    return tuple(np.asarray(a) for a in load_pickle(input_file_name))
+
+###################################################################################
+
+def get_ivf_top_k(trg_signature_dictionary,
+                  X,
+                  global_union,
+                  ivf_index,
+                  k,
+                  nprobe=8,
+                  mismatch_penalty=10,
+                  p=3,
+                  X_counts=None
+                  ):
+
+    # Exact distances of the rows of the nprobe partitions nearest to the target
+
+    centroids, list_offsets, list_rows = ivf_index
+
+    target_vec = counter_to_vector(drop_unknown_signature_keys(trg_signature_dictionary, global_union)[0], global_union)
+
+    probes = get_nearest_centroids(get_presence_vectors(target_vec[None, :]),
+                                   centroids,
+                                   n=nprobe
+                                   )[0]
+
+    probes = to_numpy(probes).tolist()
+
+    list_offsets = to_numpy(list_offsets)
+
+    rows = np.concatenate([list_rows[list_offsets[j]:list_offsets[j+1]] for j in probes])
+
+    if X_counts is None:
+        rows_counts = None
+
+    else:
+        rows_counts = X_counts[rows]
+
+    dists = get_distances_np(trg_signature_dictionary,
+                             X[rows],
+                             global_union,
+                             mismatch_penalty=mismatch_penalty,
+                             p=p,
+                             X_counts=rows_counts
+                             )
+
+    return merge_top_k([dists], [rows], k)
+
+###################################################################################
+
+def compare_ivf_nprobes(X,
+                        global_union,
+                        ivf_index,
+                        trg_signatures_dictionaries,
+                        nprobes=[1, 2, 4, 8, 16, 32],
+                        k=30,
+                        mismatch_penalty=10,
+                        p=3
+                        ):
+
+    # Recall@k and mean query latency of every nprobe against the exact get_distances_np() ranking
+
+    print('=' * 70)
+    print('Comparing IVF nprobes...')
+
+    X_counts = precompute_signatures_counts(X)
+
+    start_time = time.time()
+
+    ref_idxs = []
+
+    for trg in trg_signatures_dictionaries:
+        dists = get_distances_np(trg, X, global_union, mismatch_penalty=mismatch_penalty, p=p, X_counts=X_counts)
+        ref_idxs.append(set(to_numpy(get_top_k_indices(dists, k)).tolist()))
+
+    ref_time = (time.time() - start_time) / max(1, len(trg_signatures_dictionaries))
+
+    print('exact | recall@' + str(k), '= 1.0 |', round(ref_time * 1000, 2), 'ms')
+
+    results = {}
+
+    for nprobe in nprobes:
+
+        start_time = time.time()
+
+        recalls = []
+
+        for trg, ref in zip(trg_signatures_dictionaries, ref_idxs):
+            idxs = get_ivf_top_k(trg, X, global_union, ivf_index, k, nprobe=nprobe, mismatch_penalty=mismatch_penalty, p=p, X_counts=X_counts)[1]
+            recalls.append(len(ref & set(to_numpy(idxs).tolist())) / max(1, len(ref)))
+
+        ivf_time = (time.time() - start_time) / max(1, len(trg_signatures_dictionaries))
+
+        results[nprobe] = (float(numpy.mean(recalls)), ivf_time)
+
+        print('nprobe', nprobe, '| recall@' + str(k), '=', round(results[nprobe][0], 4), '|', round(ivf_time * 1000, 2), 'ms')
+
+    print('=' * 70)
+
+    return results
+
+###################################################################################
+
+def get_MIDI_signature(path_to_MIDI_file,
+                       transpose_factor=0,
+                       convert_counts_to_ratios=True,
+                       omit_drums=True
+                      ):
+
+    try:
+    
+        raw_score = midi2single_track_ms_score(path_to_MIDI_file)
+        
+        escore = advanced_score_processor_array(raw_score)
+
+        if escore.shape[0] == 0:
+            return []
+        
+        escore = augment_enhanced_score_notes_array(escore)
+        
+        drums_offset = len(ALL_CHORDS_SORTED) + 128
+    
+        transpose_factor = max(0, min(6, transpose_factor))
+    
+        if transpose_factor > 0:
+            
+            sidx = -transpose_factor
+            eidx = transpose_factor
+    
+        else:
+            sidx = 0
+            eidx = 1
+
+        # Chords grouping does not depend on transposition so the score is
+        # chordified only once and each chord is reduced to its pitches,
+        # drums and pitch-classes mask. Transposed chord tokens are then
+        # just rotated masks looked up in TONES_CHORDS_MASKS_TOKENS.
+
+        cscore = chordify_score_array(escore)
+
+        chords = []
+
+        for c in cscore:
+
+            drums_mask = c['chan'] == 9
+
+            pitches = sorted(set(c['pitch'][~drums_mask].tolist()), reverse=True)
+            drums = sorted(set(c['pitch'][drums_mask].tolist()))
+
+            chords.append([pitches, drums, tones_chord_to_mask(pitches)])
+    
+        src_sigs = []
+        
+        for i in range(sidx, eidx):
+            
+            sig = []
+            dsig = []
+            
+            for pitches, drums, mask in chords:
+
+              # Transposed pitches may cross into the drums range or vice versa
+              if (pitches and pitches[0]+i > 127) or (drums and drums[0]+i < 0):
+
+                all_pitches = [p+i for p in pitches] + [d+i+128 for d in drums]
+                chord = sorted(set(all_pitches))
+
+                tpitches = sorted([p for p in chord if p < 128], reverse=True)
+                tdrums = [(d+drums_offset)-128 for d in chord if d > 127]
+
+                if tpitches:
+                  if len(tpitches) > 1:
+                    sig_token = TONES_CHORDS_MASKS_TOKENS[tones_chord_to_mask(tpitches)]
+
+                  elif len(tpitches) == 1:
+                    sig_token = tpitches[0]
+
+                  sig.append(sig_token)
+
+              else:
+                tdrums = [d+i+drums_offset for d in drums]
+
+                if pitches:
+                  if len(pitches) > 1:
+                    sig_token = TONES_CHORDS_MASKS_TOKENS[rotate_tones_chord_mask(mask, i)]
+
+                  elif len(pitches) == 1:
+                    sig_token = pitches[0]+i
+
+                  sig.append(sig_token)
+
+              if tdrums:
+                  dsig.extend(tdrums)
+    
+    
+            if omit_drums:
+                sig_p = dict.fromkeys(sig, 0)
+                
+                for item in sig:
+                    sig_p[item] += 1
+    
+            else:
+                sig_p = dict.fromkeys(sig+dsig, 0)
+            
+                for item in sig+dsig:
+                    sig_p[item] += 1
+
+            if convert_counts_to_ratios:
+                tcount = sum([s[1] for s in sig_p.items()])
+                sig_p = dict([[s[0], s[1] / tcount] for s in sig_p.items()])
+            
+            src_sigs.append(sig_p)
+            
+        return src_sigs
+        
+    except:
+        return []   
+
+###################################################################################
+
+def load_pickle(input_file_name, ext='.pickle', verbose=True):
+
+    if input_file_name:
+
+        if verbose:
+            print('Tegridy Pickle File Loader')
+            print('Loading the pickle file. Please wait...')
+        
+        if os.path.basename(input_file_name).endswith(ext):
+            fname = input_file_name
+        
+        else:
+            fname = input_file_name + ext
+        
+        with open(fname, 'rb') as pickle_file:
+            content = pickle.load(pickle_file)
+        
+        if verbose:
+            print('Done!')
+        
+        return content
+
+    else:
+        return None
+
+###################################################################################
+
+def save_pickle(data, output_file_name, ext='.pickle', verbose=True):
+
+    if verbose:
+        print('Tegridy Pickle File Writer')
+        print('Saving the pickle file. Please wait...')
+
+    if os.path.basename(output_file_name).endswith(ext):
+        fname = output_file_name
+
+    else:
+        fname = output_file_name + ext
+
+    # Written to a temp file first so an interrupted save does not corrupt the old file
+    with open(fname + '.tmp', 'wb') as pickle_file:
+        pickle.dump(data, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(fname + '.tmp', fname)
+
+    if verbose:
+        print('Done!')
+
+###################################################################################
+
+def file_md5(file_name, chunk_size=1048576):
+
+    md5 = hashlib.md5()
+
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+###################################################################################
+
+def save_signatures_store(signatures_data,
+                          store_dir='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_STORE/',
+                          verbose=True
+                          ):
+
+    # Flat binary signatures store which can be memory-mapped with numpy:
+    # file_names.npy - fixed width signatures file names table
+    # offsets.npy - row i keys and counts are at offsets[i]:offsets[i+1]
+    # keys.npy - signatures keys
+    # counts.npy - signatures counts
+
+    if verbose:
+        print('=' * 70)
+        print('Saving signatures store...')
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    lengths = numpy.fromiter((len(sig[1]) for sig in signatures_data), dtype=numpy.int64, count=len(signatures_data))
+
+    offsets = numpy.zeros(len(signatures_data)+1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+
+    nnz = int(offsets[-1])
+
+    keys = numpy.fromiter((s[0] for sig in signatures_data for s in sig[1]), dtype=numpy.int64, count=nnz)
+    counts = numpy.fromiter((s[1] for sig in signatures_data for s in sig[1]), dtype=numpy.float64, count=nnz)
+
+    if nnz == 0 or (keys.min() >= -32768 and keys.max() < 32768):
+        keys = keys.astype(numpy.int16)
+
+    else:
+        keys = keys.astype(numpy.int32)
+
+    if nnz == 0 or (numpy.all(counts == numpy.floor(counts)) and numpy.abs(counts).max() < 2**31):
+        counts = counts.astype(numpy.int32)
+
+    file_names = numpy.array([sig[0].encode() for sig in signatures_data], dtype=bytes)
+
+    for name, array in [['file_names', file_names], ['offsets', offsets], ['keys', keys], ['counts', counts]]:
+        numpy.save(os.path.join(store_dir, name+'.npy'), array)
+
+    if verbose:
+        print('Saved', len(signatures_data), 'signatures with', nnz, 'keys')
+        print('Done!')
+        print('=' * 70)
+
+###################################################################################
+
+def convert_signatures_pickle(input_file_name='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_DATA.pickle',
+                              store_dir='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_STORE/',
+                              verbose=True
+                              ):
+
+    signatures_data = load_pickle(input_file_name, verbose=verbose)
+
+    save_signatures_store(signatures_data, store_dir, verbose=verbose)
+
+###################################################################################
+
+def load_signatures_store(store_dir='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_STORE/',
+                          verbose=True
+                          ):
+
+    if verbose:
+        print('=' * 70)
+        print('Loading signatures store...')
+
+    signatures_store = {}
+
+    for name in ['file_names', 'offsets', 'keys', 'counts']:
+        signatures_store[name] = numpy.load(os.path.join(store_dir, name+'.npy'), mmap_mode='r')
+
+    if verbose:
+        print('Loaded', signatures_store['file_names'].shape[0], 'signatures')
+        print('Done!')
+        print('=' * 70)
+
+    return signatures_store
+
+###################################################################################
+
+def signature_file_name(signatures, idx):
+
+    # Works with load_signatures() lists, signatures stores and signatures indexes
+
+    if type(signatures) == dict:
+        fn = signatures['file_names'][idx]
+
+        # Signatures index file names are str and signatures store ones are bytes
+        return fn if type(fn) == str else fn.decode()
+
+    else:
+        return signatures[idx][0]
+
+###################################################################################
+
+def read_signatures_store_block(signatures_store,
+                                sidx,
+                                eidx,
+                                convert_counts_to_ratios=True,
+                                omit_drums=True
+                                ):
+
+    # Signatures store rows sidx:eidx as block rows ids, keys and float32 values
+    # in the same way as load_signatures() + precompute_sparse_signatures()
+
+    block_offsets = numpy.array(signatures_store['offsets'][sidx:eidx+1])
+
+    keys = numpy.array(signatures_store['keys'][block_offsets[0]:block_offsets[-1]], dtype=numpy.int64)
+    values = numpy.array(signatures_store['counts'][block_offsets[0]:block_offsets[-1]], dtype=numpy.float64)
+
+    rows = numpy.repeat(numpy.arange(eidx-sidx), numpy.diff(block_offsets))
+
+    if omit_drums:
+        drums_mask = keys < 449
+
+        keys = keys[drums_mask]
+        values = values[drums_mask]
+        rows = rows[drums_mask]
+
+    if convert_counts_to_ratios:
+        tcounts = numpy.bincount(rows, weights=values, minlength=eidx-sidx)
+        values = values / tcounts[rows]
+
+    # Zero-valued keys are absent keys for the distance metric
+    nz_mask = values > 0
+
+    return rows[nz_mask], keys[nz_mask], values[nz_mask].astype(numpy.float32)
+
+###################################################################################
+
+def precompute_store_signatures(signatures_store,
+                                convert_counts_to_ratios=True,
+                                omit_drums=True,
+                                rows_block_size=1000000
+                                ):
+
+    # Same as precompute_sparse_signatures(load_signatures(signatures_data))
+    # but built directly from the store arrays, block by block
+
+    offsets = signatures_store['offsets']
+
+    num_rows = offsets.shape[0]-1
+
+    blocks_keys = []
+    blocks_values = []
+    counts = numpy.zeros(num_rows, dtype=numpy.int64)
+
+    for sidx in tqdm.tqdm(range(0, num_rows, rows_block_size)):
+
+        eidx = min(sidx+rows_block_size, num_rows)
+
+        rows, keys, values = read_signatures_store_block(signatures_store,
+                                                         sidx,
+                                                         eidx,
+                                                         convert_counts_to_ratios,
+                                                         omit_drums
+                                                         )
+
+        blocks_keys.append(keys)
+        blocks_values.append(values)
+
+        counts[sidx:eidx] = numpy.bincount(rows, minlength=eidx-sidx)
+
+    keys = numpy.concatenate(blocks_keys) if blocks_keys else numpy.zeros(0, dtype=numpy.int64)
+    values = numpy.concatenate(blocks_values) if blocks_values else numpy.zeros(0, dtype=numpy.float32)
+
+    global_union = numpy.unique(keys)
+
+    indices = numpy.searchsorted(global_union, keys).astype(numpy.int32)
+
+    indptr = numpy.zeros(num_rows+1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=indptr[1:])
+
+    sX = (np.asarray(indptr), np.asarray(indices), np.asarray(values))
+
+    return sX, np.asarray(global_union)
+
+###################################################################################
+
+def load_signatures_store_shard(signatures_store,
+                                shard_index,
+                                number_of_shards,
+                                convert_counts_to_ratios=True,
+                                omit_drums=True
+                                ):
+
+    # Contiguous rows shard of the signatures store as load_signatures() signatures
+    # Only the shard rows are read from the memory-mapped store
+
+    num_rows = signatures_store['offsets'].shape[0]-1
+
+    sidx = num_rows * shard_index // number_of_shards
+    eidx = num_rows * (shard_index+1) // number_of_shards
+
+    rows, keys, values = read_signatures_store_block(signatures_store,
+                                                     sidx,
+                                                     eidx,
+                                                     convert_counts_to_ratios,
+                                                     omit_drums
+                                                     )
+
+    bounds = numpy.searchsorted(rows, numpy.arange(eidx-sidx+1)).tolist()
+
+    keys = keys.tolist()
+    values = values.tolist()
+
+    return [[fn.decode(), dict(zip(keys[bsidx:beidx], values[bsidx:beidx]))]
+            for fn, bsidx, beidx in zip(signatures_store['file_names'][sidx:eidx], bounds[:-1], bounds[1:])]
+
+###################################################################################
+
+def get_streaming_top_k(trg_signatures_dictionaries,
+                        signatures_store,
+                        k,
+                        convert_counts_to_ratios=True,
+                        omit_drums=True,
+                        mismatch_penalty=10,
+                        p=3,
+                        rows_block_size=100000
+                        ):
+
+    # Reads the memory-mapped signatures store in rows blocks and keeps
+    # a running top-k for every target so peak memory is bounded by the block size
+    # Runs on the host (numpy) because the store is host memory-mapped
+
+    # Targets are dense over the raw signatures keys
+    keys_space = max([max(t.keys()) for t in trg_signatures_dictionaries if t] + [0])+1
+
+    # Store values are float32
+    trg_vecs = numpy.zeros((len(trg_signatures_dictionaries), keys_space), dtype=numpy.float32)
+
+    for i, t in enumerate(trg_signatures_dictionaries):
+        for key, value in t.items():
+            trg_vecs[i, key] = value
+
+    trg_counts = numpy.count_nonzero(trg_vecs > 0, axis=1)
+
+    pen = float(mismatch_penalty) ** p
+
+    top_dists = [numpy.zeros(0) for t in trg_signatures_dictionaries]
+    top_idxs = [numpy.zeros(0, dtype=numpy.int64) for t in trg_signatures_dictionaries]
+
+    num_rows = signatures_store['offsets'].shape[0]-1
+
+    for sidx in tqdm.tqdm(range(0, num_rows, rows_block_size), unit='block'):
+
+        eidx = min(sidx+rows_block_size, num_rows)
+
+        rows, keys, values = read_signatures_store_block(signatures_store,
+                                                         sidx,
+                                                         eidx,
+                                                         convert_counts_to_ratios,
+                                                         omit_drums
+                                                         )
+
+        row_counts = numpy.bincount(rows, minlength=eidx-sidx)
+
+        # Keys outside of the targets keys space are never shared keys
+        in_space = keys < keys_space
+        space_keys = numpy.where(in_space, keys, 0)
+
+        for i in range(len(trg_signatures_dictionaries)):
+
+            trg_values = trg_vecs[i][space_keys] * in_space
+
+            mask_both = trg_values > 0
+
+            sig_values = values[mask_both]
+            both_trg_values = trg_values[mask_both]
+            both_rows = rows[mask_both]
+
+            diff = (numpy.maximum(sig_values, both_trg_values) / numpy.minimum(sig_values, both_trg_values)) - 1.0
+
+            both_sums = numpy.bincount(both_rows, weights=diff ** p, minlength=eidx-sidx)
+            both_counts = numpy.bincount(both_rows, minlength=eidx-sidx)
+
+            mismatches = trg_counts[i] + row_counts - 2 * both_counts
+
+            sum_term = both_sums + mismatches * pen
+
+            dists = numpy.cbrt(sum_term) if p == 3 else numpy.power(sum_term, 1.0 / p)
+
+            block_idxs = get_top_k_indices(dists, k)
+
+            # Running top-k is merged with the block top-k
+            top_dists[i], top_idxs[i] = merge_top_k([top_dists[i], dists[block_idxs]],
+                                                    [top_idxs[i], block_idxs + sidx],
+                                                    k
+                                                    )
+
+    return top_dists, top_idxs
+
+###################################################################################
+
+# Appendable signatures index
+#
+# Rows are kept in append-only CSR segments over the raw signatures keys,
+# i.e. global_union is arange(number_of_keys), so new keys only extend
+# global_union and never reindex existing rows. Deleted rows are tombstoned
+# and dropped by compaction, which also merges the segments.
+#
+# On disk (index_dir) every segment is a separate pickle and MANIFEST.pickle
+# lists the live segments and tombstones, so an append only writes the new rows.
+
+def signatures_index_segment(signatures_dictionaries):
+
+    # [file_names, indptr, indices, values] host segment with indices = keys
+
+    counts = numpy.fromiter((len(sig[1]) for sig in signatures_dictionaries), dtype=numpy.int64, count=len(signatures_dictionaries))
+    nnz = int(counts.sum())
+
+    keys = numpy.fromiter((key for sig in signatures_dictionaries for key in sig[1].keys()), dtype=numpy.int64, count=nnz)
+    values = numpy.fromiter((value for sig in signatures_dictionaries for value in sig[1].values()), dtype=numpy.float32, count=nnz)
+
+    # Zero-valued keys are absent keys for the distance metric
+    nz_mask = values > 0
+
+    if not nz_mask.all():
+        rows = numpy.repeat(numpy.arange(len(signatures_dictionaries)), counts)
+        counts = numpy.bincount(rows[nz_mask], minlength=len(signatures_dictionaries))
+        keys = keys[nz_mask]
+        values = values[nz_mask]
+
+    indptr = numpy.zeros(len(signatures_dictionaries)+1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=indptr[1:])
+
+    return [[sig[0] for sig in signatures_dictionaries], indptr, keys.astype(numpy.int32), values]
+
+###################################################################################
+
+def add_signatures_index_segment(signatures_index, segment):
+
+    file_names, indptr, indices, values = segment
+
+    seg = (np.asarray(indptr), np.asarray(indices), np.asarray(values))
+
+    signatures_index['segments'].append(seg)
+    signatures_index['segments_columns'].append(precompute_sparse_columns(seg, int(indices.max())+1 if indices.shape[0] else 0))
+    signatures_index['segments_offsets'].append(signatures_index['segments_offsets'][-1]+len(file_names))
+    signatures_index['file_names'].extend(file_names)
+
+    if indices.shape[0]:
+        num_keys = max(signatures_index['global_union'].shape[0], int(indices.max())+1)
+        signatures_index['global_union'] = np.arange(num_keys)
+
+###################################################################################
+
+def save_signatures_index_manifest(signatures_index):
+
+    if signatures_index['index_dir']:
+        save_pickle({'generation': signatures_index['generation'],
+                     'segments': signatures_index['segments_files'],
+                     'deleted': sorted(signatures_index['deleted'])
+                     },
+                    os.path.join(signatures_index['index_dir'], 'MANIFEST.pickle'),
+                    verbose=False
+                    )
+
+###################################################################################
+
+def create_signatures_index(signatures_dictionaries=None, index_dir=None):
+
+    signatures_index = {'index_dir': index_dir,
+                        'segments': [],
+                        'segments_columns': [],
+                        'segments_files': [],
+                        'segments_offsets': [0],
+                        'file_names': [],
+                        'deleted': set(),
+                        'generation': 0,
+                        'global_union': np.arange(0)
+                        }
+
+    if index_dir:
+        os.makedirs(index_dir, exist_ok=True)
+
+    if signatures_dictionaries:
+        append_signatures_index(signatures_index, signatures_dictionaries)
+
+    else:
+        save_signatures_index_manifest(signatures_index)
+
+    return signatures_index
+
+###################################################################################
+
+def load_signatures_index(index_dir):
+
+    manifest = load_pickle(os.path.join(index_dir, 'MANIFEST.pickle'), verbose=False)
+
+    signatures_index = create_signatures_index()
+
+    signatures_index['index_dir'] = index_dir
+
+    for segment_file in tqdm.tqdm(manifest['segments']):
+        add_signatures_index_segment(signatures_index, load_pickle(os.path.join(index_dir, segment_file), verbose=False))
+        signatures_index['segments_files'].append(segment_file)
+
+    signatures_index['deleted'] = set(manifest['deleted'])
+    signatures_index['generation'] = manifest['generation']
+
+    return signatures_index
+
+###################################################################################
+
+def append_signatures_index(signatures_index, signatures_dictionaries, max_segments=16):
+
+    # signatures_dictionaries are load_signatures() signatures
+
+    segment = signatures_index_segment(signatures_dictionaries)
+
+    if signatures_index['index_dir']:
+        segment_file = 'SEGMENT_%04d_%08d.pickle' % (signatures_index['generation'], signatures_index['segments_offsets'][-1])
+
+        save_pickle(segment, os.path.join(signatures_index['index_dir'], segment_file), verbose=False)
+
+    else:
+        segment_file = None
+
+    add_signatures_index_segment(signatures_index, segment)
+    signatures_index['segments_files'].append(segment_file)
+
+    save_signatures_index_manifest(signatures_index)
+
+    if len(signatures_index['segments']) > max_segments:
+        compact_signatures_index(signatures_index)
+
+###################################################################################
+
+def delete_signatures_index(signatures_index, file_names, max_deleted_ratio=0.1):
+
+    file_names = set(file_names)
+
+    for i, fn in enumerate(signatures_index['file_names']):
+        if fn in file_names:
+            signatures_index['deleted'].add(i)
+
+    save_signatures_index_manifest(signatures_index)
+
+    if len(signatures_index['deleted']) > max_deleted_ratio * len(signatures_index['file_names']):
+        compact_signatures_index(signatures_index)
+
+###################################################################################
+
+def compact_signatures_index(signatures_index):
+
+    # Merges all segments into one without the deleted rows
+    # Rows ids of the remaining rows change
+
+    keep = numpy.ones(len(signatures_index['file_names']), dtype=bool)
+    keep[sorted(signatures_index['deleted'])] = False
+
+    counts = numpy.concatenate([numpy.diff(to_numpy(seg[0])) for seg in signatures_index['segments']] + [numpy.zeros(0, dtype=numpy.int64)])
+    indices = numpy.concatenate([to_numpy(seg[1]) for seg in signatures_index['segments']] + [numpy.zeros(0, dtype=numpy.int32)])
+    values = numpy.concatenate([to_numpy(seg[2]) for seg in signatures_index['segments']] + [numpy.zeros(0, dtype=numpy.float32)])
+
+    keep_values = numpy.repeat(keep, counts)
+
+    indptr = numpy.zeros(int(keep.sum())+1, dtype=numpy.int64)
+    numpy.cumsum(counts[keep], out=indptr[1:])
+
+    file_names = [fn for fn, k in zip(signatures_index['file_names'], keep) if k]
+
+    segment = [file_names, indptr, indices[keep_values], values[keep_values]]
+
+    old_segments_files = signatures_index['segments_files']
+
+    # New generation keeps the compacted segment file name unique
+    signatures_index['generation'] += 1
+
+    signatures_index['segments'] = []
+    signatures_index['segments_columns'] = []
+    signatures_index['segments_files'] = []
+    signatures_index['segments_offsets'] = [0]
+    signatures_index['file_names'] = []
+    signatures_index['deleted'] = set()
+
+    if signatures_index['index_dir']:
+        segment_file = 'SEGMENT_%04d_%08d.pickle' % (signatures_index['generation'], 0)
+
+        save_pickle(segment, os.path.join(signatures_index['index_dir'], segment_file), verbose=False)
+
+    else:
+        segment_file = None
+
+    add_signatures_index_segment(signatures_index, segment)
+    signatures_index['segments_files'].append(segment_file)
+
+    save_signatures_index_manifest(signatures_index)
+
+    # Old segments are removed only after the new manifest is saved
+    if signatures_index['index_dir']:
+        for f in old_segments_files:
+            os.remove(os.path.join(signatures_index['index_dir'], f))
+
+###################################################################################
+
+def get_signatures_index_top_k(trg_signature_dictionary,
+                               signatures_index,
+                               k,
+                               mismatch_penalty=10,
+                               p=3
+                               ):
+
+    # Top-k over all segments with deleted rows skipped
+
+    # Target keys outside of the index keys only extend the union
+    num_keys = max([signatures_index['global_union'].shape[0]] + [key+1 for key in trg_signature_dictionary])
+
+    global_union = np.arange(num_keys)
+
+    deleted = sorted(signatures_index['deleted'])
+
+    dists_list = []
+    idxs_list = []
+
+    for seg, seg_columns, sidx, eidx in zip(signatures_index['segments'],
+                                            signatures_index['segments_columns'],
+                                            signatures_index['segments_offsets'][:-1],
+                                            signatures_index['segments_offsets'][1:]
+                                            ):
+
+        dists = get_sparse_distances_np(trg_signature_dictionary,
+                                        seg,
+                                        global_union,
+                                        mismatch_penalty=mismatch_penalty,
+                                        p=p,
+                                        sX_columns=seg_columns
+                                        )
+
+        seg_deleted = [i-sidx for i in deleted if sidx <= i < eidx]
+
+        if seg_deleted:
+            dists[np.asarray(seg_deleted)] = np.inf
+
+        idxs = get_top_k_indices(dists, k)
+
+        dists_list.append(dists[idxs])
+        idxs_list.append(idxs + sidx)
+
+    if not dists_list:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    top_dists, top_idxs = merge_top_k(dists_list, idxs_list, k)
+
+    # Less than k live rows
+    live = top_dists < np.inf
+
+    return top_dists[live], top_idxs[live]
+
+###################################################################################
+
+def search_master_MIDI(midi,
+                       trg_sigs,
+                       sigs_dicts,
+                       X,
+                       global_union,
+                       monster_dir,
+                       files_index,
+                       output_dir,
+                       number_of_top_matches_to_copy,
+                       tv,
+                       mismatch_penalty,
+                       p,
+                       copy_pool=None,
+                       copy_jobs=None,
+                       X_counts=None,
+                       inv_index=None,
+                       min_shared_keys=1,
+                       ivf_index=None,
+                       nprobe=8,
+                       query_cache=None,
+                       search_engine=None
+                       ):
+
+    inp_fn = os.path.basename(midi)
+
+    print('=' * 70)
+    print('Processing MIDI file:', inp_fn)
+    print('=' * 70)
+
+    matches_list = []
+
+    if type(X) != tuple and type(X) != dict and inv_index is None and ivf_index is None and query_cache is not None:
+        # Only the query cache misses are sent to the search_engine shards (if any)
+        top_dists, top_idxs = get_cached_top_k(trg_sigs,
+                                               X,
+                                               global_union,
+                                               number_of_top_matches_to_copy,
+                                               query_cache,
+                                               X_counts=X_counts,
+                                               mismatch_penalty=mismatch_penalty,
+                                               p=p,
+                                               search_engine=search_engine
+                                               )
+
+    elif search_engine is not None:
+        top_dists, top_idxs = sharded_search_top_k(search_engine,
+                                                   trg_sigs,
+                                                   number_of_top_matches_to_copy,
+                                                   mismatch_penalty=mismatch_penalty,
+                                                   p=p
+                                                   )
+
+    elif type(X) != tuple and type(X) != dict and inv_index is None and ivf_index is None:
+        # All transpositions are scanned in one sweep over X
+        top_dists, top_idxs = get_batched_distances_np(trg_sigs,
+                                                       X,
+                                                       global_union,
+                                                       X_counts=X_counts,
+                                                       mismatch_penalty=mismatch_penalty,
+                                                       p=p,
+                                                       top_k=number_of_top_matches_to_copy
+                                                       )
+
+    for i in tqdm.tqdm(range(len(trg_sigs))):
+
+        if inv_index is not None:
+            top_dists_i, idxs = get_inverted_index_top_k(trg_sigs[i],
+                                                         inv_index,
+                                                         global_union,
+                                                         number_of_top_matches_to_copy,
+                                                         mismatch_penalty=mismatch_penalty,
+                                                         p=p,
+                                                         min_shared_keys=min_shared_keys
+                                                         )
+
+            matches = list(zip(idxs.tolist(), top_dists_i.tolist()))
+
+        elif ivf_index is not None:
+            top_dists_i, idxs = get_ivf_top_k(trg_sigs[i],
+                                              X,
+                                              global_union,
+                                              ivf_index,
+                                              number_of_top_matches_to_copy,
+                                              nprobe=nprobe,
+                                              mismatch_penalty=mismatch_penalty,
+                                              p=p,
+                                              X_counts=X_counts
+                                              )
+
+            matches = list(zip(idxs.tolist(), top_dists_i.tolist()))
+
+        elif type(X) == dict:
+            top_dists_i, idxs = get_signatures_index_top_k(trg_sigs[i],
+                                                           X,
+                                                           number_of_top_matches_to_copy,
+                                                           mismatch_penalty=mismatch_penalty,
+                                                           p=p
+                                                           )
+
+            matches = list(zip(idxs.tolist(), top_dists_i.tolist()))
+
+        elif type(X) == tuple:
+            dists = get_sparse_distances_np(trg_sigs[i],
+                                            X,
+                                            global_union,
+                                            mismatch_penalty=mismatch_penalty,
+                                            p=p
+                                            )
+
+            idxs = get_top_k_indices(dists, number_of_top_matches_to_copy)
+
+            matches = list(zip(idxs.tolist(), dists[idxs].tolist()))
+
+        else:
+            matches = list(zip(top_idxs[i].tolist(), top_dists[i].tolist()))
+
+        matches_list.append(matches)
+
+    copy_master_MIDI_matches(midi,
+                             matches_list,
+                             sigs_dicts,
+                             monster_dir,
+                             files_index,
+                             output_dir,
+                             tv,
+                             copy_pool,
+                             copy_jobs
+                             )
+
+###################################################################################
+
+def copy_master_MIDI_matches(midi,
+                             matches_list,
+                             sigs_dicts,
+                             monster_dir,
+                             files_index,
+                             output_dir,
+                             tv,
+                             copy_pool=None,
+                             copy_jobs=None
+                             ):
+
+    # matches_list holds (idx, dist) matches for each transposition in tv
+
+    inp_fn = os.path.basename(midi)
+
+    out_dir = os.path.splitext(inp_fn)[0]
+
+    seen = set()
+    rseen = set()
+    missing = set()
+
+    for i, matches in enumerate(matches_list):
+
+        os.makedirs(output_dir+'/'+out_dir, exist_ok=True)
+
+        for idx, dist in matches:
+            
+            fn = signature_file_name(sigs_dicts, idx)
+    
+            new_fn = output_dir+out_dir+'/'+str(dist)+'_'+str(tv[i])+'_'+fn+'.mid'
+    
+            if fn not in seen and dist not in rseen:
+
+                src_fn = get_files_index_path(files_index, monster_dir, fn)
+
+                if src_fn is None:
+                    missing.add(fn)
+
+                else:
+                    if copy_pool is not None:
+                        copy_jobs.append(copy_pool.submit(shutil.copy2, src_fn, new_fn))
+
+                    else:
+                        shutil.copy2(src_fn, new_fn)
+
+                    seen.add(fn)
+                    rseen.add(dist)
+
+    if missing:
+        print('Could not find', len(missing), 'matched MIDIs in', monster_dir, '| skipped them...')
+
+###################################################################################
+
+def get_master_MIDIs_signatures(master_midis,
+                                transpose_factor=6,
+                                convert_counts_to_ratios=True,
+                                omit_drums=True,
+                                number_of_signatures_workers=0,
+                                signatures_cache_file=None
+                                ):
+
+    # Yields master MIDIs signatures in master_midis order
+
+    # Pipelined mode: master MIDIs signatures are computed ahead by a process pool
+    # while the consumer runs the distances scans
+
+    # Master MIDIs signatures cache is keyed by master MIDI file MD5 and signatures params
+    # so only new, changed or differently parametrized master MIDIs are processed
+    # Entries of the MIDIs which are no longer in master_midis are dropped on save
+
+    get_signature = functools.partial(get_MIDI_signature,
+                                      transpose_factor=transpose_factor,
+                                      convert_counts_to_ratios=convert_counts_to_ratios,
+                                      omit_drums=omit_drums
+                                      )
+
+    if signatures_cache_file:
+        if os.path.exists(signatures_cache_file):
+            signatures_cache = load_pickle(signatures_cache_file, verbose=False)
+
+        else:
+            signatures_cache = {}
+
+        cache_keys = [(file_md5(midi), transpose_factor, convert_counts_to_ratios, omit_drums) for midi in master_midis]
+
+        todo_midis = []
+        todo_keys = set()
+
+        for midi, key in zip(master_midis, cache_keys):
+            if key not in signatures_cache and key not in todo_keys:
+                todo_midis.append(midi)
+                todo_keys.add(key)
+
+        print('=' * 70)
+        print('Master MIDIs signatures cache hits:', len(master_midis)-len(todo_midis), '/', len(master_midis))
+
+    else:
+        signatures_cache = None
+        todo_midis = master_midis
+
+    if number_of_signatures_workers > 0:
+        signatures_pool = multiprocessing.Pool(number_of_signatures_workers)
+        todo_sigs = signatures_pool.imap(get_signature, todo_midis)
+
+    else:
+        signatures_pool = None
+        todo_sigs = map(get_signature, todo_midis)
+
+    try:
+        if signatures_cache is not None:
+            for key in cache_keys:
+
+                # todo_sigs yields signatures for the cache misses in cache_keys order
+                if key not in signatures_cache:
+                    signatures_cache[key] = next(todo_sigs)
+
+                yield signatures_cache[key]
+
+        else:
+            for sig in todo_sigs:
+                yield sig
+
+    finally:
+        if signatures_pool is not None:
+            signatures_pool.terminate()
+
+        if signatures_cache is not None:
+            master_md5s = set(key[0] for key in cache_keys)
+
+            signatures_cache = {key: sig for key, sig in signatures_cache.items() if key[0] in master_md5s}
+
+            save_pickle(signatures_cache, signatures_cache_file, verbose=False)
+
+###################################################################################
+
+def search_and_filter(sigs_dicts,
+                      X,
+                      global_union,
+                      monster_dir = './Monster-MIDI-Dataset/MIDIs/',
+                      master_dir = './Master-MIDI-Dataset/',
+                      output_dir = './Output-MIDI-Dataset/',
+                      number_of_top_matches_to_copy = 30,
+                      transpose_factor=6,
+                      convert_counts_to_ratios=True,
+                      omit_drums=True,
+                      mismatch_penalty=10,
+                      p=3,
+                      number_of_signatures_workers=0,
+                      number_of_copy_workers=0,
+                      use_signatures_cache=True,
+                      signatures_cache_file=None,
+                      inverted_index=None,
+                      min_shared_keys=1,
+                      ivf_index=None,
+                      nprobe=8,
+                      query_cache=None,
+                      number_of_search_workers=0
+                     ):
+
+    transpose_factor = max(0, min(6, transpose_factor))
+    
+    if transpose_factor > 0:
+        
+        tsidx = -transpose_factor
+        teidx = transpose_factor
+    
+    else:
+        tsidx = 0
+        teidx = 1
+
+    master_midis = create_files_list([master_dir])
+
+    os.makedirs(master_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # MIDIs added to monster_dir are found in the dataset layout and added to the files index
+    # Delete MIDIs_FILES_INDEX.pickle next to monster_dir after moving or removing dataset MIDIs
+    files_index = create_files_index(monster_dir, verbose=False)
+    files_index_size = len(files_index)
+
+    # Master MIDIs signatures cache is kept in master_dir by default
+
+    if not use_signatures_cache:
+        signatures_cache_file = None
+
+    elif signatures_cache_file is None:
+        signatures_cache_file = os.path.join(master_dir, 'MASTER_MIDIS_SIGNATURES_CACHE.pickle')
+    
+    masters_sigs = get_master_MIDIs_signatures(master_midis,
+                                               transpose_factor,
+                                               convert_counts_to_ratios,
+                                               omit_drums,
+                                               number_of_signatures_workers,
+                                               signatures_cache_file
+                                               )
+
+    # Output copying can be run by a thread pool while the main process runs the distances scans
+
+    if number_of_copy_workers > 0:
+        copy_pool = ThreadPoolExecutor(number_of_copy_workers)
+
+    else:
+        copy_pool = None
+
+    copy_jobs = []
+
+    if type(X) != tuple and type(X) != dict and inverted_index is None:
+        X_counts = precompute_signatures_counts(X)
+
+    else:
+        X_counts = None
+
+    # Dense X rows shards are scanned by number_of_search_workers processes
+
+    if number_of_search_workers > 0 and X_counts is not None and ivf_index is None:
+        search_engine = create_sharded_search_engine(X, global_union, number_of_search_workers)
+
+    else:
+        search_engine = None
+
+    try:
+        for midi, trg_sigs in zip(master_midis, masters_sigs):
+            search_master_MIDI(midi,
+                               trg_sigs,
+                               sigs_dicts,
+                               X,
+                               global_union,
+                               monster_dir,
+                               files_index,
+                               output_dir,
+                               number_of_top_matches_to_copy,
+                               list(range(tsidx, teidx)),
+                               mismatch_penalty,
+                               p,
+                               copy_pool,
+                               copy_jobs,
+                               X_counts,
+                               inverted_index,
+                               min_shared_keys,
+                               ivf_index,
+                               nprobe,
+                               query_cache,
+                               search_engine
+                               )
+
+    finally:
+        masters_sigs.close()
+
+        if copy_pool is not None:
+            copy_pool.shutdown(wait=True)
+
+        if search_engine is not None:
+            close_sharded_search_engine(search_engine)
+
+    for job in copy_jobs:
+        job.result()
+
+    # MIDIs found outside of the files index are saved into it
+    if len(files_index) > files_index_size:
+        save_pickle(files_index, get_files_index_file(monster_dir), verbose=False)
+
+    if query_cache is not None:
+        print('=' * 70)
+        print('Query cache hits:', query_cache['hits'], '| misses:', query_cache['misses'])
+
+    print('=' * 70)
+    print('Done!')
+    print('=' * 70)
+
+###################################################################################
+
+def search_and_filter_streaming(signatures_store,
+                                monster_dir = './Monster-MIDI-Dataset/MIDIs/',
+                                master_dir = './Master-MIDI-Dataset/',
+                                output_dir = './Output-MIDI-Dataset/',
+                                number_of_top_matches_to_copy = 30,
+                                transpose_factor=6,
+                                convert_counts_to_ratios=True,
+                                omit_drums=True,
+                                mismatch_penalty=10,
+                                p=3,
+                                rows_block_size=100000,
+                                number_of_signatures_workers=0,
+                                number_of_copy_workers=0,
+                                use_signatures_cache=True,
+                                signatures_cache_file=None
+                               ):
+
+    # Low memory search mode: all master MIDIs signatures are computed first and then
+    # the signatures store is streamed only once for all of them
+
+    transpose_factor = max(0, min(6, transpose_factor))
+    
+    if transpose_factor > 0:
+        
+        tsidx = -transpose_factor
+        teidx = transpose_factor
+    
+    else:
+        tsidx = 0
+        teidx = 1
+
+    master_midis = create_files_list([master_dir])
+
+    os.makedirs(master_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # MIDIs added to monster_dir are found in the dataset layout and added to the files index
+    # Delete MIDIs_FILES_INDEX.pickle next to monster_dir after moving or removing dataset MIDIs
+    files_index = create_files_index(monster_dir, verbose=False)
+    files_index_size = len(files_index)
+
+    # Master MIDIs signatures cache is kept in master_dir by default
+
+    if not use_signatures_cache:
+        signatures_cache_file = None
+
+    elif signatures_cache_file is None:
+        signatures_cache_file = os.path.join(master_dir, 'MASTER_MIDIS_SIGNATURES_CACHE.pickle')
+
+    print('=' * 70)
+    print('Computing master MIDIs signatures...')
+
+    masters_sigs = list(get_master_MIDIs_signatures(master_midis,
+                                                    transpose_factor,
+                                                    convert_counts_to_ratios,
+                                                    omit_drums,
+                                                    number_of_signatures_workers,
+                                                    signatures_cache_file
+                                                    ))
+
+    trg_sigs = [sig for sigs in masters_sigs for sig in sigs]
+
+    print('=' * 70)
+    print('Streaming signatures store for', len(trg_sigs), 'master MIDIs signatures...')
+    print('=' * 70)
+
+    top_dists, top_idxs = get_streaming_top_k(trg_sigs,
+                                              signatures_store,
+                                              number_of_top_matches_to_copy,
+                                              convert_counts_to_ratios=convert_counts_to_ratios,
+                                              omit_drums=omit_drums,
+                                              mismatch_penalty=mismatch_penalty,
+                                              p=p,
+                                              rows_block_size=rows_block_size
+                                              )
+
+    print('=' * 70)
+    print('Copying matches...')
+
+    if number_of_copy_workers > 0:
+        copy_pool = ThreadPoolExecutor(number_of_copy_workers)
+
+    else:
+        copy_pool = None
+
+    copy_jobs = []
+
+    tidx = 0
+
+    try:
+        for midi, sigs in tqdm.tqdm(list(zip(master_midis, masters_sigs))):
+
+            matches_list = []
+
+            for i in range(tidx, tidx+len(sigs)):
+                matches_list.append(list(zip(top_idxs[i].tolist(), top_dists[i].tolist())))
+
+            tidx += len(sigs)
+
+            copy_master_MIDI_matches(midi,
+                                     matches_list,
+                                     signatures_store,
+                                     monster_dir,
+                                     files_index,
+                                     output_dir,
+                                     list(range(tsidx, teidx)),
+                                     copy_pool,
+                                     copy_jobs
+                                     )
+
+    finally:
+        if copy_pool is not None:
+            copy_pool.shutdown(wait=True)
+
+    for job in copy_jobs:
+        job.result()
+
+    # MIDIs found outside of the files index are saved into it
+    if len(files_index) > files_index_size:
+        save_pickle(files_index, get_files_index_file(monster_dir), verbose=False)
+
+    print('=' * 70)
+    print('Done!')
+    print('=' * 70)
+
+###################################################################################
+
+# Sharded multi-process search (CPU)
+#
+# X is copied once into shared memory and every worker process attaches to it
+# and scans its own rows shard. Workers return their shards top-k which
+# are merged in the parent, so the CPU path uses all the cores.
+#
+# Shared memory X is a host array so workers search it with numpy only
+# and never touch CuPy / CUDA, even when the parent process uses CuPy.
+
+SHARDED_SEARCH_WORKER_DATA = {}
+
+###################################################################################
+
+def init_sharded_search_worker(shm_name, shape, dtype, global_union, X_counts):
+
+    # Shared memory X is attached once per worker process
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    SHARDED_SEARCH_WORKER_DATA['shm'] = shm
+    SHARDED_SEARCH_WORKER_DATA['X'] = numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    SHARDED_SEARCH_WORKER_DATA['global_union'] = global_union
+    SHARDED_SEARCH_WORKER_DATA['X_counts'] = X_counts
+
+###################################################################################
+
+def sharded_search_worker(job):
+
+    sidx, eidx, trg_signatures_dictionaries, k, mismatch_penalty, p = job
+
+    top_dists, top_idxs = get_batched_distances_np(trg_signatures_dictionaries,
+                                                   SHARDED_SEARCH_WORKER_DATA['X'][sidx:eidx],
+                                                   SHARDED_SEARCH_WORKER_DATA['global_union'],
+                                                   X_counts=SHARDED_SEARCH_WORKER_DATA['X_counts'][sidx:eidx],
+                                                   mismatch_penalty=mismatch_penalty,
+                                                   p=p,
+                                                   top_k=k
+                                                   )
+
+    return to_numpy(top_dists), to_numpy(top_idxs) + sidx
+
+###################################################################################
+
+def create_sharded_search_engine(X,
+                                 global_union,
+                                 number_of_workers=multiprocessing.cpu_count(),
+                                 number_of_shards=None
+                                 ):
+
+    # Returns sharded search engine dict for sharded_search_top_k()
+    # Please call close_sharded_search_engine() when done to free the shared memory
+    # number_of_shards=None is one shard per worker
+
+    X = to_numpy(X)
+
+    if number_of_shards is None:
+        number_of_shards = number_of_workers
+
+    number_of_shards = max(1, min(number_of_shards, X.shape[0]))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, X.nbytes))
+
+    X_shared = numpy.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)
+    X_shared[:] = X
+
+    X_counts = numpy.count_nonzero(X > 0, axis=1)
+
+    bounds = numpy.linspace(0, X.shape[0], number_of_shards+1).astype(numpy.int64).tolist()
+
+    pool = multiprocessing.Pool(number_of_workers,
+                                initializer=init_sharded_search_worker,
+                                initargs=(shm.name, X.shape, X.dtype, to_numpy(global_union), X_counts)
+                                )
+
+    return {'pool': pool,
+            'shm': shm,
+            'shards': list(zip(bounds[:-1], bounds[1:])),
+            'number_of_workers': number_of_workers
+            }
+
+###################################################################################
+
+def close_sharded_search_engine(search_engine):
+
+    search_engine['pool'].terminate()
+    search_engine['pool'].join()
+
+    search_engine['shm'].close()
+    search_engine['shm'].unlink()
+
+###################################################################################
+
+def sharded_search_top_k(search_engine,
+                         trg_signatures_dictionaries,
+                         k,
+                         mismatch_penalty=10,
+                         p=3
+                         ):
+
+    # Q x k distances and X rows indices like get_batched_distances_np() with top_k=k
+
+    jobs = [(sidx, eidx, trg_signatures_dictionaries, k, mismatch_penalty, p) for sidx, eidx in search_engine['shards']]
+
+    shards_results = search_engine['pool'].map(sharded_search_worker, jobs, chunksize=1)
+
+    top_dists = []
+    top_idxs = []
+
+    for i in range(len(trg_signatures_dictionaries)):
+        dists, idxs = merge_top_k([numpy.asarray(r[0][i]) for r in shards_results],
+                                  [numpy.asarray(r[1][i]) for r in shards_results],
+                                  k
+                                  )
+
+        top_dists.append(dists)
+        top_idxs.append(idxs)
+
+    return top_dists, top_idxs
+
+###################################################################################
+
+def benchmark_sharded_search(X,
+                             global_union,
+                             trg_signatures_dictionaries,
+                             workers_counts=[1, 2, 4, 8, 16, 32, 64],
+                             k=30,
+                             mismatch_penalty=10,
+                             p=3
+                             ):
+
+    # Queries per second of the sharded search for every workers count
+    # Workers counts above the number of CPU cores are skipped
+
+    print('=' * 70)
+    print('Benchmarking sharded search on', multiprocessing.cpu_count(), 'CPU cores...')
+
+    results = {}
+
+    for number_of_workers in workers_counts:
+
+        if number_of_workers > multiprocessing.cpu_count():
+            continue
+
+        search_engine = create_sharded_search_engine(X, global_union, number_of_workers)
+
+        try:
+            # Warm-up run attaches the shared memory in all workers
+            sharded_search_top_k(search_engine, trg_signatures_dictionaries[:1], k, mismatch_penalty, p)
+
+            start_time = time.time()
+
+            sharded_search_top_k(search_engine, trg_signatures_dictionaries, k, mismatch_penalty, p)
+
+            elapsed_time = time.time() - start_time
+
+        finally:
+            close_sharded_search_engine(search_engine)
+
+        results[number_of_workers] = len(trg_signatures_dictionaries) / elapsed_time
+
+        print('Workers:', number_of_workers, '|', round(results[number_of_workers], 2), 'queries per second',
+              '| speed-up:', round(results[number_of_workers] / results[min(results)], 2))
+
+    print('=' * 70)
+
+    return results
+
+###################################################################################
+
+# Distributed search
+#
+# Every node runs a search worker over its own signatures shard and answers
+# batched top-k requests over TCP. Target keys which are not in a shard are
+# counted as mismatches, so shards distances are the same as over all the data. The coordinator fans the targets out to all
+# workers and merges the top-k matches (by file names) of the workers which
+# answered in time, so a slow or dead worker only drops its own shard.
+#
+# Messages are 8 bytes (big-endian) length prefixed JSON objects
+# Request:  {"signatures": [{key: value, ...}, ...], "k": 30, "mismatch_penalty": 10, "p": 3}
+# Response: {"dists": [[...], ...], "file_names": [[...], ...]} or {"error": ...}
+
+def send_message(sock, message):
+
+    data = json.dumps(message).encode()
+
+    sock.sendall(struct.pack('>Q', len(data)) + data)
+
+###################################################################################
+
+def recv_exactly(sock, size):
+
+    chunks = []
+
+    while size > 0:
+        chunk = sock.recv(min(size, 1048576))
+
+        if not chunk:
+            raise ConnectionError('Connection closed')
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b''.join(chunks)
+
+###################################################################################
+
+def recv_message(sock):
+
+    size = struct.unpack('>Q', recv_exactly(sock, 8))[0]
+
+    return json.loads(recv_exactly(sock, size))
+
+###################################################################################
+
+def create_search_worker_server(sigs_dicts,
+                                X,
+                                global_union,
+                                host='127.0.0.1',
+                                port=8766
+                                ):
+
+    # Returns a ready to serve_forever() ThreadingTCPServer over the X shard
+
+    X_counts = precompute_signatures_counts(X)
+
+    class SearchWorkerRequestHandler(socketserver.BaseRequestHandler):
+
+        def handle(self):
+
+            try:
+                request = recv_message(self.request)
+
+                trg_sigs = [{int(k): float(v) for k, v in sig.items()} for sig in request['signatures']]
+
+                top_dists, top_idxs = get_batched_distances_np(trg_sigs,
+                                                               X,
+                                                               global_union,
+                                                               X_counts=X_counts,
+                                                               mismatch_penalty=request.get('mismatch_penalty', 10),
+                                                               p=request.get('p', 3),
+                                                               top_k=int(request['k'])
+                                                               )
+
+                response = {'dists': to_numpy(top_dists).tolist(),
+                            'file_names': [[signature_file_name(sigs_dicts, idx) for idx in idxs] for idxs in to_numpy(top_idxs).tolist()]
+                            }
+
+            except Exception as ex:
+                response = {'error': str(ex)}
+
+            try:
+                send_message(self.request, response)
+
+            except OSError:
+                pass
+
+    server = socketserver.ThreadingTCPServer((host, port), SearchWorkerRequestHandler, bind_and_activate=False)
+
+    server.allow_reuse_address = True
+    server.daemon_threads = True
+
+    server.server_bind()
+    server.server_activate()
+
+    return server
+
+###################################################################################
+
+def run_search_worker(sigs_dicts,
+                      X,
+                      global_union,
+                      host='127.0.0.1',
+                      port=8766
+                      ):
+
+    server = create_search_worker_server(sigs_dicts, X, global_union, host, port)
+
+    print('=' * 70)
+    print('Search worker is listening on', host + ':' + str(port), 'with', X.shape[0], 'signatures')
+    print('=' * 70)
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+
+###################################################################################
+
+def query_search_worker(worker_address, request, timeout):
+
+    with socket.create_connection(worker_address, timeout=timeout) as sock:
+
+        # Timeout applies to every socket operation of the request
+        sock.settimeout(timeout)
+
+        send_message(sock, request)
+
+        response = recv_message(sock)
+
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+
+    return response
+
+###################################################################################
+
+def distributed_search_top_k(workers_addresses,
+                             trg_signatures_dictionaries,
+                             k,
+                             mismatch_penalty=10,
+                             p=3,
+                             timeout=30,
+                             verbose=True
+                             ):
+
+    # Returns per target top-k distances and file names lists
+    # and the list of the workers addresses which failed or timed out
+
+    request = {'signatures': [{str(key): value for key, value in sig.items()} for sig in trg_signatures_dictionaries],
+               'k': k,
+               'mismatch_penalty': mismatch_penalty,
+               'p': p
+               }
+
+    responses = []
+    failed_workers = []
+
+    with ThreadPoolExecutor(max(1, len(workers_addresses))) as executor:
+
+        jobs = [executor.submit(query_search_worker, tuple(address), request, timeout) for address in workers_addresses]
+
+        for address, job in zip(workers_addresses, jobs):
+
+            try:
+                responses.append(job.result())
+
+            except Exception as ex:
+                failed_workers.append(address)
+
+                if verbose:
+                    print('Search worker', address, 'failed:', repr(ex))
+
+    top_dists = []
+    top_file_names = []
+
+    for i in range(len(trg_signatures_dictionaries)):
+
+        matches = sorted((dist, fn) for response in responses for dist, fn in zip(response['dists'][i], response['file_names'][i]))[:k]
+
+        top_dists.append([m[0] for m in matches])
+        top_file_names.append([m[1] for m in matches])
+
+    return top_dists, top_file_names, failed_workers
+
+###################################################################################
+
+# Search service
+#
+# The signatures matrix is loaded once and held in memory by a local HTTP server
+# Queries of concurrent requests are micro-batched into one batched distances sweep
+#
+# GET  /status returns the server stats
+# POST /search with a MIDI file body (?top_k=30&transpose_factor=6 URL params)
+# or with a JSON body {"midi_path": ..., "top_k": ..., "transpose_factor": ...}
+# or {"signature": {key: value, ...}, "top_k": ...} returns JSON top-k matches
+# [{"file_name": ..., "distance": ..., "transpose": ...}, ...] sorted by distance
+
+def merge_transpositions_matches(matches_list, sigs_dicts, tv, k):
+
+    # Same files and same distances are kept only once like in the search output
+
+    seen = set()
+    rseen = set()
+
+    merged = []
+
+    for i, matches in enumerate(matches_list):
+        for idx, dist in matches:
+
+            fn = signature_file_name(sigs_dicts, idx)
+
+            if fn not in seen and dist not in rseen:
+                merged.append({'file_name': fn, 'distance': dist, 'transpose': tv[i]})
+
+                seen.add(fn)
+                rseen.add(dist)
+
+    merged.sort(key=lambda x: x['distance'])
+
+    return merged[:k]
+
+###################################################################################
+
+def search_server_batch(batch,
+                        X,
+                        global_union,
+                        X_counts,
+                        mismatch_penalty,
+                        p
+                        ):
+
+    # Answers all batch queries with one batched distances sweep over X
+
+    trg_sigs = [trg for query in batch for trg in query['trg_sigs']]
+
+    top_dists, top_idxs = get_batched_distances_np(trg_sigs,
+                                                   X,
+                                                   global_union,
+                                                   X_counts=X_counts,
+                                                   mismatch_penalty=mismatch_penalty,
+                                                   p=p,
+                                                   top_k=max([query['top_k'] for query in batch])
+                                                   )
+
+    top_dists = to_numpy(top_dists).tolist()
+    top_idxs = to_numpy(top_idxs).tolist()
+
+    sidx = 0
+
+    for query in batch:
+
+        eidx = sidx + len(query['trg_sigs'])
+
+        query['matches_list'] = [list(zip(top_idxs[i], top_dists[i]))[:query['top_k']] for i in range(sidx, eidx)]
+
+        sidx = eidx
+
+###################################################################################
+
+def search_server_batcher(queries,
+                          X,
+                          global_union,
+                          X_counts,
+                          mismatch_penalty,
+                          p,
+                          max_batch_size,
+                          max_batch_wait_time,
+                          stats
+                          ):
+
+    # Collects queries for up to max_batch_wait_time seconds (or max_batch_size queries)
+    # and answers all of them with one batched distances sweep over X
+
+    while True:
+
+        batch = [queries.get()]
+
+        if batch[0] is None:
+            break
+
+        deadline = time.time() + max_batch_wait_time
+
+        while len(batch) < max_batch_size:
+
+            timeout = deadline - time.time()
+
+            if timeout <= 0:
+                break
+
+            try:
+                query = queries.get(timeout=timeout)
+
+            except queue.Empty:
+                break
+
+            if query is None:
+                queries.put(None)
+                break
+
+            batch.append(query)
+
+        try:
+            search_server_batch(batch, X, global_union, X_counts, mismatch_penalty, p)
+
+        except Exception as ex:
+
+            # A failed sweep is re-run query by query so only the bad queries get the error
+            if len(batch) == 1:
+                batch[0]['error'] = str(ex)
+
+            else:
+                for query in batch:
+                    try:
+                        search_server_batch([query], X, global_union, X_counts, mismatch_penalty, p)
+
+                    except Exception as ex:
+                        query['error'] = str(ex)
+
+        stats['queries'] += len(batch)
+        stats['batches'] += 1
+
+        for query in batch:
+            query['done'].set()
+
+###################################################################################
+
+def create_search_server(sigs_dicts,
+                         X,
+                         global_union,
+                         host='127.0.0.1',
+                         port=8765,
+                         number_of_top_matches=30,
+                         transpose_factor=6,
+                         convert_counts_to_ratios=True,
+                         omit_drums=True,
+                         mismatch_penalty=10,
+                         p=3,
+                         max_batch_size=64,
+                         max_batch_wait_time=0.005,
+                         query_cache_size=4096,
+                         max_top_k=1000
+                         ):
+
+    # Returns a ready to serve_forever() ThreadingHTTPServer over the dense X
+    # server.shutdown() and server.server_close() stop it
+
+    queries = queue.Queue()
+
+    stats = {'rows': int(X.shape[0]), 'queries': 0, 'batches': 0}
+
+    X_counts = precompute_signatures_counts(X)
+
+    batcher = threading.Thread(target=search_server_batcher,
+                               args=(queries,
+                                     X,
+                                     global_union,
+                                     X_counts,
+                                     mismatch_penalty,
+                                     p,
+                                     max_batch_size,
+                                     max_batch_wait_time,
+                                     stats
+                                     ),
+                               daemon=True
+                               )
+
+    batcher.start()
+
+    if query_cache_size > 0:
+        query_cache = create_query_cache(query_cache_size)
+
+    else:
+        query_cache = None
+
+    def search(trg_sigs, tv, top_k):
+
+        if not trg_sigs:
+            return []
+
+        # Only the query cache misses are sent to the batcher
+
+        matches_list = [None] * len(trg_sigs)
+
+        if query_cache is not None:
+            keys = [(signature_hash(trg), mismatch_penalty, p) for trg in trg_sigs]
+
+            for i, key in enumerate(keys):
+                cached = query_cache_get(query_cache, key, top_k)
+
+                if cached is not None:
+                    matches_list[i] = list(zip(cached[1], cached[0]))
+
+        misses = [i for i, matches in enumerate(matches_list) if matches is None]
+
+        if misses:
+            query = {'trg_sigs': [trg_sigs[i] for i in misses], 'top_k': top_k, 'done': threading.Event()}
+
+            queries.put(query)
+            query['done'].wait()
+
+            if 'error' in query:
+                raise RuntimeError(query['error'])
+
+            for i, matches in zip(misses, query['matches_list']):
+                matches_list[i] = matches
+
+                if query_cache is not None:
+                    query_cache_put(query_cache, keys[i], top_k, [m[1] for m in matches], [m[0] for m in matches])
+
+        return merge_transpositions_matches(matches_list, sigs_dicts, tv, top_k)
+
+    class SearchRequestHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, code, data):
+
+            body = json.dumps(data).encode()
+
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+
+            if urllib.parse.urlparse(self.path).path == '/status':
+
+                if query_cache is not None:
+                    self.send_json(200, dict(stats, cache_hits=query_cache['hits'], cache_misses=query_cache['misses']))
+
+                else:
+                    self.send_json(200, stats)
+
+            else:
+                self.send_json(404, {'error': 'Unknown path'})
+
+        def do_POST(self):
+
+            url = urllib.parse.urlparse(self.path)
+
+            if url.path != '/search':
+                self.send_json(404, {'error': 'Unknown path'})
+                return
+
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body)
+
+                else:
+                    params = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+                top_k = int(params.get('top_k', number_of_top_matches))
+                tf = max(0, min(6, int(params.get('transpose_factor', transpose_factor))))
+
+                # Requests are checked here so one bad request can not fail the whole batch
+                # and a huge top_k does not slow down the other batch queries
+                if top_k < 1:
+                    self.send_json(400, {'error': 'top_k must be at least 1'})
+                    return
+
+                top_k = min(top_k, max_top_k)
+
+                if 'signature' in params:
+                    trg_sigs = [{int(k): float(v) for k, v in params['signature'].items()}]
+                    tv = [0]
+
+                    if not all(math.isfinite(v) and v >= 0 for v in trg_sigs[0].values()):
+                        self.send_json(400, {'error': 'Signature values must be finite and non-negative'})
+                        return
+
+                else:
+                    trg_sigs = get_MIDI_signature(params['midi_path'] if 'midi_path' in params else body,
+                                                  transpose_factor=tf,
+                                                  convert_counts_to_ratios=convert_counts_to_ratios,
+                                                  omit_drums=omit_drums
+                                                  )
+
+                    # Unreadable or corrupt MIDIs have no signatures
+                    if not trg_sigs:
+                        self.send_json(400, {'error': 'Could not read the MIDI signatures'})
+                        return
+
+                    tv = list(range(-tf, tf)) if tf > 0 else [0]
+
+                matches = search(trg_sigs, tv, top_k)
+
+            except Exception as ex:
+                self.send_json(400, {'error': str(ex)})
+                return
+
+            self.send_json(200, {'matches': matches})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), SearchRequestHandler)
+
+###################################################################################
+
+def run_search_server(sigs_dicts,
+                      X,
+                      global_union,
+                      host='127.0.0.1',
+                      port=8765,
+                      number_of_top_matches=30,
+                      transpose_factor=6,
+                      convert_counts_to_ratios=True,
+                      omit_drums=True,
+                      mismatch_penalty=10,
+                      p=3,
+                      max_batch_size=64,
+                      max_batch_wait_time=0.005,
+                      query_cache_size=4096,
+                      max_top_k=1000
+                      ):
+
+    server = create_search_server(sigs_dicts,
+                                  X,
+                                  global_union,
+                                  host,
+                                  port,
+                                  number_of_top_matches,
+                                  transpose_factor,
+                                  convert_counts_to_ratios,
+                                  omit_drums,
+                                  mismatch_penalty,
+                                  p,
+                                  max_batch_size,
+                                  max_batch_wait_time,
+                                  query_cache_size,
+                                  max_top_k
+                                  )
+
+    print('=' * 70)
+    print('Search server is listening on http://' + host + ':' + str(port) + '/')
+    print('=' * 70)
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+
+###################################################################################
+
+def get_MIDI_signature_data(path_to_MIDI_file):
+
+    # One MONSTER_SIGNATURES_DATA entry: [MIDI file name, [[key, count], ...]]
+    # with raw counts and drums, as expected by load_signatures()
+
+    sigs = get_MIDI_signature(path_to_MIDI_file,
+                              transpose_factor=0,
+                              convert_counts_to_ratios=False,
+                              omit_drums=False
+                              )
+
+    if sigs:
+        return [os.path.splitext(os.path.basename(path_to_MIDI_file))[0], [list(s) for s in sigs[0].items()]]
+
+    else:
+        return None
+
+###################################################################################
+
+def build_signatures_shards(datasets_paths=['./Monster-MIDI-Dataset/MIDIs/'],
+                            shards_dir='./Monster-MIDI-Dataset/SIGNATURES_DATA/SHARDS/',
+                            shard_size=10000,
+                            number_of_workers=multiprocessing.cpu_count(),
+                            chunksize=16,
+                            verbose=True
+                            ):
+
+    # Signatures are written shard by shard so an interrupted build loses at most one shard
+    # Re-running with the same shards_dir resumes from the first missing shard
+
+    os.makedirs(shards_dir, exist_ok=True)
+
+    # Files list and shards boundaries are frozen on the first run so shards do not move on resume
+    # MIDIs found later in datasets_paths are appended to the files list as extra shards
+    files_list_file = os.path.join(shards_dir, 'FILES_LIST.pickle')
+
+    def get_shards_bounds(start, end, size):
+        return [(i, min(i+size, end)) for i in range(start, end, size)]
+
+    if os.path.exists(files_list_file):
+        files_list_data = load_pickle(files_list_file, verbose=False)
+
+        # Older shards dirs have the files list only
+        if type(files_list_data) == list:
+            files_list_data = {'files_list': files_list_data, 'shard_size': shard_size}
+
+        if files_list_data['shard_size'] != shard_size:
+            if verbose:
+                print('=' * 70)
+                print('Shards dir was started with shard_size', files_list_data['shard_size'], '| resuming with it...')
+
+        filez = files_list_data['files_list']
+        shard_size = files_list_data['shard_size']
+
+        if 'shards_bounds' not in files_list_data:
+            files_list_data['shards_bounds'] = get_shards_bounds(0, len(filez), shard_size)
+
+        shards_bounds = files_list_data['shards_bounds']
+
+        frozen_files = set(os.path.abspath(f) for f in filez)
+
+        new_filez = sorted(f for f in create_files_list(datasets_paths, randomize_files_list=False, verbose=verbose)
+                           if os.path.abspath(f) not in frozen_files)
+
+        if new_filez:
+            new_shards_bounds = get_shards_bounds(len(filez), len(filez)+len(new_filez), shard_size)
+
+            if verbose:
+                print('=' * 70)
+                print('Found', len(new_filez), 'new MIDIs | appending them as', len(new_shards_bounds), 'new shards...')
+
+            filez.extend(new_filez)
+            shards_bounds.extend(new_shards_bounds)
+
+            save_pickle(files_list_data, files_list_file, verbose=False)
+
+    else:
+        filez = sorted(create_files_list(datasets_paths, randomize_files_list=False, verbose=verbose))
+        shards_bounds = get_shards_bounds(0, len(filez), shard_size)
+
+        save_pickle({'files_list': filez, 'shard_size': shard_size, 'shards_bounds': shards_bounds},
+                    files_list_file,
+                    verbose=False
+                    )
+
+    todo_shards = [(start, end) for start, end in shards_bounds
+                   if not os.path.exists(os.path.join(shards_dir, 'SHARD_%08d.pickle' % start))]
+
+    if verbose:
+        print('=' * 70)
+        print('Building signatures for', len(filez), 'MIDIs')
+        print('Shards done:', len(shards_bounds)-len(todo_shards), '/', len(shards_bounds))
+        print('=' * 70)
+
+    if not todo_shards:
+        return
+
+    pool = multiprocessing.Pool(number_of_workers)
+
+    try:
+        for start, end in todo_shards:
+
+            shard_files = filez[start:end]
+
+            shard = []
+
+            for sig in tqdm.tqdm(pool.imap(get_MIDI_signature_data, shard_files, chunksize=chunksize),
+                                 total=len(shard_files),
+                                 desc='Shard '+str(start)+'-'+str(end),
+                                 disable=not verbose
+                                 ):
+                if sig:
+                    shard.append(sig)
+
+            save_pickle(shard, os.path.join(shards_dir, 'SHARD_%08d.pickle' % start), verbose=False)
+
+    finally:
+        pool.terminate()
+
+    if verbose:
+        print('=' * 70)
+        print('Done!')
+        print('=' * 70)
+
+###################################################################################
+
+def merge_signatures_shards(shards_dir='./Monster-MIDI-Dataset/SIGNATURES_DATA/SHARDS/',
+                            output_file_name='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_DATA.pickle',
+                            store_dir=None,
+                            verbose=True
+                            ):
+
+    # Merges signatures shards into the signatures pickle and/or the signatures store
+
+    shards_files = sorted(f for f in os.listdir(shards_dir) if f.startswith('SHARD_') and f.endswith('.pickle'))
+
+    signatures_data = []
+
+    for f in tqdm.tqdm(shards_files, disable=not verbose):
+        signatures_data.extend(load_pickle(os.path.join(shards_dir, f), verbose=False))
+
+    if output_file_name:
+        save_pickle(signatures_data, output_file_name, verbose=verbose)
+
+    if store_dir:
+        save_signatures_store(signatures_data, store_dir, verbose=verbose)
+
+    return signatures_data
+
+###################################################################################
+
+print('Module is loaded!')
+print('Enjoy! :)')
+print('=' * 70)
+
+###################################################################################
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Monster MIDI Dataset search and filter')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build_signatures', help='Build (or resume building) the signatures data from MIDIs dirs')
+    build_parser.add_argument('datasets_paths', nargs='*', default=['./Monster-MIDI-Dataset/MIDIs/'])
+    build_parser.add_argument('--shards_dir', default='./Monster-MIDI-Dataset/SIGNATURES_DATA/SHARDS/')
+    build_parser.add_argument('--shard_size', type=int, default=10000)
+    build_parser.add_argument('--number_of_workers', type=int, default=multiprocessing.cpu_count())
+    build_parser.add_argument('--chunksize', type=int, default=16)
+    build_parser.add_argument('--output_file_name', default='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_DATA.pickle')
+    build_parser.add_argument('--store_dir', default=None)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the search server with the signatures matrix held in memory')
+    serve_parser.add_argument('--signatures_data', default='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_DATA.pickle')
+    serve_parser.add_argument('--dtype', default='float32', choices=SIGNATURES_DTYPES)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--number_of_top_matches', type=int, default=30)
+    serve_parser.add_argument('--transpose_factor', type=int, default=6)
+    serve_parser.add_argument('--keep_counts', action='store_true', help='Do not convert counts to ratios')
+    serve_parser.add_argument('--keep_drums', action='store_true', help='Do not omit drums')
+    serve_parser.add_argument('--mismatch_penalty', type=float, default=10)
+    serve_parser.add_argument('--p', type=int, default=3)
+    serve_parser.add_argument('--max_batch_size', type=int, default=64)
+    serve_parser.add_argument('--query_cache_size', type=int, default=4096)
+    serve_parser.add_argument('--max_top_k', type=int, default=1000)
+
+    worker_parser = subparsers.add_parser('search_worker', help='Run a distributed search worker over a signatures data shard')
+    worker_parser.add_argument('--store_dir', default='./Monster-MIDI-Dataset/SIGNATURES_DATA/MONSTER_SIGNATURES_STORE/')
+    worker_parser.add_argument('--shard_index', type=int, default=0)
+    worker_parser.add_argument('--number_of_shards', type=int, default=1)
+    worker_parser.add_argument('--dtype', default='float32', choices=SIGNATURES_DTYPES)
+    worker_parser.add_argument('--host', default='127.0.0.1')
+    worker_parser.add_argument('--port', type=int, default=8766)
+    worker_parser.add_argument('--keep_counts', action='store_true', help='Do not convert counts to ratios')
+    worker_parser.add_argument('--keep_drums', action='store_true', help='Do not omit drums')
+
+    args = parser.parse_args()
+
+    if args.command == 'build_signatures':
+        build_signatures_shards(args.datasets_paths,
+                                args.shards_dir,
+                                args.shard_size,
+                                args.number_of_workers,
+                                args.chunksize
+                                )
+
+        merge_signatures_shards(args.shards_dir,
+                                args.output_file_name,
+                                args.store_dir
+                                )
+
+    elif args.command == 'serve':
+        sigs_dicts = load_signatures(load_pickle(args.signatures_data),
+                                     convert_counts_to_ratios=not args.keep_counts,
+                                     omit_drums=not args.keep_drums
+                                     )
+
+        X, global_union = precompute_signatures(sigs_dicts, dtype=args.dtype)
+
+        run_search_server(sigs_dicts,
+                          X,
+                          global_union,
+                          host=args.host,
+                          port=args.port,
+                          number_of_top_matches=args.number_of_top_matches,
+                          transpose_factor=args.transpose_factor,
+                          convert_counts_to_ratios=not args.keep_counts,
+                          omit_drums=not args.keep_drums,
+                          mismatch_penalty=args.mismatch_penalty,
+                          p=args.p,
+                          max_batch_size=args.max_batch_size,
+                          query_cache_size=args.query_cache_size,
+                          max_top_k=args.max_top_k
+                          )
+
+    elif args.command == 'search_worker':
+        # Only this worker shard is read from the memory-mapped signatures store
+        sigs_dicts = load_signatures_store_shard(load_signatures_store(args.store_dir),
+                                                 args.shard_index,
+                                                 args.number_of_shards,
+                                                 convert_counts_to_ratios=not args.keep_counts,
+                                                 omit_drums=not args.keep_drums
+                                                 )
+
+        X, global_union = precompute_signatures(sigs_dicts, dtype=args.dtype)
+
+        run_search_worker(sigs_dicts,
+                          X,
+                          global_union,
+                          host=args.host,
+                          port=args.port
+                          )
 
 ###################################################################################
 # This is the end of the monster_search_and_filter Python module
@@ -0,0 +1,63 @@
+import contextlib
+import glob
+import io
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+SEEDS = sorted(glob.glob(os.path.join(ROOT, 'Seeds', '*.mid')))
+
+###################################################################################
+
+def load_colab_midi():
+
+    # midi_to_colab_audio needs FluidSynth at import time,
+    # so only its MIDI part (everything before pyFluidSynth) is loaded
+
+    with open(os.path.join(ROOT, 'midi_to_colab_audio.py')) as f:
+        src = f.read()
+
+    src = src[:src.index('"""\n================================================================================\n\n    pyFluidSynth')]
+
+    module = types.ModuleType('midi_to_colab_audio_midi')
+    module.__file__ = os.path.join(ROOT, 'midi_to_colab_audio.py')
+
+    exec(compile(src, module.__file__, 'exec'), module.__dict__)
+
+    return module
+
+###################################################################################
+
+@pytest.fixture(scope='session')
+def midi_modules():
+
+    # All the copies of the MIDI.py code in the repo
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import MIDI
+        import TMIDIX
+        import monster_search_and_filter
+
+    return {'MIDI': MIDI,
+            'TMIDIX': TMIDIX,
+            'midi_to_colab_audio': load_colab_midi(),
+            'monster_search_and_filter': monster_search_and_filter
+            }
+
+###################################################################################
+
+@pytest.fixture(scope='session')
+def seeds_data():
+    data = {}
+
+    for seed in SEEDS:
+        with open(seed, 'rb') as f:
+            data[os.path.basename(seed)] = f.read()
+
+    return data
@@ -0,0 +1,72 @@
+import contextlib
+import io
+import random
+import threading
+
+import numpy
+
+
+def make_signatures_data(rng, prefix, keys_range, number_of_signatures):
+
+    return [[prefix+str(i), [[key, rng.randint(1, 50)] for key in sorted(rng.sample(keys_range, rng.randint(3, 12)))]]
+            for i in range(number_of_signatures)]
+
+
+def test_distributed_search_matches_single_process(midi_modules, tmp_path):
+
+    # Shards with disjoint keys, so every target has keys which are not in a worker shard
+
+    msf = midi_modules['monster_search_and_filter']
+
+    rng = random.Random(42)
+
+    signatures_data = make_signatures_data(rng, 'a', range(0, 60), 40) + make_signatures_data(rng, 'b', range(200, 449), 40)
+
+    trg_sigs = [{1: 0.5, 300: 0.5}, {5: 0.2, 7: 0.3, 250: 0.4, 9999: 0.1}, {0: 0.25, 59: 0.25, 200: 0.25, 448: 0.25}]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        msf.save_signatures_store(signatures_data, str(tmp_path), verbose=False)
+
+        signatures_store = msf.load_signatures_store(str(tmp_path), verbose=False)
+
+        shards = [msf.load_signatures_store_shard(signatures_store, i, 2) for i in range(2)]
+
+        sigs_dicts = msf.load_signatures(signatures_data)
+
+    # Workers only read their shard rows, which together are the whole store
+    assert [fn for shard in shards for fn, _ in shard] == [fn for fn, _ in sigs_dicts]
+    assert not set(shards[0][0][1]) & set(shards[1][0][1])
+
+    servers = []
+
+    try:
+        for shard in shards:
+            X, global_union = msf.precompute_signatures(shard)
+
+            server = msf.create_search_worker_server(shard, X, global_union, '127.0.0.1', 0)
+
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+            servers.append(server)
+
+        workers = [server.server_address for server in servers]
+
+        top_dists, top_file_names, failed_workers = msf.distributed_search_top_k(workers, trg_sigs, 10, verbose=False)
+
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    assert failed_workers == []
+
+    X, global_union = msf.precompute_signatures(sigs_dicts)
+
+    ref_dists = msf.to_numpy(msf.get_batched_distances_np(trg_sigs, X, global_union))
+
+    # Rows sharing no keys with a target tie, so the distances are compared by file names
+    for i in range(len(trg_sigs)):
+        ref = dict(zip([fn for fn, _ in sigs_dicts], ref_dists[i].tolist()))
+
+        assert numpy.allclose(top_dists[i], numpy.sort(ref_dists[i])[:10])
+        assert numpy.allclose(top_dists[i], [ref[fn] for fn in top_file_names[i]])
@@ -0,0 +1,65 @@
+import numpy
+
+
+def test_inverted_index_covers_global_union(midi_modules):
+
+    # Key 300 is in global_union but has no values in the signatures
+
+    msf = midi_modules['monster_search_and_filter']
+
+    sigs_dicts = [['a', {1: 0.5, 2: 0.5}], ['b', {1: 1.0, 300: 0.0}]]
+    trg_sig = {300: 1.0, 1: 0.2}
+
+    sX, global_union = msf.precompute_sparse_signatures(sigs_dicts)
+
+    inv_index = msf.precompute_inverted_index(sX, global_union)
+
+    assert inv_index[0].shape[0] == global_union.shape[0]+1
+
+    top_dists, top_idxs = msf.get_inverted_index_top_k(trg_sig, inv_index, global_union, 2)
+
+    dists = msf.get_sparse_distances_np(trg_sig, sX, global_union)
+
+    assert numpy.array_equal(top_idxs, numpy.argsort(dists))
+    assert numpy.allclose(top_dists, numpy.sort(dists))
+
+    X, global_union = msf.precompute_signatures(sigs_dicts)
+
+    for a, b in zip(msf.precompute_inverted_index(X, global_union), inv_index):
+        assert numpy.array_equal(a, b)
+
+
+def test_unknown_target_keys_are_mismatches(midi_modules):
+
+    # Keys 5 (between the global_union keys) and 9999 (past them) are in no signature
+
+    msf = midi_modules['monster_search_and_filter']
+
+    sigs_dicts = [['a', {1: 0.5, 2: 0.5}], ['b', {1: 0.7, 300: 0.3}], ['c', {2: 1.0}]]
+    trg_sig = {1: 0.4, 5: 0.2, 300: 0.2, 9999: 0.2}
+
+    def distance(trg, sig, mismatch_penalty=10, p=3):
+        shared = set(trg) & set(sig)
+        sum_term = sum((max(trg[k], sig[k]) / min(trg[k], sig[k]) - 1) ** p for k in shared)
+        return (sum_term + mismatch_penalty ** p * (len(trg) + len(sig) - 2 * len(shared))) ** (1 / p)
+
+    ref_dists = numpy.array([distance(trg_sig, sig) for _, sig in sigs_dicts])
+
+    X, global_union = msf.precompute_signatures(sigs_dicts, dtype='float64')
+
+    assert numpy.allclose(msf.to_numpy(msf.get_distances_np(trg_sig, X, global_union)), ref_dists)
+    assert numpy.allclose(msf.to_numpy(msf.get_unfused_distances_np(trg_sig, X, global_union)), ref_dists)
+    assert numpy.allclose(msf.to_numpy(msf.get_batched_distances_np([trg_sig], X, global_union))[0], ref_dists)
+
+    top_dists, top_idxs = msf.get_batched_distances_np([trg_sig], X, global_union, top_k=2)
+
+    assert msf.to_numpy(top_idxs)[0].tolist() == numpy.argsort(ref_dists)[:2].tolist()
+
+    sX, global_union = msf.precompute_sparse_signatures(sigs_dicts)
+
+    assert numpy.allclose(msf.to_numpy(msf.get_sparse_distances_np(trg_sig, sX, global_union)), ref_dists, rtol=1e-5)
+
+    top_dists, top_idxs = msf.get_inverted_index_top_k(trg_sig, msf.precompute_inverted_index(sX, global_union), global_union, 3)
+
+    assert msf.to_numpy(top_idxs).tolist() == numpy.argsort(ref_dists).tolist()
+    assert numpy.allclose(msf.to_numpy(top_dists), numpy.sort(ref_dists), rtol=1e-5)
@@ -0,0 +1,99 @@
+import copy
+import hashlib
+
+import pytest
+
+from conftest import SEEDS
+
+# md5 of repr() of to_millisecs(midi2opus()), opus2score(to_millisecs()),
+# score2opus(), opus2midi() and score2midi() outputs for the Seeds MIDIs
+# recorded with the original deepcopy-based conversions
+
+EXPECTED_CONVERSIONS_HASHES = {
+    'Monster-Music-Transformer-MI-Seed-1.mid': ('5e351d7f5e820d1ed151ae01ec903f67', 'b51c0c309819187054a5bf2d16b5789d', '223c7d91d5f5817f0cca385883fa7af9', 'f188c68151cdcaa13eba0aad2ef208ce', 'a7df3ad504533088804a5a27bad25469'),
+    'Monster-Music-Transformer-MI-Seed-2.mid': ('ff1b8c3edeef6dff52d7fc9f0ed1e78c', 'b288782c2bef9c59e97165c300ebdb4a', '0472c63bed0f67d139dc06186c557438', '7d3f1a937681d95b2c015b6157692b30', 'ef638e9619d9b232e379c11ddd2aa976'),
+    'Monster-Music-Transformer-MI-Seed-3.mid': ('029c8d8e3c3b2252a0437c9493dd4c33', 'e96cef0de8bcf65f379ec43af479d6a4', '779882e031b6a6e0f1b286fc622f82fb', '33139f4fc67ac904ffaba6121b3e7722', '456f697bbbabad643e1cce4e07c81c69'),
+    'Monster-Music-Transformer-MI-Seed-4.mid': ('bbf3b1debd98e5d72b5686a4e8d69976', '649f423cdc3dff5add84abd01234258f', '73c46cd8611dd6a33feb4083a70de3fa', 'fa64250bcd28645b9066fdeed6745d8c', '55195773dc437f95318d37a0173e8c2b'),
+    'Monster-Music-Transformer-MI-Seed-5.mid': ('689c6544deb4af2534850d78abb5c111', 'a7f665f4dae49a9933b98539ccd21d29', 'e85907cc17584b628e655187dd171a31', 'ae54ebe80fc2af5271d7ded4fc393e5a', 'a481707c4546c0b376a8320b2b785eab'),
+    'Monster-Music-Transformer-MI-Seed-6.mid': ('d44d2cada57ae8fe5a4a1016770dd838', '33d0d8b04d9206706604bc3e057ffa44', '9c525779f8e520d6fc6eee66c0744004', '846c9261eacd1682697c14a5ee67ffd5', '2d21c30255f231a245f599070cca7875'),
+    'Monster-Music-Transformer-Piano-Seed-1.mid': ('9b9b207d8da8b75de3548aa6e04972a2', '9be51841ce86570a2ee3e67bd76f81b1', 'dd0f5111da08aafd08472c056ae2b896', '420557f43107772c20ebd576085c15dd', '92d005848ede831c9bd257ae5bc9c0a7'),
+    'Monster-Music-Transformer-Piano-Seed-2.mid': ('20653a7e9eb894e936b586d6346b181e', '9df04a4c4fb6751b78fee3a734b51b85', '168a301841dc11943fa3391268adc25f', '21fb3c93df9b2e50f394f54025109bf5', 'f90b6cbbbba87349cfab52dc10bea3b0'),
+    'Monster-Music-Transformer-Piano-Seed-3.mid': ('1857ccafb6c7790d1c84662553d13ce9', '59ef7ccdfa9be0fa328e7154033b803b', '6fb89f08ee359e6c9f410a7b22d096bc', '990590ba11dff4545be81ccd970c6080', 'bde72b2d9f93ec3f0ebeadbb2d30ea06'),
+    'Monster-Music-Transformer-Piano-Seed-4.mid': ('bd2ca6c808a0bebeb62657622287c09d', '0199a63d50dab0d78be21852329c61af', '5c91580efa183a5a4b1460f08d6e1272', '4ce44bae793c5e48eda3b3870e62178d', 'dddab537f19103bb953cd2a978a2b05f'),
+    'Monster-Music-Transformer-Piano-Seed-5.mid': ('88930840f3b137b46d0006315312cb0c', '67e42e1ae84a21a64135b7716150ca74', '7520119363cbe9bb6effefe2c66a0e49', '1b6a303cdce73c88d6efb72600e5647e', '47b18957cd07e590727dc4f339a9a233'),
+    'Monster-Music-Transformer-Piano-Seed-6.mid': ('ec050f57649052d7ca3b0f2e0cf9bd05', '4712f5426c971fab9fac8879e98cdb0d', '6a9d79b7ffaf257492dfb64661dd38e8', '0ba1ba8d11c4fc48a9b83fdddcfc1e9a', '8df4abb9c0a85f9711e4abb3f4fa54d9'),
+}
+
+###################################################################################
+
+def md5_repr(obj):
+    return hashlib.md5(repr(obj).encode()).hexdigest()
+
+def touch_events(tracks_list):
+
+    # Edits every event of an opus or score in place
+
+    for track in tracks_list[1:]:
+        for event in track:
+            event[1] += 1
+
+###################################################################################
+
+def test_seeds_are_present():
+    assert len(SEEDS) == len(EXPECTED_CONVERSIONS_HASHES)
+
+@pytest.mark.parametrize('seed_name', sorted(EXPECTED_CONVERSIONS_HASHES))
+def test_seeds_conversions_outputs(midi_modules, seeds_data, seed_name):
+
+    ms_hash, score_hash, opus_hash, opus_midi_hash, score_midi_hash = EXPECTED_CONVERSIONS_HASHES[seed_name]
+
+    for module in midi_modules.values():
+        ms_opus = module.to_millisecs(module.midi2opus(seeds_data[seed_name]))
+        assert md5_repr(ms_opus) == ms_hash, module.__name__
+
+        score = module.opus2score(ms_opus)
+        assert md5_repr(score) == score_hash, module.__name__
+        assert md5_repr(module.midi2ms_score(seeds_data[seed_name])) == score_hash, module.__name__
+
+        assert md5_repr(module.score2opus(score)) == opus_hash, module.__name__
+
+        if hasattr(module, 'opus2midi'):
+            assert md5_repr(module.opus2midi(module.midi2opus(seeds_data[seed_name]))) == opus_midi_hash, module.__name__
+            assert md5_repr(module.score2midi(score)) == score_midi_hash, module.__name__
+
+@pytest.mark.parametrize('seed_name', sorted(EXPECTED_CONVERSIONS_HASHES))
+def test_conversions_do_not_mutate_inputs(midi_modules, seeds_data, seed_name):
+
+    for module in midi_modules.values():
+
+        opus = module.midi2opus(seeds_data[seed_name])
+        ms_opus = module.to_millisecs(opus)
+        score = module.opus2score(ms_opus)
+
+        conversions = [(module.to_millisecs, opus),
+                       (module.opus2score, ms_opus),
+                       (module.score2opus, score)
+                       ]
+
+        for func, inp in conversions:
+            inp_copy = copy.deepcopy(inp)
+
+            out = func(inp)
+            assert inp == inp_copy, (module.__name__, func.__name__)
+
+            # Outputs share no events with the inputs
+            touch_events(out)
+            assert inp == inp_copy, (module.__name__, func.__name__)
+
+        if hasattr(module, '_encode'):
+            for func, inp in [(module.opus2midi, opus), (module.score2midi, score), (module._encode, opus[1])]:
+                inp_copy = copy.deepcopy(inp)
+
+                func(inp)
+                assert inp == inp_copy, (module.__name__, func.__name__)
+
+def test_benchmark_midi_parsing(midi_modules):
+
+    results = midi_modules['monster_search_and_filter'].benchmark_midi_parsing(SEEDS, number_of_runs=1)
+
+    assert sorted(results) == ['midi2opus', 'opus2score', 'to_millisecs', 'total']
@@ -0,0 +1,90 @@
+import hashlib
+
+import pytest
+
+from conftest import SEEDS
+
+# md5 of repr() of midi2opus and midi2score outputs for the Seeds MIDIs
+# recorded with the original byte-slicing _decode
+
+EXPECTED_SEEDS_HASHES = {
+    'Monster-Music-Transformer-MI-Seed-1.mid': ('a87ace2a95015d1ebdd875fe48c3ce1b', '9063880244d7c9de840c5ff00d5e921d'),
+    'Monster-Music-Transformer-MI-Seed-2.mid': ('fa2f8a8529582d3fa4140a3990ba1c8c', '809782b5e679e11dba043648bb0d4d03'),
+    'Monster-Music-Transformer-MI-Seed-3.mid': ('b69a29161f5cb9e15de09625436d4eaf', '3d5970abfbb58e9015a453fd23190520'),
+    'Monster-Music-Transformer-MI-Seed-4.mid': ('84c7d48e645b03bb53a2efb613c04df7', 'a8438fcd57e4b59af6809d93666c8bfe'),
+    'Monster-Music-Transformer-MI-Seed-5.mid': ('a0dcc144b910d207324a20372590cc8b', '30bb920bb0871fae302c2526b953994c'),
+    'Monster-Music-Transformer-MI-Seed-6.mid': ('ca2949f868b0187168d01f6c0fb268b8', '3fe662befe8b5500a05b85e06d698385'),
+    'Monster-Music-Transformer-Piano-Seed-1.mid': ('11dc354a9b288729119de688a7ccf56f', '20456ebc611c530bcdc5a759573e5d02'),
+    'Monster-Music-Transformer-Piano-Seed-2.mid': ('31fa17958d09db5e0d85ceeb59c35aba', '0f0d2cf2d82e5a1408b926defaac563f'),
+    'Monster-Music-Transformer-Piano-Seed-3.mid': ('19095164e2b5aae3490ae079f206e9df', 'ef7ab270ce7f828c3967e002751ca79d'),
+    'Monster-Music-Transformer-Piano-Seed-4.mid': ('b3991f5c750183825c05193fd2a29bfc', 'e6b9f0bede4a36e2830c4d7ada71d0ae'),
+    'Monster-Music-Transformer-Piano-Seed-5.mid': ('6bf3741a321501430415f9d5c5e7a08b', '41743c3d5f5b6073274071558259b7eb'),
+    'Monster-Music-Transformer-Piano-Seed-6.mid': ('52e4e992224753b94f0aed052ba7bc5d', 'c98e700ec67bdd7112185d403401a536'),
+}
+
+###################################################################################
+
+def md5_repr(obj):
+    return hashlib.md5(repr(obj).encode()).hexdigest()
+
+def track_payloads(midi_data):
+
+    # Raw MTrk chunks payloads of a MIDI file
+
+    payloads = []
+
+    pos = 14
+
+    while pos + 8 <= len(midi_data):
+        length = int.from_bytes(midi_data[pos+4:pos+8], 'big')
+
+        if midi_data[pos:pos+4] == b'MTrk':
+            payloads.append(midi_data[pos+8:pos+8+length])
+
+        pos += 8 + length
+
+    return payloads
+
+def decode_or_error(module, trackdata):
+    try:
+        return module._decode(trackdata)
+
+    except Exception as e:
+        return type(e).__name__
+
+###################################################################################
+
+def test_seeds_are_present():
+    assert len(SEEDS) == len(EXPECTED_SEEDS_HASHES)
+
+@pytest.mark.parametrize('seed_name', sorted(EXPECTED_SEEDS_HASHES))
+def test_seeds_decode_to_expected_outputs(midi_modules, seeds_data, seed_name):
+
+    opus_hash, score_hash = EXPECTED_SEEDS_HASHES[seed_name]
+
+    for module in midi_modules.values():
+        assert md5_repr(module.midi2opus(seeds_data[seed_name])) == opus_hash, module.__name__
+        assert md5_repr(module.midi2score(seeds_data[seed_name])) == score_hash, module.__name__
+
+@pytest.mark.parametrize('seed_name', sorted(EXPECTED_SEEDS_HASHES))
+def test_decode_copies_agree_on_tracks(midi_modules, seeds_data, seed_name):
+
+    modules = list(midi_modules.values())
+
+    payloads = track_payloads(seeds_data[seed_name])
+
+    assert payloads
+
+    for trackdata in payloads:
+
+        # Whole, truncated and corrupted track payloads
+        variants = [trackdata, bytearray(trackdata)]
+        variants += [trackdata[:cut] for cut in range(0, min(len(trackdata), 64))]
+        variants += [trackdata[:cut] for cut in range(64, len(trackdata), max(1, len(trackdata) // 32))]
+        variants += [trackdata[:len(trackdata) // 2] + b'\xff' * 4, b'\x00\x90' + trackdata[4:]]
+
+        for variant in variants:
+            expected = decode_or_error(modules[0], variant)
+
+            for module in modules[1:]:
+                assert decode_or_error(module, variant) == expected, module.__name__
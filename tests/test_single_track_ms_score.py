@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+from conftest import SEEDS
+
+CHANNELS_EVENTS = ['patch_change', 'control_change', 'channel_after_touch', 'key_after_touch', 'pitch_wheel_change']
+
+###################################################################################
+
+def reference_single_track_ms_score(module, midi_data):
+
+    # Original index()-based channels recalculation of midi2single_track_ms_score
+    # run over a copy of the events list, so that no event is skipped
+
+    score = module.midi2score(midi_data)
+
+    events_matrix1 = []
+    events_matrixes_channels = []
+
+    for itrack in range(1, len(score)):
+        for event in score[itrack]:
+            if event[0] == 'note' and event[3] != 9:
+                event[3] = (16 * (itrack-1)) + event[3]
+                if event[3] not in events_matrixes_channels:
+                    events_matrixes_channels.append(event[3])
+
+            events_matrix1.append(event)
+
+    for e in list(events_matrix1):
+        if e[0] == 'note' and e[3] != 9:
+            if e[3] in events_matrixes_channels[:15]:
+                if events_matrixes_channels[:15].index(e[3]) < 9:
+                    e[3] = events_matrixes_channels[:15].index(e[3])
+                else:
+                    e[3] = events_matrixes_channels[:15].index(e[3])+1
+            else:
+                events_matrix1.remove(e)
+
+        if e[0] in CHANNELS_EVENTS and e[2] != 9:
+            if e[2] in [c % 16 for c in events_matrixes_channels[:15]]:
+                if [c % 16 for c in events_matrixes_channels[:15]].index(e[2]) < 9:
+                    e[2] = [c % 16 for c in events_matrixes_channels[:15]].index(e[2])
+                else:
+                    e[2] = [c % 16 for c in events_matrixes_channels[:15]].index(e[2])+1
+            else:
+                events_matrix1.remove(e)
+
+    opus = module.score2opus([score[0], events_matrix1])
+
+    return module.opus2score(module.to_millisecs(opus))
+
+###################################################################################
+
+def make_multi_track_midi(midi_module, number_of_tracks=24, number_of_notes_per_track=200, seed=0):
+
+    # Multi-track MIDI with more than 16 instruments, drums and all the channel events
+
+    rnd = random.Random(seed)
+
+    score = [480, [['set_tempo', 0, 500000]]]
+
+    for itrack in range(number_of_tracks):
+
+        channels = rnd.sample(range(16), 2)
+        track = []
+
+        for channel in channels:
+            track.append(['patch_change', 0, channel, rnd.randint(0, 127)])
+
+        for i in range(number_of_notes_per_track):
+            time = i * 120 + rnd.randint(0, 60)
+            channel = rnd.choice(channels)
+
+            track.append(['note', time, rnd.randint(30, 480), channel, rnd.randint(24, 100), rnd.randint(40, 127)])
+
+            if i % 10 == 0:
+                track.append(['control_change', time, channel, 7, rnd.randint(0, 127)])
+                track.append(['pitch_wheel_change', time, channel, rnd.randint(-8192, 8191)])
+                track.append(['channel_after_touch', time, channel, rnd.randint(0, 127)])
+                track.append(['key_after_touch', time, channel, rnd.randint(24, 100), rnd.randint(0, 127)])
+
+        score.append(sorted(track, key=lambda e: e[1]))
+
+    return midi_module.score2midi(score)
+
+###################################################################################
+
+@pytest.fixture(scope='module')
+def multi_track_midis(midi_modules):
+    return [make_multi_track_midi(midi_modules['MIDI'], number_of_tracks=n, seed=n) for n in [1, 3, 8, 17, 24, 40]]
+
+@pytest.mark.parametrize('module_name', ['TMIDIX', 'monster_search_and_filter'])
+def test_recalculate_channels_seeds(midi_modules, seeds_data, module_name):
+
+    module = midi_modules[module_name]
+
+    for midi_data in seeds_data.values():
+        assert module.midi2single_track_ms_score(midi_data, recalculate_channels=True) == \
+               reference_single_track_ms_score(module, midi_data)
+
+@pytest.mark.parametrize('module_name', ['TMIDIX', 'monster_search_and_filter'])
+def test_recalculate_channels_multi_track(midi_modules, multi_track_midis, module_name):
+
+    module = midi_modules[module_name]
+
+    for midi_data in multi_track_midis:
+
+        ms_score = module.midi2single_track_ms_score(midi_data, recalculate_channels=True)
+
+        assert ms_score == reference_single_track_ms_score(module, midi_data)
+
+        # Kept events all end up on the 16 MIDI channels
+        for e in ms_score[1]:
+            if e[0] == 'note':
+                assert 0 <= e[3] < 16
+
+            elif e[0] in CHANNELS_EVENTS:
+                assert 0 <= e[2] < 16
+
+def test_benchmark_single_track_ms_score(midi_modules):
+
+    midi_data = make_multi_track_midi(midi_modules['MIDI'], number_of_tracks=40, number_of_notes_per_track=500)
+
+    results = midi_modules['monster_search_and_filter'].benchmark_single_track_ms_score([midi_data], number_of_runs=1)
+
+    assert len(results) == 1
+    assert results[0]['tracks'] == 41